@@ -0,0 +1,221 @@
+"""命令行批处理（不依赖Kivy）
+
+用法:
+    python batch.py recipe.json photos/ -o edited --jobs 4 --report report.json
+    python batch.py recipe.json "photos/**/*.jpg" -o edited
+
+配方（recipe）是一个JSON文件，按顺序列出编辑步骤，可用的操作见
+image_ops.OPERATIONS:
+    {
+        "steps": [
+            {"op": "resize", "width": 1600},
+            {"op": "brightness", "factor": 1.1},
+            {"op": "blur", "kind": "Gaussian", "radius": 2},
+            {"op": "cartoon"}
+        ],
+        "format": "png"
+    }
+配方也可以直接是步骤列表。输出文件比输入文件和配方都新时跳过，除非指定 --force。
+输出文件保持输入相对于目录参数或通配符根目录（第一个含通配符的部分之前的
+目录）的相对路径，例如 photos/2023/a.jpg 写到 edited/2023/a.jpg。
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from PIL import Image as PILImage
+
+import image_ops
+from document import ImageDocument
+from image_files import IMAGE_EXTENSIONS
+
+
+def load_recipe(path):
+    """读取配方，返回 (步骤列表, 输出格式扩展名或None)"""
+    with open(path, encoding='utf-8') as f:
+        recipe = json.load(f)
+    if isinstance(recipe, list):
+        recipe = {'steps': recipe}
+    steps = recipe.get('steps', [])
+    for step in steps:
+        if step.get('op') not in image_ops.OPERATIONS:
+            raise ValueError(f"Unknown operation in recipe: {step.get('op')}")
+    fmt = recipe.get('format')
+    return steps, fmt.lower().lstrip('.') if fmt else None
+
+
+def glob_root(pattern):
+    """通配符模式中第一个含通配符的部分之前的目录"""
+    root = os.path.dirname(pattern)
+    while glob.has_magic(root):
+        root = os.path.dirname(root)
+    return root
+
+
+def collect_inputs(patterns):
+    """把目录和通配符展开成 (图片文件, 相对路径) 列表，相对路径用于生成输出路径"""
+    inputs = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            root = pattern
+            paths = [entry.path for entry in os.scandir(pattern) if entry.is_file()]
+        else:
+            root = glob_root(pattern)
+            paths = glob.glob(pattern, recursive=True)
+        for path in sorted(path for path in paths if path.lower().endswith(IMAGE_EXTENSIONS)):
+            # 多个模式匹配到同一个文件时只处理一次
+            key = os.path.abspath(path)
+            if key not in seen:
+                seen.add(key)
+                inputs.append((path, os.path.relpath(path, root or os.curdir)))
+    return inputs
+
+
+def output_path_for(relative_path, output_dir, fmt):
+    if fmt:
+        relative_path = os.path.splitext(relative_path)[0] + '.' + fmt
+    return os.path.join(output_dir, relative_path)
+
+
+def plan_outputs(inputs, output_dir, fmt):
+    """为每个输入生成输出路径，两个输入会写到同一个输出文件时抛出 ValueError"""
+    plan = []
+    sources = {}
+    for input_path, relative_path in inputs:
+        output_path = output_path_for(relative_path, output_dir, fmt)
+        key = os.path.normcase(os.path.abspath(output_path))
+        if key in sources:
+            raise ValueError(f"{sources[key]} and {input_path} would both be written to {output_path}")
+        sources[key] = input_path
+        plan.append((input_path, output_path))
+    return plan
+
+
+def is_up_to_date(input_path, output_path, recipe_mtime):
+    """输出文件存在且比输入文件和配方都新"""
+    try:
+        output_mtime = os.path.getmtime(output_path)
+    except OSError:
+        return False
+    return output_mtime >= max(os.path.getmtime(input_path), recipe_mtime)
+
+
+def process_file(input_path, output_path, steps):
+    """在工作进程中处理一个文件，返回该文件的计时报告"""
+    report = {'input': input_path, 'output': output_path, 'steps': []}
+    start = time.perf_counter()
+    try:
+        t = time.perf_counter()
+        image = PILImage.open(input_path)
+        image.load()
+        # 步骤之间传递文档，连续的OpenCV操作不需要来回转换
+        image = ImageDocument.from_pil(image)
+        report['load_seconds'] = time.perf_counter() - t
+
+        # 连续的点运算合成为一组，一次遍历像素，报告中记为 "brightness+contrast"
+        for group in image_ops.group_steps(steps):
+            t = time.perf_counter()
+            image = image_ops.run_group(image, group)
+            report['steps'].append({'op': '+'.join(step['op'] for step in group),
+                                    'seconds': time.perf_counter() - t})
+
+        t = time.perf_counter()
+        image = image.to_pil()
+        if output_path.lower().endswith(('.jpg', '.jpeg')) and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(output_path)
+        report['save_seconds'] = time.perf_counter() - t
+        report['status'] = 'ok'
+    except Exception as e:
+        report['status'] = 'error'
+        report['error'] = str(e)
+    report['seconds'] = time.perf_counter() - start
+    return report
+
+
+def _init_worker():
+    # 进程之间已经并行，每个进程内的OpenCV只用一个线程，避免线程过多
+    import cv2
+    cv2.setNumThreads(1)
+
+
+def run_batch(plan, steps, jobs=None, force=False, recipe_mtime=0.0):
+    """用进程池处理 plan 中的所有 (输入, 输出) 文件，同时在途的任务数不超过 jobs 的两倍"""
+    jobs = jobs or os.cpu_count() or 1
+    max_in_flight = jobs * 2
+    reports = []
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+        pending = set()
+        for input_path, output_path in plan:
+            if not force and is_up_to_date(input_path, output_path, recipe_mtime):
+                reports.append({'input': input_path, 'output': output_path,
+                                'status': 'skipped', 'seconds': 0.0, 'steps': []})
+                continue
+            os.makedirs(os.path.dirname(output_path) or os.curdir, exist_ok=True)
+
+            # 在途任务已满时先等待完成一个，避免一次性提交成千上万个任务
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                reports.extend(future.result() for future in done)
+            pending.add(pool.submit(process_file, input_path, output_path, steps))
+
+        done, _ = wait(pending)
+        reports.extend(future.result() for future in done)
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Apply an edit recipe to many images.')
+    parser.add_argument('recipe', help='JSON edit recipe')
+    parser.add_argument('inputs', nargs='+', help='input directories or glob patterns')
+    parser.add_argument('-o', '--output', required=True, help='output directory')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: CPU count)')
+    parser.add_argument('--force', action='store_true',
+                        help='process files even if the output is up to date')
+    parser.add_argument('--report', help='write a per-file timing report (JSON) to this path')
+    args = parser.parse_args(argv)
+
+    try:
+        steps, fmt = load_recipe(args.recipe)
+    except (OSError, ValueError) as e:
+        print(f"Error loading recipe: {e}")
+        return 1
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        print('No input images found')
+        return 1
+    try:
+        plan = plan_outputs(inputs, args.output, fmt)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+
+    start = time.perf_counter()
+    reports = run_batch(plan, steps, jobs=args.jobs,
+                        force=args.force, recipe_mtime=os.path.getmtime(args.recipe))
+    total = time.perf_counter() - start
+
+    counts = {}
+    for report in reports:
+        counts[report['status']] = counts.get(report['status'], 0) + 1
+        if report['status'] == 'error':
+            print(f"Error processing {report['input']}: {report['error']}")
+    print(f"Processed {len(reports)} files in {total:.2f}s: "
+          + ', '.join(f'{count} {status}' for status, count in sorted(counts.items())))
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'recipe': args.recipe, 'jobs': args.jobs or os.cpu_count(),
+                       'total_seconds': total, 'files': reports}, f, indent=2)
+    return 1 if counts.get('error') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
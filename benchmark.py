@@ -0,0 +1,365 @@
+"""编辑操作的性能基准测试（不依赖Kivy）
+
+用法:
+    python benchmark.py run -o baseline.json
+    python benchmark.py run --sizes 0.3MP 2MP --modes RGB --ops blur_gaussian cartoon -o after.json
+    python benchmark.py compare baseline.json after.json --threshold 0.1
+    python benchmark.py startup -o startup.json
+    python benchmark.py accuracy
+
+run 在每种尺寸和模式的合成图像上对每个操作计时（先预热一次，再重复
+--repeat 次，记录最小值和中位数），结果写成JSON。测试图像由固定的种子
+生成，每次运行完全相同。compare 比较两次运行的中位数，变慢超过阈值的
+记为回归，有回归时返回1。startup 在新的解释器中分别导入编辑器和各个无界面
+工具的模块，测量冷启动的导入耗时，报告也可以用 compare 比较。accuracy
+检查大半径高斯模糊的盒式近似与精确结果的差值不超过
+blur_ops.GAUSSIAN_MAX_ERROR，超过时返回1。
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import PIL
+from PIL import Image as PILImage
+
+import blur_ops
+import image_ops
+from document import ImageDocument
+from export import export_image
+from geometry import Geometry
+
+# 测试图像的尺寸（约 0.3、2、12、24、50 百万像素）
+SIZES = {
+    '0.3MP': (640, 480),
+    '2MP': (1632, 1224),
+    '12MP': (4000, 3000),
+    '24MP': (6000, 4000),
+    '50MP': (8660, 5773),
+}
+
+MODES = ('RGB', 'RGBA', 'L')
+
+
+def make_image(size, mode, seed=0):
+    """生成可复现的测试图像：平滑的渐变加上噪点，接近照片的压缩难度"""
+    width, height = size
+    rng = np.random.default_rng(seed)
+    xs = np.linspace(0, 255, width, dtype=np.float32)
+    ys = np.linspace(0, 255, height, dtype=np.float32)
+    pixels = np.empty((height, width, 4), dtype=np.uint8)
+    for channel, (fx, fy) in enumerate(((1.0, 0.0), (0.0, 1.0), (0.5, 0.5), (0.2, 0.8))):
+        gradient = fx * xs[None, :] + fy * ys[:, None]
+        noise = rng.integers(-12, 13, (height, width), dtype=np.int16)
+        pixels[:, :, channel] = np.clip(gradient + noise, 0, 255)
+    image = PILImage.fromarray(pixels, 'RGBA')
+    return image if mode == 'RGBA' else image.convert(mode)
+
+
+def _save(image, fmt, options=None):
+    fd, path = tempfile.mkstemp(suffix='.' + fmt.lower())
+    os.close(fd)
+    try:
+        export_image(image, path, fmt, options)
+    finally:
+        os.remove(path)
+
+
+def _load(encoded):
+    image = PILImage.open(encoded)
+    image.load()
+    return image
+
+
+def _encode(image, fmt):
+    """预先编码好的文件，供加载测试使用"""
+    fd, path = tempfile.mkstemp(suffix='.' + fmt.lower())
+    os.close(fd)
+    export_image(image, path, fmt)
+    return path
+
+
+# point_chain 使用的配方步骤
+POINT_CHAIN = [
+    {'op': 'brightness', 'factor': 1.1},
+    {'op': 'contrast', 'factor': 1.2},
+    {'op': 'color', 'red': 1.05, 'green': 1.0, 'blue': 0.95},
+    {'op': 'invert'},
+]
+
+# 操作名称 -> 基准测试函数
+BENCHMARKS = {
+    'rotate': lambda image: image_ops.rotate(image),
+    'flip_horizontal': lambda image: image_ops.flip_horizontal(image),
+    'flip_vertical': lambda image: image_ops.flip_vertical(image),
+    'grayscale': lambda image: image_ops.grayscale(image),
+    'brightness': lambda image: image_ops.brightness(image, 1.2),
+    'contrast': lambda image: image_ops.contrast(image, 1.2),
+    'color': lambda image: image_ops.color(image, 1.1, 0.9, 1.0),
+    'saturation': lambda image: image_ops.saturation(image, 1.3),
+    'sharpness': lambda image: image_ops.sharpness(image, 1.5),
+    'filter_stack': lambda image: image_ops.apply_filters(image, ['blur', 'sharpen', 'edge', 'emboss']),
+    'sepia': lambda image: image_ops.sepia(image),
+    'invert': lambda image: image_ops.invert(image),
+    # 连续四个点运算：合成为一张查找表，只遍历一次像素
+    'point_chain': lambda image: image_ops.run_steps(image, POINT_CHAIN),
+    'cartoon': lambda image: image_ops.cartoon(image),
+    'cartoon_fast': lambda image: image_ops.cartoon(image, 'fast'),
+    'sketch': lambda image: image_ops.sketch(image),
+    'edge': lambda image: image_ops.edge(image),
+    'denoise': lambda image: image_ops.denoise(image),
+    'vignette': lambda image: image_ops.vignette(image, 0.8),
+    'blur_gaussian': lambda image: image_ops.blur(image, 'Gaussian', 5),
+    'blur_box': lambda image: image_ops.blur(image, 'Box', 5),
+    'blur_median': lambda image: image_ops.blur(image, 'Median', 5),
+    # 大半径：高斯模糊走盒式模糊近似，中值模糊走直方图算法
+    'blur_gaussian_large': lambda image: image_ops.blur(image, 'Gaussian', 20),
+    'blur_median_large': lambda image: image_ops.blur(image, 'Median', 20),
+    'noise_gaussian': lambda image: image_ops.noise(image, 'Gaussian', 0.1, seed=1),
+    'noise_salt_pepper': lambda image: image_ops.noise(image, 'Salt & Pepper', 0.1, seed=1),
+    'noise_speckle': lambda image: image_ops.noise(image, 'Speckle', 0.1, seed=1),
+    'crop': lambda image: image_ops.crop(image, image.width // 4, image.height // 4,
+                                         image.width * 3 // 4, image.height * 3 // 4),
+    'resize': lambda image: image_ops.resize(image, width=image.width // 2),
+    # 裁剪、旋转、缩小、翻转：逐步执行（每步一份图像）与合成为一个变换一次执行
+    'geometry_steps': lambda image: image_ops.flip_horizontal(image_ops.resize(image_ops.rotate(
+        image_ops.crop(image, 8, 8, image.width - 8, image.height - 8)), width=image.height // 2)),
+    'geometry_composed': lambda image: Geometry(image.size).crop(
+        8, 8, image.width - 8, image.height - 8).rotate(90).resize(
+        image.height // 2, (image.width - 16) * (image.height // 2) // (image.height - 16)
+    ).flip_horizontal().render(image),
+    # PIL图像和像素数组之间的转换（取代原来的 pil_to_cv2 / cv2_to_pil）
+    'to_document': lambda image: ImageDocument.from_pil(image).pixels,
+    'document_to_pil': lambda pixels: ImageDocument(pixels, 'BGR').to_pil().load(),
+    'swap_rgb_bgr': lambda document: document.pixels_in('BGR'),
+    # 显示：上传纹理前取出像素数据
+    'display_bytes': lambda document: document.pixels.tobytes(),
+    'save_png': lambda image: _save(image, 'PNG'),
+    'save_jpeg': lambda image: _save(image, 'JPEG'),
+    'save_tiff': lambda image: _save(image, 'TIFF'),
+    'load_png': _load,
+    'load_jpeg': _load,
+}
+
+# 需要在计时之外准备输入的操作
+SETUPS = {
+    # 每次计时都新建文档，避免 to_pil() 的缓存
+    'document_to_pil': lambda image: ImageDocument.from_pil(image).pixels_in('BGR'),
+    'swap_rgb_bgr': lambda image: ImageDocument(np.array(image.convert('RGB')), 'RGB'),
+    'display_bytes': lambda image: ImageDocument(np.array(image), image.mode),
+    'load_png': lambda image: _encode(image, 'PNG'),
+    'load_jpeg': lambda image: _encode(image, 'JPEG'),
+}
+
+
+def time_operation(func, arg, repeat):
+    """预热一次后重复计时，返回每次的秒数"""
+    func(arg)
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def run_benchmarks(sizes, modes, ops, repeat=3, progress=print):
+    results = []
+    for size_name in sizes:
+        for mode in modes:
+            image = make_image(SIZES[size_name], mode)
+            megapixels = image.width * image.height / 1e6
+            for op in ops:
+                entry = {'op': op, 'size': size_name, 'mode': mode, 'megapixels': megapixels}
+                arg = None
+                try:
+                    arg = SETUPS[op](image) if op in SETUPS else image
+                    runs = time_operation(BENCHMARKS[op], arg, repeat)
+                    entry.update(runs=runs, min=min(runs), median=statistics.median(runs),
+                                 megapixels_per_second=megapixels / statistics.median(runs))
+                    progress(f"{op:20s} {size_name:6s} {mode:5s} {entry['median'] * 1000:10.2f} ms")
+                except Exception as e:
+                    entry['error'] = str(e)
+                    progress(f"{op:20s} {size_name:6s} {mode:5s} error: {e}")
+                finally:
+                    if isinstance(arg, str):
+                        os.remove(arg)
+                results.append(entry)
+    return results
+
+
+# 启动测试导入的模块：编辑器和各个无界面工具
+STARTUP_MODULES = ('image_editor', 'image_ops', 'batch', 'catalog', 'export')
+
+_IMPORT_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start, 'cv2' in sys.modules, 'numpy' in sys.modules)
+"""
+
+
+def time_startup(module, repeat):
+    """在新的解释器中导入模块，返回 (导入秒数列表, 是否导入了cv2, 是否导入了NumPy)"""
+    env = dict(os.environ, KIVY_NO_ARGS='1', KIVY_NO_CONSOLELOG='1')
+    here = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for _ in range(repeat + 1):  # 第一次只用来预热磁盘缓存
+        output = subprocess.run([sys.executable, '-c', _IMPORT_SCRIPT.format(module=module)],
+                                cwd=here, env=env, capture_output=True, text=True, check=True)
+        seconds, has_cv2, has_numpy = output.stdout.split()[-3:]
+        runs.append(float(seconds))
+    return runs[1:], has_cv2 == 'True', has_numpy == 'True'
+
+
+def run_startup(modules, repeat=5, progress=print):
+    """冷启动：每个模块在新进程中的导入耗时，结果格式与 run_benchmarks 相同"""
+    results = []
+    for module in modules:
+        entry = {'op': f'import {module}', 'size': '-', 'mode': '-'}
+        try:
+            runs, has_cv2, has_numpy = time_startup(module, repeat)
+            entry.update(runs=runs, min=min(runs), median=statistics.median(runs),
+                         cv2=has_cv2, numpy=has_numpy)
+            loaded = ', '.join(name for name, flag in (('cv2', has_cv2), ('numpy', has_numpy)) if flag)
+            progress(f"{entry['op']:20s} {entry['median'] * 1000:10.2f} ms"
+                     + (f'  (loads {loaded})' if loaded else ''))
+        except Exception as e:
+            entry['error'] = str(e)
+            progress(f"{entry['op']:20s} error: {e}")
+        results.append(entry)
+    return results
+
+
+def block_image(block, size=(512, 512), seed=0):
+    """随机黑白色块组成的灰度图像：边缘最多，盒式近似的误差最大"""
+    width, height = size
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 2, (height // block + 1, width // block + 1), dtype=np.uint8) * 255
+    return np.ascontiguousarray(np.repeat(np.repeat(blocks, block, 0), block, 1)[:height, :width])
+
+
+def check_blur_accuracy(sigmas, blocks=(8, 16, 24, 32), progress=print):
+    """每个 sigma 的高斯模糊（按 blur_ops 选择的实现）与 cv2.GaussianBlur 的最大差值
+
+    测试图像为各种大小的随机黑白色块，以及使该 sigma 的误差达到上限的图像。
+    返回 (sigma, 实现, 最大差值) 列表。
+    """
+    images = [block_image(block) for block in blocks]
+    results = []
+    for sigma in sigmas:
+        plan = blur_ops.gaussian(sigma)
+        widths = blur_ops.gaussian_box_widths(sigma) if sigma >= blur_ops.GAUSSIAN_BOX_MIN_SIGMA else None
+        cases = images + ([blur_ops.worst_case_image(sigma, widths)] if widths else [])
+        error = max(int(np.abs(plan.func(image).astype(np.int16)
+                               - cv2.GaussianBlur(image, (0, 0), sigma)).max()) for image in cases)
+        progress(f'sigma {sigma:5.2f} {plan.method:8s} max error {error}')
+        results.append((sigma, plan.method, error))
+    return results
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'pillow': PIL.__version__,
+    }
+
+
+def compare(baseline, current, threshold=0.1):
+    """比较两次运行，返回 (行列表, 回归数)；行为 (键, 基准中位数, 当前中位数, 比值, 标记)"""
+    def index(report):
+        return {(r['op'], r['size'], r['mode']): r for r in report['results'] if 'median' in r}
+
+    base, new = index(baseline), index(current)
+    rows = []
+    regressions = 0
+    for key in sorted(base.keys() & new.keys()):
+        ratio = new[key]['median'] / base[key]['median']
+        if ratio > 1 + threshold:
+            flag = 'REGRESSION'
+            regressions += 1
+        elif ratio < 1 - threshold:
+            flag = 'faster'
+        else:
+            flag = ''
+        rows.append((key, base[key]['median'], new[key]['median'], ratio, flag))
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the image editing operations.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='time the operations and write a JSON report')
+    run_parser.add_argument('-o', '--output', required=True, help='JSON report path')
+    run_parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=list(SIZES))
+    run_parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    run_parser.add_argument('--ops', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    run_parser.add_argument('--repeat', type=int, default=3, help='timed runs per case (default: 3)')
+
+    startup_parser = commands.add_parser('startup', help='time cold imports in fresh interpreters')
+    startup_parser.add_argument('-o', '--output', help='JSON report path')
+    startup_parser.add_argument('--modules', nargs='+', default=list(STARTUP_MODULES))
+    startup_parser.add_argument('--repeat', type=int, default=5, help='timed runs per module (default: 5)')
+
+    accuracy_parser = commands.add_parser(
+        'accuracy', help='check the box approximation of large Gaussian blurs against the exact one')
+    accuracy_parser.add_argument('--min-sigma', type=float, default=4.0)
+    accuracy_parser.add_argument('--max-sigma', type=float, default=20.0)
+    accuracy_parser.add_argument('--step', type=float, default=0.1)
+
+    compare_parser = commands.add_parser('compare', help='compare two JSON reports')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='relative slowdown flagged as a regression (default: 0.1)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        results = run_benchmarks(args.sizes, args.modes, args.ops, args.repeat)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'environment': environment(), 'repeat': args.repeat,
+                       'results': results}, f, indent=2)
+        return 1 if any('error' in r for r in results) else 0
+
+    if args.command == 'startup':
+        results = run_startup(args.modules, args.repeat)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({'environment': environment(), 'repeat': args.repeat,
+                           'results': results}, f, indent=2)
+        return 1 if any('error' in r for r in results) else 0
+
+    if args.command == 'accuracy':
+        sigmas = np.round(np.arange(args.min_sigma, args.max_sigma + args.step / 2, args.step), 4)
+        results = check_blur_accuracy([float(sigma) for sigma in sigmas])
+        worst = max(results, key=lambda result: result[2])
+        print(f'{len(results)} sigmas checked, worst error {worst[2]} at sigma {worst[0]:.2f} '
+              f'({worst[1]}), limit {blur_ops.GAUSSIAN_MAX_ERROR}')
+        return 1 if worst[2] > blur_ops.GAUSSIAN_MAX_ERROR else 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)
+    rows, regressions = compare(baseline, current, args.threshold)
+    for (op, size, mode), base, new, ratio, flag in rows:
+        print(f'{op:20s} {size:6s} {mode:5s} {base * 1000:10.2f} ms -> {new * 1000:10.2f} ms '
+              f'{ratio:6.2f}x {flag}')
+    print(f'{len(rows)} cases compared, {regressions} regressions')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""模糊引擎：根据半径自动选择实现，大半径时每个像素的计算量与半径无关
+
+- 盒式模糊：cv2.blur 用滑动求和实现，每个像素的计算量本来就与核大小无关。
+- 高斯模糊：sigma 较小时用精确的 cv2.GaussianBlur；sigma 不小于
+  GAUSSIAN_BOX_MIN_SIGMA 时用多次盒式模糊近似（各次宽度在 Kovesi 方法得到
+  的宽度附近选择），次数取误差上限不超过 GAUSSIAN_MAX_ERROR 的最少次数，
+  多数 sigma 用4次；没有满足的次数时仍用精确高斯。精确高斯的耗时随 sigma
+  线性增长，近似的耗时基本不变。
+- 中值模糊：OpenCV 对8位图像、ksize 不小于7时使用基于直方图的常数时间
+  算法（Perreault-Hébert），这里直接使用。
+
+近似的误差上限见 GAUSSIAN_MAX_ERROR 和 error_bound()，
+python benchmark.py accuracy 检查 sigma 从4到20时实际的误差。
+"""
+import functools
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# sigma 不小于这个值时高斯模糊用多次盒式模糊近似
+GAUSSIAN_BOX_MIN_SIGMA = 4.0
+
+# 盒式模糊近似的次数范围
+GAUSSIAN_BOX_MIN_PASSES = 3
+GAUSSIAN_BOX_MAX_PASSES = 6
+
+# 近似结果与 cv2.GaussianBlur 在任意8位图像上的最大差值（灰度级）。
+# 这是由核推导的上限（见 error_bound()），不是某类图像上的测量值；在8到
+# 32像素的随机黑白色块这类边缘最多的图像上测得最大差值为6，平滑的渐变加
+# 噪点图像上为1
+GAUSSIAN_MAX_ERROR = 8
+
+# 舍入误差：每次8位盒式模糊的结果舍入一次（不超过0.5级，之后的平均不会
+# 放大它），精确高斯的定点运算按1级计算
+_BOX_ROUNDING = 0.5
+_GAUSSIAN_ROUNDING = 1.0
+
+# method 为实际使用的实现，halo 为分块处理时需要的边缘宽度，
+# func(pixels) 返回模糊后的数组
+BlurPlan = namedtuple('BlurPlan', ['method', 'halo', 'func'])
+
+
+def gaussian_ksize(sigma):
+    """OpenCV对8位图像由 sigma 推算的高斯核大小"""
+    return int(round(sigma * 3 * 2 + 1)) | 1
+
+
+def box_widths(sigma, passes=GAUSSIAN_BOX_MIN_PASSES):
+    """方差之和等于 sigma**2 的 passes 个奇数盒式核宽度"""
+    ideal = np.sqrt(12 * sigma * sigma / passes + 1)
+    lower = int(ideal)
+    if lower % 2 == 0:
+        lower -= 1
+    upper = lower + 2
+    # 前 count 次用较窄的核，其余用较宽的核
+    count = round((12 * sigma * sigma - passes * lower * lower - 4 * passes * lower - 3 * passes)
+                  / (-4 * lower - 4))
+    count = min(max(count, 0), passes)
+    return [lower] * count + [upper] * (passes - count)
+
+
+def _box_passes(pixels, widths):
+    for width in widths:
+        pixels = cv2.blur(pixels, (width, width))
+    return pixels
+
+
+def _box_kernel(widths):
+    """多次宽度为 widths 的盒式模糊合成的一维核"""
+    kernel = np.ones(1)
+    for width in widths:
+        kernel = np.convolve(kernel, np.full(width, 1.0 / width))
+    return kernel
+
+
+def _kernel_difference(sigma, widths):
+    """多次盒式模糊与 cv2.GaussianBlur(sigma) 的二维核之差（都可分离）"""
+    box = _box_kernel(widths)
+    gauss = cv2.getGaussianKernel(gaussian_ksize(sigma), sigma)[:, 0]
+    size = max(len(box), len(gauss))
+    box = np.pad(box, (size - len(box)) // 2)
+    gauss = np.pad(gauss, (size - len(gauss)) // 2)
+    return np.outer(box, box) - np.outer(gauss, gauss)
+
+
+def error_bound(sigma, widths):
+    """widths 的多次盒式模糊与 cv2.GaussianBlur(sigma) 在任意8位图像上的最大差值的上限
+
+    两个核之差的正部之和乘以255是两次卷积结果之差的上确界（worst_case_image()
+    恰好达到这个值），再加上舍入误差。
+    """
+    difference = _kernel_difference(sigma, widths)
+    return (255 * float(difference[difference > 0].sum())
+            + _BOX_ROUNDING * len(widths) + _GAUSSIAN_ROUNDING)
+
+
+def worst_case_image(sigma, widths):
+    """使近似误差在中心像素达到上限的8位灰度图像（用于检查误差）
+
+    核之差为正的位置为255、其余为0，四周留出与核同宽的空白。
+    """
+    difference = _kernel_difference(sigma, widths)
+    size = difference.shape[0]
+    image = np.zeros((size * 3, size * 3), dtype=np.uint8)
+    # 卷积时核是翻转的，图像中的图案也要翻转
+    image[size:size * 2, size:size * 2] = np.where(difference[::-1, ::-1] > 0, 255, 0)
+    return image
+
+
+@functools.lru_cache(maxsize=256)
+def gaussian_box_widths(sigma):
+    """误差上限不超过 GAUSSIAN_MAX_ERROR 的次数最少的盒式核宽度，没有时返回 None
+
+    每个次数在 Kovesi 宽度附近的候选中（较窄的宽度 w，部分换成 w+2，w 本身
+    也可以上下移一档）选择误差上限最小的一组。
+    """
+    for passes in range(GAUSSIAN_BOX_MIN_PASSES, GAUSSIAN_BOX_MAX_PASSES + 1):
+        lower = min(box_widths(sigma, passes))
+        candidates = [[width] * (passes - count) + [width + 2] * count
+                      for width in (lower - 2, lower, lower + 2) if width >= 1
+                      for count in range(passes + 1)]
+        bounds = [error_bound(sigma, widths) for widths in candidates]
+        best = min(range(len(candidates)), key=bounds.__getitem__)
+        if bounds[best] <= GAUSSIAN_MAX_ERROR:
+            return tuple(candidates[best])
+    return None
+
+
+def gaussian(sigma):
+    """高斯模糊的执行计划"""
+    widths = gaussian_box_widths(float(sigma)) if sigma >= GAUSSIAN_BOX_MIN_SIGMA else None
+    if widths is None:
+        return BlurPlan('exact', gaussian_ksize(sigma) // 2 + 1,
+                        lambda pixels: cv2.GaussianBlur(pixels, (0, 0), sigma))
+    return BlurPlan(f'box x{len(widths)}', sum(width // 2 for width in widths) + 1,
+                    lambda pixels: _box_passes(pixels, widths))
+
+
+def box(ksize):
+    """盒式模糊的执行计划"""
+    return BlurPlan('box', ksize // 2 + 1, lambda pixels: cv2.boxFilter(pixels, -1, (ksize, ksize)))
+
+
+def median(ksize):
+    """中值模糊的执行计划，ksize 会调整为不小于3的奇数"""
+    ksize = max(3, ksize | 1)
+    # ksize 为3、5时OpenCV用排序网络，更大时用常数时间的直方图算法
+    method = 'sorting network' if ksize <= 5 else 'histogram'
+    return BlurPlan(method, ksize // 2 + 1, lambda pixels: cv2.medianBlur(pixels, ksize))
+
+
+def plan(kind, radius):
+    """按模糊类型（Gaussian、Box、Median）和对话框中的强度选择实现"""
+    if kind == 'Gaussian':
+        return gaussian(radius)
+    if kind == 'Box':
+        return box(int(radius * 2 + 1))
+    return median(int(radius * 2 + 1))
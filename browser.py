@@ -0,0 +1,263 @@
+"""异步、虚拟化的文件浏览器
+
+FileChooserListView 在界面线程中同步列出整个文件夹，并为每个文件创建一个
+控件，几万个文件的文件夹会让程序卡住。这里在工作线程中用 os.scandir 分批
+读取目录项，只保留文件夹和可以解码的图片；列表用 RecycleView 显示，只有
+可见的行才有控件。每批目录项到达时按当前的排序方式合并进已排序的列表，
+搜索只在这些数据上过滤，不重新读取目录。
+"""
+import heapq
+import os
+import threading
+
+from kivy.clock import Clock
+from kivy.properties import BooleanProperty, ListProperty, ObjectProperty, StringProperty
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.button import Button
+from kivy.uix.label import Label
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.spinner import Spinner
+from kivy.uix.textinput import TextInput
+
+from image_files import IMAGE_EXTENSIONS
+
+# 每批送回界面线程的目录项数
+SCAN_CHUNK_SIZE = 1000
+
+SORT_KEYS = ('Name', 'Date', 'Size')
+
+_ROW_COLOR = (0.25, 0.25, 0.25, 1)
+_SELECTED_ROW_COLOR = (0.2, 0.45, 0.8, 1)
+
+
+def _format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+
+
+def _sort_key(entry, sort):
+    # 文件夹总是排在前面
+    if sort == 'Date':
+        return (not entry['is_dir'], -entry['mtime'], entry['key'])
+    if sort == 'Size':
+        return (not entry['is_dir'], -entry['size'], entry['key'])
+    return (not entry['is_dir'], entry['key'])
+
+
+class DirectoryListing:
+    """流式到达的目录项：增量排序，按名称搜索"""
+
+    def __init__(self, sort='Name'):
+        self.sort = sort
+        self.query = ''
+        self._sorted = []  # (排序键, 目录项)
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def clear(self):
+        self._sorted = []
+
+    def add(self, entries):
+        """合并一批目录项：只排序新的这一批，再与已排序的列表归并"""
+        batch = sorted(((_sort_key(entry, self.sort), entry) for entry in entries),
+                       key=lambda item: item[0])
+        self._sorted = list(heapq.merge(self._sorted, batch, key=lambda item: item[0]))
+
+    def set_sort(self, sort):
+        if sort != self.sort:
+            self.sort = sort
+            self._sorted = sorted(((_sort_key(entry, sort), entry) for _, entry in self._sorted),
+                                  key=lambda item: item[0])
+
+    def visible(self):
+        """当前搜索条件下可见的目录项（已排序）"""
+        query = self.query.casefold()
+        if not query:
+            return [entry for _, entry in self._sorted]
+        return [entry for _, entry in self._sorted if query in entry['key']]
+
+
+class DirectoryScanner:
+    """在工作线程中分批读取目录，on_chunk(entries, finished) 在主线程中调用
+
+    新的 scan() 或 cancel() 会让之前的扫描停止，已经送出的批次也会被丢弃。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def scan(self, path, on_chunk, on_error):
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        threading.Thread(target=self._run, args=(generation, path, on_chunk, on_error),
+                         daemon=True).start()
+
+    def cancel(self):
+        with self._lock:
+            self._generation += 1
+
+    def _is_current(self, generation):
+        with self._lock:
+            return generation == self._generation
+
+    def _run(self, generation, path, on_chunk, on_error):
+        chunk = []
+        try:
+            with os.scandir(path) as it:
+                for item in it:
+                    if not self._is_current(generation):
+                        return
+                    try:
+                        is_dir = item.is_dir()
+                        if item.name.startswith('.') or not (
+                                is_dir or item.name.lower().endswith(IMAGE_EXTENSIONS)):
+                            continue
+                        stat = item.stat()
+                    except OSError:
+                        continue
+                    chunk.append({'name': item.name, 'key': item.name.casefold(),
+                                  'path': item.path, 'is_dir': is_dir,
+                                  'size': 0 if is_dir else stat.st_size,
+                                  'mtime': stat.st_mtime})
+                    if len(chunk) >= SCAN_CHUNK_SIZE:
+                        self._deliver(generation, on_chunk, chunk, False)
+                        chunk = []
+        except OSError as e:
+            self._deliver(generation, lambda error, finished: on_error(error), e, True)
+            return
+        self._deliver(generation, on_chunk, chunk, True)
+
+    def _deliver(self, generation, callback, chunk, finished):
+        def deliver(dt):
+            if self._is_current(generation):
+                callback(chunk, finished)
+        Clock.schedule_once(deliver)
+
+
+class BrowserRow(RecycleDataViewBehavior, Button):
+    """文件列表中的一行（只为可见的行创建）"""
+    browser = ObjectProperty(None, allownone=True)
+    path = StringProperty('')
+    is_dir = BooleanProperty(False)
+
+    def on_press(self):
+        if self.browser is not None:
+            self.browser.open_entry(self.path, self.is_dir)
+
+
+class FileBrowser(BoxLayout):
+    """文件浏览器，path 和 selection 与 FileChooserListView 的用法相同"""
+    path = StringProperty('.')
+    selection = ListProperty([])
+
+    def __init__(self, **kwargs):
+        # 控件创建完成后再设置路径，开始读取目录
+        path = kwargs.pop('path', '.')
+        super().__init__(orientation='vertical', **kwargs)
+        self.listing = DirectoryListing()
+        self.scanner = DirectoryScanner()
+        self.scanning = False
+        # 多批目录项连续到达时合并成一次列表刷新
+        self._refresh_trigger = Clock.create_trigger(lambda dt: self.refresh(), 0.05)
+
+        # 路径栏：上一级按钮和当前路径
+        path_bar = BoxLayout(size_hint_y=None, height=30)
+        up_button = Button(text='..', size_hint_x=None, width=50)
+        up_button.bind(on_press=lambda x: self.go_up())
+        self.path_label = Label(halign='left', valign='middle', shorten=True)
+        self.path_label.bind(size=self.path_label.setter('text_size'))
+        path_bar.add_widget(up_button)
+        path_bar.add_widget(self.path_label)
+
+        # 搜索和排序
+        search_bar = BoxLayout(size_hint_y=None, height=30)
+        self.search_input = TextInput(hint_text='Search', multiline=False)
+        self.search_input.bind(text=self.on_search)
+        self.sort_spinner = Spinner(text='Name', values=SORT_KEYS, size_hint_x=None, width=100)
+        self.sort_spinner.bind(text=self.on_sort)
+        search_bar.add_widget(self.search_input)
+        search_bar.add_widget(self.sort_spinner)
+
+        # 虚拟化的列表
+        self.list_view = RecycleView(viewclass=BrowserRow)
+        layout = RecycleBoxLayout(orientation='vertical', default_size=(None, 30),
+                                  default_size_hint=(1, None), size_hint_y=None)
+        layout.bind(minimum_height=layout.setter('height'))
+        self.list_view.add_widget(layout)
+
+        self.status_label = Label(size_hint_y=None, height=25)
+
+        self.add_widget(path_bar)
+        self.add_widget(search_bar)
+        self.add_widget(self.list_view)
+        self.add_widget(self.status_label)
+        self.path = os.path.abspath(os.path.expanduser(path))
+
+    def on_path(self, instance, path):
+        path = os.path.abspath(os.path.expanduser(path))
+        if path != self.path:
+            self.path = path  # 会再次触发 on_path
+            return
+        self.path_label.text = path
+        self.selection = []
+        self.listing.clear()
+        self.scanning = True
+        self.refresh()
+        self.scanner.scan(path, self.on_chunk, self.on_scan_error)
+
+    def rescan(self):
+        """重新读取当前文件夹（弹窗复用时，关闭期间读取已被取消）"""
+        self.on_path(self, self.path)
+
+    def on_chunk(self, entries, finished):
+        if entries:
+            self.listing.add(entries)
+        self.scanning = not finished
+        self._refresh_trigger()
+
+    def on_scan_error(self, error):
+        print(f"Error listing {self.path}: {error}")
+        self.scanning = False
+        self.refresh()
+
+    def on_search(self, instance, text):
+        self.listing.query = text
+        self.refresh()
+
+    def on_sort(self, instance, text):
+        self.listing.set_sort(text)
+        self.refresh()
+
+    def refresh(self):
+        """按当前的排序和搜索条件更新列表数据"""
+        selected = self.selection[0] if self.selection else None
+        self.list_view.data = [
+            {'text': f"[{entry['name']}]" if entry['is_dir']
+                     else f"{entry['name']}    {_format_size(entry['size'])}",
+             'path': entry['path'], 'is_dir': entry['is_dir'], 'browser': self,
+             'background_color': _SELECTED_ROW_COLOR if entry['path'] == selected else _ROW_COLOR}
+            for entry in self.listing.visible()]
+        status = f'{len(self.list_view.data)} of {len(self.listing)} items'
+        self.status_label.text = status + (' (loading...)' if self.scanning else '')
+
+    def open_entry(self, path, is_dir):
+        """点击文件夹进入，点击图片选中"""
+        if is_dir:
+            self.path = path
+        else:
+            self.selection = [path]
+            self.refresh()
+
+    def go_up(self):
+        self.path = os.path.dirname(self.path)
+
+    def cancel(self):
+        """停止正在进行的目录读取（弹窗关闭时调用）"""
+        self.scanner.cancel()
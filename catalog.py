@@ -0,0 +1,210 @@
+"""缩略图和元数据目录（持久化在SQLite中）
+
+文件浏览器的每个预览都要解码原图并生成缩略图。目录按 (路径, 修改时间, 文件
+大小) 缓存缩略图和图片的尺寸、模式、格式及EXIF方向，再次浏览同一个文件夹
+时只需查询数据库。文件被修改后修改时间或大小变化，旧记录自动失效。
+缓存总大小超过上限时，按最近使用时间淘汰最久未用的记录（LRU）。
+"""
+import io
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from PIL import Image as PILImage
+
+from image_files import IMAGE_EXTENSIONS, open_reduced
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'image_editor')
+
+# 缩略图的最大尺寸
+THUMBNAIL_SIZE = (200, 200)
+
+# 缩略图数据的总大小上限
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# EXIF中表示方向的标签
+_ORIENTATION_TAG = 0x0112
+
+# EXIF方向 -> 把图像摆正的变换（与 ImageOps.exif_transpose 相同）
+_ORIENTATION_TRANSPOSE = {
+    2: PILImage.Transpose.FLIP_LEFT_RIGHT,
+    3: PILImage.Transpose.ROTATE_180,
+    4: PILImage.Transpose.FLIP_TOP_BOTTOM,
+    5: PILImage.Transpose.TRANSPOSE,
+    6: PILImage.Transpose.ROTATE_270,
+    7: PILImage.Transpose.TRANSVERSE,
+    8: PILImage.Transpose.ROTATE_90,
+}
+
+# 数据库格式的版本，缩略图的生成方式改变时加一，旧版本的记录全部丢弃
+_SCHEMA_VERSION = 1
+
+CatalogEntry = namedtuple('CatalogEntry', 'width height mode format orientation thumbnail')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS thumbnails (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    mode TEXT NOT NULL,
+    format TEXT,
+    orientation INTEGER NOT NULL,
+    thumbnail BLOB NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS thumbnails_last_used ON thumbnails (last_used);
+'''
+
+
+def build_entry(path):
+    """解码图片（JPEG按缩小解码）并生成目录记录"""
+    with PILImage.open(path) as image:
+        width, height = image.size
+        mode = image.mode
+        fmt = image.format
+        orientation = image.getexif().get(_ORIENTATION_TAG, 1)
+    thumbnail = open_reduced(path, THUMBNAIL_SIZE)[0]
+    # 按EXIF方向摆正。缩小解码得到的图像不一定保留EXIF，所以按原图读到的方向处理
+    if orientation in _ORIENTATION_TRANSPOSE:
+        thumbnail = thumbnail.transpose(_ORIENTATION_TRANSPOSE[orientation])
+    thumbnail.thumbnail(THUMBNAIL_SIZE, PILImage.Resampling.LANCZOS)
+
+    buffer = io.BytesIO()
+    if thumbnail.mode in ('RGBA', 'LA', 'P') or 'transparency' in thumbnail.info:
+        # 带透明度的缩略图保存为PNG
+        thumbnail.convert('RGBA').save(buffer, 'PNG', compress_level=1)
+    else:
+        if thumbnail.mode not in ('RGB', 'L'):
+            thumbnail = thumbnail.convert('RGB')
+        thumbnail.save(buffer, 'JPEG', quality=90)
+    return CatalogEntry(width, height, mode, fmt, orientation, buffer.getvalue())
+
+
+class ThumbnailCatalog:
+    """以 (路径, 修改时间, 大小) 为键的缩略图目录，可以在多个线程中使用"""
+
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES):
+        if path is None:
+            os.makedirs(DEFAULT_CACHE_DIR, exist_ok=True)
+            path = os.path.join(DEFAULT_CACHE_DIR, 'thumbnails.sqlite')
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if self._db.execute('PRAGMA user_version').fetchone()[0] != _SCHEMA_VERSION:
+            # 旧版本生成的缩略图没有按EXIF方向摆正
+            self._db.execute('DROP TABLE IF EXISTS thumbnails')
+            self._db.execute(f'PRAGMA user_version = {_SCHEMA_VERSION}')
+        self._db.executescript(_SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, path):
+        """查询有效的记录，文件不存在或已被修改时返回 None"""
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                'SELECT width, height, mode, format, orientation, thumbnail FROM thumbnails '
+                'WHERE path = ? AND mtime = ? AND size = ?',
+                (path, stat.st_mtime, stat.st_size)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute('UPDATE thumbnails SET last_used = ? WHERE path = ?',
+                             (time.time(), path))
+        return CatalogEntry(*row)
+
+    def get(self, path):
+        """查询记录，没有时生成并保存"""
+        entry = self.lookup(path)
+        if entry is None:
+            path = os.path.abspath(path)
+            stat = os.stat(path)
+            entry = build_entry(path)
+            self.store(path, stat.st_mtime, stat.st_size, entry)
+        return entry
+
+    def thumbnail(self, path):
+        """缩略图（PIL图像）"""
+        return PILImage.open(io.BytesIO(self.get(path).thumbnail))
+
+    def store(self, path, mtime, size, entry):
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (path, mtime, size, entry.width, entry.height, entry.mode, entry.format,
+                 entry.orientation, entry.thumbnail, time.time()))
+            self._evict()
+
+    def nbytes(self):
+        """缩略图数据的总大小"""
+        with self._lock:
+            return self._total_bytes()
+
+    def _total_bytes(self):
+        return self._db.execute(
+            'SELECT COALESCE(SUM(LENGTH(thumbnail)), 0) FROM thumbnails').fetchone()[0]
+
+    def _evict(self):
+        # 超出上限时从最久未用的记录开始删除
+        excess = self._total_bytes() - self.max_bytes
+        if excess <= 0:
+            return
+        rows = self._db.execute(
+            'SELECT path, LENGTH(thumbnail) FROM thumbnails ORDER BY last_used').fetchall()
+        evicted = []
+        for path, nbytes in rows:
+            if excess <= 0:
+                break
+            evicted.append((path,))
+            excess -= nbytes
+        self._db.executemany('DELETE FROM thumbnails WHERE path = ?', evicted)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class CatalogIndexer:
+    """在后台线程中为文件夹里的图片建立目录记录
+
+    每次 index() 会停止上一个文件夹的索引；已经有效的记录只做一次查询。
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self._cancel = None
+
+    def index(self, directory):
+        self.cancel()
+        cancel = self._cancel = threading.Event()
+        threading.Thread(target=self._run, args=(directory, cancel), daemon=True).start()
+
+    def cancel(self):
+        if self._cancel is not None:
+            self._cancel.set()
+            self._cancel = None
+
+    def _run(self, directory, cancel):
+        try:
+            paths = sorted(entry.path for entry in os.scandir(directory)
+                           if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS))
+        except OSError as e:
+            print(f"Error indexing {directory}: {e}")
+            return
+        for path in paths:
+            if cancel.is_set():
+                return
+            try:
+                self.catalog.get(path)
+            except Exception as e:
+                print(f"Error indexing {path}: {e}")
@@ -0,0 +1,152 @@
+"""图像文档：以NumPy数组为准的像素缓冲区
+
+像素保存在连续的 uint8 数组中，并记录通道顺序（L、RGB、BGR、RGBA、BGRA）。
+OpenCV和NumPy操作直接使用这个数组，并声明自己需要的通道顺序，只有顺序
+确实不同时才做 RGB↔BGR 转换；只有需要Pillow时才生成PIL图像（L和RGBA
+是共享内存的视图并缓存起来，RGB/BGR在一次解码中完成，Pillow内部按每像素
+4字节存放，不缓存，避免同一幅图像常驻两份）。
+"""
+from PIL import Image as PILImage
+
+from lazy import LazyModule
+
+# OpenCV和NumPy在第一次用到像素数组时才导入
+cv2 = LazyModule('cv2')
+np = LazyModule('numpy')
+
+# 任意通道顺序都可以的操作（逐通道的滤波等）
+ANY = 'ANY'
+
+# 通道顺序 -> PIL模式
+_PIL_MODES = {'L': 'L', 'RGB': 'RGB', 'BGR': 'RGB', 'RGBA': 'RGBA', 'BGRA': 'RGBA'}
+
+# (当前顺序, 需要的顺序) -> cvtColor转换码的名称（用到时才导入cv2）
+_CONVERSIONS = {
+    ('RGB', 'BGR'): 'COLOR_RGB2BGR',
+    ('BGR', 'RGB'): 'COLOR_BGR2RGB',
+    ('RGBA', 'RGB'): 'COLOR_RGBA2RGB',
+    ('RGBA', 'BGR'): 'COLOR_RGBA2BGR',
+    ('BGRA', 'BGR'): 'COLOR_BGRA2BGR',
+    ('BGRA', 'RGB'): 'COLOR_BGRA2RGB',
+    ('RGBA', 'BGRA'): 'COLOR_RGBA2BGRA',
+    ('BGRA', 'RGBA'): 'COLOR_BGRA2RGBA',
+    ('L', 'RGB'): 'COLOR_GRAY2RGB',
+    ('L', 'BGR'): 'COLOR_GRAY2BGR',
+    ('RGB', 'L'): 'COLOR_RGB2GRAY',
+    ('BGR', 'L'): 'COLOR_BGR2GRAY',
+    ('RGBA', 'L'): 'COLOR_RGBA2GRAY',
+    ('BGRA', 'L'): 'COLOR_BGRA2GRAY',
+}
+
+
+def convert(pixels, order, target):
+    """把按 order 排列的像素转换成 target 顺序（相同时不复制）
+
+    逐像素的转换，可以只对一部分像素（例如一个块）执行。
+    """
+    if order == target:
+        return pixels
+    return cv2.cvtColor(pixels, getattr(cv2, _CONVERSIONS[(order, target)]))
+
+
+class ImageDocument:
+    """带通道顺序的像素缓冲区（不可变，操作总是生成新的文档）"""
+
+    def __init__(self, pixels, order):
+        if order not in _PIL_MODES:
+            raise ValueError(f'Unsupported channel order: {order}')
+        self._pixels = np.ascontiguousarray(pixels, dtype=np.uint8) if pixels is not None else None
+        self.order = order
+        self._pil = None
+
+    @classmethod
+    def from_pil(cls, image):
+        """由PIL图像创建文档；数组在第一次需要时才生成"""
+        if image.mode not in ('L', 'RGB', 'RGBA'):
+            has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+        document = cls(None, image.mode)
+        document._pil = image
+        document._size = image.size
+        return document
+
+    @classmethod
+    def wrap(cls, image):
+        """PIL图像或文档都转为文档"""
+        return image if isinstance(image, ImageDocument) else cls.from_pil(image)
+
+    @property
+    def pixels(self):
+        """以 self.order 排列的像素数组（只读使用）"""
+        if self._pixels is None:
+            self._pixels = np.array(self._pil)
+            # 数组是独立的一份，不再保留PIL图像，需要时由 to_pil() 重新生成
+            self._pil = None
+        return self._pixels
+
+    @property
+    def size(self):
+        if self._pixels is None:
+            return self._size
+        return self._pixels.shape[1], self._pixels.shape[0]
+
+    @property
+    def width(self):
+        return self.size[0]
+
+    @property
+    def height(self):
+        return self.size[1]
+
+    @property
+    def mode(self):
+        """对应的PIL模式"""
+        return _PIL_MODES[self.order]
+
+    @property
+    def nbytes(self):
+        return self.width * self.height * len(self.order)
+
+    def memory_usage(self):
+        """像素数组和PIL缓存实际占用的字节数（共享内存的PIL视图不重复计算）"""
+        nbytes = self._pixels.nbytes if self._pixels is not None else 0
+        if self._pil is not None and not (self._pixels is not None and self._pil.readonly):
+            # Pillow内部L按1字节、RGB/RGBA按4字节存放每个像素
+            nbytes += self._pil.width * self._pil.height * (1 if self._pil.mode == 'L' else 4)
+        return nbytes
+
+    def pixels_in(self, order):
+        """按需要的通道顺序返回像素；顺序相同（或为ANY）时不复制
+
+        ANY 表示逐通道操作，只要求三通道彩色：带Alpha或灰度的图像会转换成
+        与当前顺序一致的三通道数组。
+        """
+        order = self.resolve(order)
+        if order == self.order:
+            return self.pixels
+        if self._pixels is None and order in _PIL_MODES.values():
+            # 还没有数组时直接由PIL转换，避免先生成一份数组
+            return np.array(self._pil.convert(order))
+        return convert(self.pixels, self.order, order)
+
+    def resolve(self, order):
+        """pixels_in(order) 实际得到的通道顺序"""
+        if order == ANY:
+            return {'L': 'RGB', 'RGBA': 'RGB', 'BGRA': 'BGR'}.get(self.order, self.order)
+        return order
+
+    def to_pil(self):
+        """需要Pillow时的PIL图像
+
+        L 和 RGBA 直接共享数组内存并缓存；RGB/BGR 每次生成一个临时的PIL图像
+        （BGR 的通道交换在同一次解码中完成），用完即释放。
+        """
+        if self._pil is not None:
+            return self._pil
+        pixels = self.pixels
+        mode = self.mode
+        if self.order in ('L', 'RGBA'):
+            # 共享内存的只读视图，Pillow在写入前会自动复制
+            self._pil = PILImage.frombuffer(mode, self.size, pixels, 'raw', mode, 0, 1)
+            return self._pil
+        return PILImage.frombuffer(mode, self.size, pixels, 'raw', self.order, 0, 1)
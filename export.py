@@ -0,0 +1,126 @@
+"""图片导出（编码参数、进度和原子写入），不依赖Kivy
+
+编码先写入同一目录下的临时文件，完成后用 os.replace 替换目标文件，
+失败或中断时不会留下写了一半的图片。
+"""
+import io
+import os
+import tempfile
+
+from document import ImageDocument
+
+# 各格式可以调整的编码参数及默认值
+ENCODER_DEFAULTS = {
+    'PNG': {'compress_level': 6},
+    'JPEG': {'quality': 90, 'subsampling': '4:2:0', 'progressive': False, 'optimize': False},
+    'WEBP': {'quality': 90, 'method': 4},
+    'TIFF': {'compression': 'tiff_deflate'},
+    'BMP': {},
+}
+
+# 对话框中可选的值
+JPEG_SUBSAMPLING = ('4:4:4', '4:2:2', '4:2:0')
+TIFF_COMPRESSION = ('raw', 'tiff_lzw', 'tiff_deflate', 'packbits')
+
+EXTENSIONS = {
+    '.png': 'PNG',
+    '.jpg': 'JPEG',
+    '.jpeg': 'JPEG',
+    '.webp': 'WEBP',
+    '.tif': 'TIFF',
+    '.tiff': 'TIFF',
+    '.bmp': 'BMP',
+}
+
+# 各格式的默认扩展名
+FORMAT_EXTENSIONS = {'PNG': '.png', 'JPEG': '.jpg', 'WEBP': '.webp', 'TIFF': '.tif', 'BMP': '.bmp'}
+
+# mkstemp 创建的文件只有所有者可读写，替换前改成普通文件的权限
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def format_for_path(path):
+    """根据扩展名确定格式，未知的扩展名返回 None"""
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def encoder_options(fmt, options=None):
+    """默认参数加上用户给出的参数（忽略该格式不支持的参数）"""
+    merged = dict(ENCODER_DEFAULTS.get(fmt, {}))
+    for key, value in (options or {}).items():
+        if key in merged:
+            merged[key] = value
+    return merged
+
+
+def prepare_for_format(image, fmt):
+    """转换成该格式可以保存的模式"""
+    if fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+        return image.convert('RGB')
+    if fmt == 'BMP' and image.mode not in ('RGB', 'L', '1', 'P'):
+        return image.convert('RGB')
+    return image
+
+
+class _CountingFile:
+    """统计已写入字节数的文件包装
+
+    不提供 fileno()，Pillow会分块调用 write()，从而可以报告进度。
+    """
+
+    def __init__(self, fp, progress):
+        self._fp = fp
+        self._progress = progress
+        self.written = 0
+
+    def write(self, data):
+        count = self._fp.write(data)
+        self.written += len(data)
+        if self._progress is not None:
+            self._progress('encoding', self.written)
+        return count
+
+    def fileno(self):
+        raise io.UnsupportedOperation('fileno')
+
+    def __getattr__(self, name):
+        return getattr(self._fp, name)
+
+
+def export_image(image, path, fmt=None, options=None, progress=None):
+    """把图像（PIL图像或图像文档）编码保存到 path
+
+    progress(stage, bytes_written) 报告进度，stage 为 'preparing'、'encoding'、
+    'finishing' 或 'done'。返回写入的字节数。
+    """
+    fmt = fmt or format_for_path(path)
+    if fmt is None:
+        raise ValueError(f'Unknown image format: {path}')
+    if progress is not None:
+        progress('preparing', 0)
+    if isinstance(image, ImageDocument):
+        image = image.to_pil()
+    image = prepare_for_format(image, fmt)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.export_', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            counter = _CountingFile(f, progress)
+            image.save(counter, fmt, **encoder_options(fmt, options))
+            if progress is not None:
+                progress('finishing', counter.written)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temp_path, 0o666 & ~_UMASK)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    if progress is not None:
+        progress('done', counter.written)
+    return counter.written
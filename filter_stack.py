@@ -0,0 +1,54 @@
+"""滤镜叠加的增量计算"""
+from PIL import ImageFilter
+
+# 滤镜名称 -> Pillow滤镜
+FILTERS = {
+    'blur': ImageFilter.BLUR,
+    'sharpen': ImageFilter.SHARPEN,
+    'edge': ImageFilter.FIND_EDGES,
+    'emboss': ImageFilter.EMBOSS,
+}
+
+
+class FilterStack:
+    """缓存每个前缀结果的滤镜栈
+
+    results[i] 是依次应用前 i 个滤镜后的图像。添加滤镜只需在最后一个结果上
+    做一次卷积；移除第 k 个滤镜时从缓存的前 k 个滤镜的结果继续计算。
+    """
+
+    def __init__(self, base):
+        self.filters = []
+        self.results = [base]
+
+    @property
+    def result(self):
+        """应用全部滤镜后的图像"""
+        return self.results[-1]
+
+    def push(self, name):
+        """在栈顶添加一个滤镜，返回新的结果"""
+        self.results.append(self.results[-1].filter(FILTERS[name]))
+        self.filters.append(name)
+        return self.result
+
+    def pop(self):
+        """移除最后一个滤镜，直接回到缓存的前缀结果"""
+        if self.filters:
+            self.filters.pop()
+            self.results.pop()
+        return self.result
+
+    def remove(self, index):
+        """移除第 index 个滤镜，从缓存的前缀开始重新计算之后的滤镜"""
+        remaining = self.filters[index + 1:]
+        del self.filters[index:]
+        del self.results[index + 1:]
+        for name in remaining:
+            self.push(name)
+        return self.result
+
+    def clear(self):
+        """移除所有滤镜"""
+        del self.filters[:]
+        del self.results[1:]
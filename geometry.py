@@ -0,0 +1,206 @@
+"""几何变换层：旋转、翻转、裁剪、调整大小合成为一个仿射变换，不依赖Kivy
+
+每一步几何操作只更新一个 3x3 矩阵（把输出图像的坐标映射到源图像的坐标，
+以像素的边为整数坐标），不生成新的图像。需要像素时 render() 一次完成：
+
+- 只有90度倍数的旋转、翻转和整数裁剪时，裁剪源图后用转置和翻转得到结果，
+  不经过重采样（无损）；
+- 再加上缩放时，在无损转置后只做一次 cv2.resize；
+- 任意角度的旋转用一次 cv2.warpAffine。
+
+所以 crop → rotate → resize → flip 这样的一串操作只生成一份图像，最多重采样一次。
+"""
+import math
+
+from PIL import Image as PILImage
+
+from document import ImageDocument
+from lazy import LazyModule
+
+cv2 = LazyModule('cv2')
+np = LazyModule('numpy')
+
+# 判断矩阵元素是否为0或整数时的容差
+_EPSILON = 1e-6
+
+
+def _translate(x, y):
+    return np.array([[1.0, 0.0, x], [0.0, 1.0, y], [0.0, 0.0, 1.0]])
+
+
+def _scale(x, y):
+    return np.array([[x, 0.0, 0.0], [0.0, y, 0.0], [0.0, 0.0, 1.0]])
+
+
+def _is_integer(value):
+    return abs(value - round(value)) < _EPSILON
+
+
+class Geometry:
+    """源图像上尚未执行的几何变换
+
+    每个方法把一步操作合成到当前的变换上并返回自身，可以链式调用：
+        Geometry(image.size).crop(0, 0, 800, 600).rotate(90).render(image)
+    各步的坐标和尺寸都以上一步的结果为准。
+    """
+
+    def __init__(self, source_size):
+        self.source_size = tuple(source_size)
+        self.size = tuple(source_size)  # 变换后的图像尺寸
+        self.matrix = np.eye(3)  # 输出坐标 -> 源图像坐标
+
+    def _compose(self, matrix, size):
+        self.matrix = self.matrix @ matrix
+        self.size = size
+        return self
+
+    def is_identity(self):
+        return self.size == self.source_size and np.allclose(self.matrix, np.eye(3), atol=_EPSILON)
+
+    def rotate(self, angle):
+        """逆时针旋转 angle 度，扩大画布以容纳整幅图像（与 rotate(expand=True) 相同）"""
+        width, height = self.size
+        angle = angle % 360
+        if angle % 90 == 0:
+            # 90度的倍数使用精确的整数，保证之后可以无损转置
+            cos, sin = [(1, 0), (0, 1), (-1, 0), (0, -1)][int(angle) // 90]
+            new_width, new_height = (height, width) if sin else (width, height)
+        else:
+            cos, sin = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+            # 新画布的尺寸按 Pillow 的方式取整：旋转后四个角的范围向外取整
+            half_width = (abs(width * cos) + abs(height * sin)) / 2
+            half_height = (abs(width * sin) + abs(height * cos)) / 2
+            new_width = (math.ceil(width / 2 + half_width - _EPSILON)
+                         - math.floor(width / 2 - half_width + _EPSILON))
+            new_height = (math.ceil(height / 2 + half_height - _EPSILON)
+                          - math.floor(height / 2 - half_height + _EPSILON))
+        # 输出坐标绕新中心反向旋转，再移到源图像的中心
+        rotation = np.array([[cos, -sin, 0.0], [sin, cos, 0.0], [0.0, 0.0, 1.0]])
+        return self._compose(_translate(width / 2, height / 2) @ rotation
+                             @ _translate(-new_width / 2, -new_height / 2), (new_width, new_height))
+
+    def flip_horizontal(self):
+        width, height = self.size
+        return self._compose(np.array([[-1.0, 0.0, width], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]),
+                             self.size)
+
+    def flip_vertical(self):
+        width, height = self.size
+        return self._compose(np.array([[1.0, 0.0, 0.0], [0.0, -1.0, height], [0.0, 0.0, 1.0]]),
+                             self.size)
+
+    def transpose(self, method):
+        """与 PIL Image.transpose(method) 相同的无损变换"""
+        if method == PILImage.Transpose.FLIP_LEFT_RIGHT:
+            return self.flip_horizontal()
+        if method == PILImage.Transpose.FLIP_TOP_BOTTOM:
+            return self.flip_vertical()
+        if method == PILImage.Transpose.ROTATE_90:
+            return self.rotate(90)
+        if method == PILImage.Transpose.ROTATE_180:
+            return self.rotate(180)
+        if method == PILImage.Transpose.ROTATE_270:
+            return self.rotate(270)
+        if method == PILImage.Transpose.TRANSPOSE:
+            return self.rotate(90).flip_vertical()
+        if method == PILImage.Transpose.TRANSVERSE:
+            return self.rotate(90).flip_horizontal()
+        raise ValueError(f'Unknown transpose method: {method}')
+
+    def crop(self, left, top, right, bottom):
+        """裁剪，坐标会被限制在图像范围内"""
+        width, height = self.size
+        left = max(0, min(int(left), width))
+        top = max(0, min(int(top), height))
+        right = max(0, min(int(right), width))
+        bottom = max(0, min(int(bottom), height))
+        if right <= left or bottom <= top:
+            raise ValueError('Invalid crop coordinates')
+        return self._compose(_translate(left, top), (right - left, bottom - top))
+
+    def resize(self, width, height):
+        width, height = int(width), int(height)
+        if width <= 0 or height <= 0:
+            raise ValueError('Invalid dimensions')
+        old_width, old_height = self.size
+        return self._compose(_scale(old_width / width, old_height / height), (width, height))
+
+    def render(self, image, max_size=None):
+        """对源图像一次执行全部变换，返回图像文档
+
+        给出 max_size 时结果再缩小到不超过这个尺寸（用于显示），仍然只计算一次。
+        """
+        document = ImageDocument.wrap(image)
+        if document.size != self.source_size:
+            raise ValueError('Geometry does not match the image size')
+        matrix, size = self.matrix, self.size
+        if max_size is not None:
+            scale = min(1.0, max_size[0] / size[0], max_size[1] / size[1])
+            if scale < 1.0:
+                display_size = (max(1, round(size[0] * scale)), max(1, round(size[1] * scale)))
+                matrix = matrix @ _scale(size[0] / display_size[0], size[1] / display_size[1])
+                size = display_size
+        pixels = _render_axis_aligned(document.pixels, matrix, size)
+        if pixels is None:
+            pixels = _render_affine(document.pixels, matrix, size)
+        return ImageDocument(pixels, document.order)
+
+
+def _render_axis_aligned(pixels, matrix, size):
+    """只有90度倍数的旋转和翻转时：裁剪、无损转置，需要时再缩放一次
+
+    变换不是这种形式，或者源图像上的范围不在整数像素边界上时返回 None。
+    """
+    linear = matrix[:2, :2]
+    swap = abs(linear[0, 0]) < _EPSILON and abs(linear[1, 1]) < _EPSILON
+    if not swap and (abs(linear[0, 1]) > _EPSILON or abs(linear[1, 0]) > _EPSILON):
+        return None
+    width, height = size
+    corners = matrix @ np.array([[0.0, width], [0.0, height], [1.0, 1.0]])
+    xs = sorted(corners[0])
+    ys = sorted(corners[1])
+    if not all(_is_integer(value) for value in xs + ys):
+        return None
+    left, right = (int(round(value)) for value in xs)
+    top, bottom = (int(round(value)) for value in ys)
+    region = pixels[top:bottom, left:right]
+    if swap:
+        # 输出的x来自源图像的y
+        flip_x, flip_y = linear[1, 0] < 0, linear[0, 1] < 0
+        target = (height, width)  # 转置前的尺寸
+    else:
+        flip_x, flip_y = linear[0, 0] < 0, linear[1, 1] < 0
+        target = (width, height)
+    region_size = (region.shape[1], region.shape[0])
+    shrinking = target[0] <= region_size[0] and target[1] <= region_size[1]
+    if shrinking and target != region_size:
+        # 缩小时先缩放（用面积平均），转置和翻转的像素更少
+        region = cv2.resize(region, target, interpolation=cv2.INTER_AREA)
+    if swap:
+        region = cv2.transpose(region)
+    if flip_x and flip_y:
+        region = cv2.flip(region, -1)
+    elif flip_x:
+        region = cv2.flip(region, 1)
+    elif flip_y:
+        region = cv2.flip(region, 0)
+    if not shrinking:
+        # 放大时最后缩放（用Lanczos）
+        region = cv2.resize(region, (width, height), interpolation=cv2.INTER_LANCZOS4)
+    return region
+
+
+def _render_affine(pixels, matrix, size):
+    """任意仿射变换：一次 warpAffine（双三次插值，画布外为0）"""
+    # 源图像上每个输出像素跨过的像素数；缩小超过一半时先按整数倍面积平均，
+    # 避免双三次插值跳过像素产生混叠
+    factor = int(min(np.hypot(*matrix[:2, 0]), np.hypot(*matrix[:2, 1])))
+    if factor >= 2:
+        height, width = pixels.shape[:2]
+        pixels = cv2.resize(pixels, (max(1, width // factor), max(1, height // factor)),
+                            interpolation=cv2.INTER_AREA)
+        matrix = _scale(pixels.shape[1] / width, pixels.shape[0] / height) @ matrix
+    # 像素中心在 +0.5 处，OpenCV的像素中心在整数坐标上
+    inverse = (_translate(-0.5, -0.5) @ matrix @ _translate(0.5, 0.5))[:2]
+    return cv2.warpAffine(pixels, inverse, size, flags=cv2.INTER_CUBIC | cv2.WARP_INVERSE_MAP,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=0)
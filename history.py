@@ -0,0 +1,319 @@
+"""撤销/重做历史
+
+图像文档是不可变的，历史中的每一项直接引用修改前的文档，记录时不复制、
+不压缩，撤销时也不需要解压。总大小受字节预算限制：超出预算时先在后台
+线程压缩较旧的记录（只有确实变小时才保留压缩结果——截图、图形这类大片
+平坦的图像通常压到原来的1%左右，照片一般只能省几个百分点），压缩后仍然
+超出预算才丢弃最旧的记录。
+旋转、翻转这类可以精确求逆的操作只记录操作本身，撤销时执行逆操作；
+只改变选区的操作只保存选区的外接矩形（撤销时图像尺寸必须与记录时相同，
+裁剪、调整大小这类改变尺寸的操作都要保存完整的快照）。
+"""
+import queue
+import threading
+import zlib
+from collections import deque
+
+from PIL import Image as PILImage
+
+from document import ImageDocument
+from geometry import Geometry
+from lazy import LazyModule
+
+np = LazyModule('numpy')
+
+# 默认的历史记录内存预算（字节）
+DEFAULT_BUDGET = 256 * 1024 * 1024
+
+# 压缩后不超过原始大小的这个比例才保留压缩结果，否则保留原始文档
+COMPRESS_MAX_RATIO = 0.75
+
+# 压缩时每次处理的行数，避免一次性生成整幅图像的原始字节
+_STRIP_ROWS = 256
+
+# 无损几何变换及其逆变换
+INVERSE_TRANSPOSE = {
+    PILImage.Transpose.FLIP_LEFT_RIGHT: PILImage.Transpose.FLIP_LEFT_RIGHT,
+    PILImage.Transpose.FLIP_TOP_BOTTOM: PILImage.Transpose.FLIP_TOP_BOTTOM,
+    PILImage.Transpose.ROTATE_90: PILImage.Transpose.ROTATE_270,
+    PILImage.Transpose.ROTATE_180: PILImage.Transpose.ROTATE_180,
+    PILImage.Transpose.ROTATE_270: PILImage.Transpose.ROTATE_90,
+    PILImage.Transpose.TRANSPOSE: PILImage.Transpose.TRANSPOSE,
+    PILImage.Transpose.TRANSVERSE: PILImage.Transpose.TRANSVERSE,
+}
+
+
+class Snapshot:
+    """一幅图像的快照：引用不可变的文档，超出预算时可以在后台压缩"""
+
+    def __init__(self, image):
+        self.document = ImageDocument.wrap(image)
+        self.order = self.document.order
+        self.size = self.document.size
+        self.data = None  # 压缩后的字节
+        self.compress_tried = False
+        # 后台线程和界面线程都可能压缩同一条记录，后到的等待先到的完成
+        self._compress_lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        if self.data is not None:
+            return len(self.data)
+        return self.document.memory_usage()
+
+    def compress(self):
+        """压缩像素；压缩后没有明显变小时保留原始文档
+
+        通常在后台线程中调用。另一个线程正在压缩时等待它完成，返回时压缩
+        一定已经结束。
+        """
+        with self._compress_lock:
+            self._compress()
+
+    def _compress(self):
+        document = self.document
+        if self.compress_tried or document is None:
+            return
+        self.compress_tried = True
+        pixels = document.pixels
+        # 按条带压缩，峰值内存只有一个条带的原始字节
+        compressor = zlib.compressobj(1)
+        chunks = []
+        for top in range(0, pixels.shape[0], _STRIP_ROWS):
+            chunks.append(compressor.compress(pixels[top:top + _STRIP_ROWS].tobytes()))
+        chunks.append(compressor.flush())
+        data = b''.join(chunks)
+        if len(data) <= pixels.nbytes * COMPRESS_MAX_RATIO:
+            # 先写入压缩结果再释放文档，restore() 在任何时刻都能得到其中之一
+            self.data = data
+            self.document = None
+
+    def restore(self):
+        """快照中的图像文档"""
+        document = self.document
+        if document is not None:
+            return document
+        width, height = self.size
+        shape = (height, width) if self.order == 'L' else (height, width, len(self.order))
+        pixels = np.frombuffer(zlib.decompress(self.data), dtype=np.uint8).reshape(shape)
+        return ImageDocument(pixels, self.order)
+
+    def undo(self, current):
+        """返回 (恢复后的图像, 用于重做的记录)"""
+        return self.restore(), Snapshot(current)
+
+    def redo(self, current):
+        """返回 (重做后的图像, 用于撤销的记录)"""
+        return self.restore(), Snapshot(current)
+
+
+class RegionSnapshot:
+    """只保存图像中一个矩形区域的快照（选区内的编辑只会改变这个区域）"""
+
+    def __init__(self, image, box):
+        self.box = tuple(box)
+        document = ImageDocument.wrap(image)
+        self.image_size = document.size
+        left, top, right, bottom = self.box
+        self.snapshot = Snapshot(ImageDocument(document.pixels[top:bottom, left:right].copy(),
+                                               document.order))
+
+    @property
+    def nbytes(self):
+        return self.snapshot.nbytes
+
+    @property
+    def compress_tried(self):
+        return self.snapshot.compress_tried
+
+    def compress(self):
+        self.snapshot.compress()
+
+    def _restore_into(self, current):
+        current = ImageDocument.wrap(current)
+        if current.size != self.image_size:
+            # 区域坐标只对记录时的尺寸有效，不能贴到另一幅图像上
+            raise ValueError(f'Image size changed from {self.image_size} to {current.size}, '
+                             'cannot restore the region')
+        region = self.snapshot.restore()
+        order = current.order
+        if order == 'L' and region.order != 'L':
+            # 选区内的操作把灰度图变成了彩色，撤销后保持彩色
+            order = region.order
+        pixels = current.pixels_in(order)
+        pixels = pixels.copy() if pixels is current.pixels else pixels
+        left, top, right, bottom = self.box
+        pixels[top:bottom, left:right] = region.pixels_in(order)
+        return ImageDocument(pixels, order)
+
+    def undo(self, current):
+        return self._restore_into(current), RegionSnapshot(current, self.box)
+
+    def redo(self, current):
+        return self._restore_into(current), RegionSnapshot(current, self.box)
+
+
+class TransposeCommand:
+    """无损几何变换的撤销记录：不保存像素，撤销时执行逆变换"""
+
+    nbytes = 0
+    compress_tried = True
+
+    def __init__(self, method):
+        self.method = method
+
+    def compress(self):
+        pass
+
+    @staticmethod
+    def _transpose(current, method):
+        current = ImageDocument.wrap(current)
+        return Geometry(current.size).transpose(method).render(current)
+
+    def undo(self, current):
+        return self._transpose(current, INVERSE_TRANSPOSE[self.method]), self
+
+    def redo(self, current):
+        return self._transpose(current, self.method), self
+
+
+class History:
+    """按字节预算管理的撤销/重做栈"""
+
+    def __init__(self, budget=DEFAULT_BUDGET):
+        self.budget = budget
+        self.undo_stack = deque()
+        self.redo_stack = deque()
+        # 栈由界面线程和后台压缩线程共同访问
+        self._lock = threading.RLock()
+        self._pending = queue.Queue()
+        self._worker = None
+
+    @property
+    def nbytes(self):
+        """历史记录当前占用的字节数"""
+        with self._lock:
+            return sum(entry.nbytes for entry in self.undo_stack) + \
+                sum(entry.nbytes for entry in self.redo_stack)
+
+    def can_undo(self):
+        return len(self.undo_stack) > 0
+
+    def can_redo(self):
+        return len(self.redo_stack) > 0
+
+    def record(self, image):
+        """在修改图像之前保存当前状态（只保存引用，不复制）"""
+        self.push(Snapshot(image))
+
+    def record_region(self, image, box):
+        """在修改图像的一个矩形区域 (left, top, right, bottom) 之前只保存这个区域"""
+        self.push(RegionSnapshot(image, box))
+
+    def record_transpose(self, method):
+        """记录一次无损几何变换（不需要保存图像）"""
+        self.push(TransposeCommand(method))
+
+    def push(self, entry):
+        """添加一条新的撤销记录，并清空重做栈"""
+        with self._lock:
+            self.undo_stack.append(entry)
+            self.redo_stack.clear()
+            self._enforce_budget()
+
+    def undo(self, current):
+        """撤销一步，返回恢复后的图像"""
+        with self._lock:
+            entry = self.undo_stack.pop()
+        try:
+            image, redo_entry = entry.undo(current)
+        except Exception:
+            # 撤销失败时记录放回原处，图像和历史都保持不变
+            with self._lock:
+                self.undo_stack.append(entry)
+            raise
+        with self._lock:
+            self.redo_stack.append(redo_entry)
+            self._enforce_budget()
+        return image
+
+    def redo(self, current):
+        """重做一步，返回重做后的图像"""
+        with self._lock:
+            entry = self.redo_stack.pop()
+        try:
+            image, undo_entry = entry.redo(current)
+        except Exception:
+            with self._lock:
+                self.redo_stack.append(entry)
+            raise
+        with self._lock:
+            self.undo_stack.append(undo_entry)
+            self._enforce_budget()
+        return image
+
+    def clear(self):
+        with self._lock:
+            self.undo_stack.clear()
+            self.redo_stack.clear()
+
+    def _entries(self):
+        """除最近一条撤销记录外的所有记录，按丢弃的先后排列"""
+        return list(self.undo_stack)[:-1] + list(self.redo_stack)
+
+    def _enforce_budget(self):
+        """超出预算时先在后台压缩旧记录，压缩后仍然超出才丢弃
+
+        丢弃时先丢弃最旧的撤销记录，再丢弃最远的重做记录。最近的一条撤销
+        记录始终保留（也不压缩），保证至少能立即撤销一步。还有记录在排队
+        压缩时先不丢弃；总大小超过预算的两倍时在当前线程中按丢弃的先后
+        压缩剩下的记录（正在后台压缩的等待其完成），所有记录都压缩过之后
+        仍然超出预算才丢弃，不会丢弃还没来得及压缩的记录。
+        """
+        total = self.nbytes
+        if total <= self.budget:
+            return
+        waiting = False
+        for entry in self._entries():
+            if not entry.compress_tried:
+                waiting = True
+                if not getattr(entry, 'queued', False):
+                    entry.queued = True
+                    self._pending.put(entry)
+        if waiting:
+            self._start_worker()
+            if total <= self.budget * 2:
+                return
+        # 正在后台压缩的记录 compress_tried 已经为真，这里同样要等它压缩完
+        for entry in self._entries():
+            if total <= self.budget:
+                return
+            entry.compress()
+            total = self.nbytes
+        while total > self.budget and len(self.undo_stack) > 1:
+            total -= self.undo_stack.popleft().nbytes
+        while total > self.budget and self.redo_stack:
+            total -= self.redo_stack.popleft().nbytes
+
+    def _start_worker(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._compress_pending, daemon=True)
+            self._worker.start()
+
+    def _compress_pending(self):
+        """后台线程：压缩排队的记录，每压缩一条重新检查预算"""
+        while True:
+            entry = self._pending.get()
+            try:
+                with self._lock:
+                    # 排队期间可能已经被丢弃或随重做栈清空
+                    alive = entry in self.undo_stack or entry in self.redo_stack
+                if alive:
+                    # zlib 压缩时释放GIL，不阻塞界面线程
+                    entry.compress()
+                    with self._lock:
+                        self._enforce_budget()
+            except Exception as e:
+                print(f"Error compressing history: {e}")
+            finally:
+                self._pending.task_done()
@@ -1,23 +1,62 @@
+import time
+
+# 启动计时的起点（导入Kivy等模块之前）
+STARTUP_BEGIN = time.perf_counter()
+
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
 from kivy.uix.image import Image
-from kivy.uix.filechooser import FileChooserListView
 from kivy.uix.popup import Popup
+from kivy.uix.progressbar import ProgressBar
 from kivy.uix.slider import Slider
 from kivy.uix.label import Label
 from kivy.uix.textinput import TextInput
 from kivy.uix.spinner import Spinner
-from kivy.graphics import Color, Rectangle
+from kivy.uix.togglebutton import ToggleButton
+from kivy.graphics import Color, Line, Rectangle
+from kivy.graphics.texture import Texture
 from kivy.core.window import Window
-from PIL import Image as PILImage, ImageEnhance, ImageFilter, ImageOps, ImageChops
-import cv2
-import numpy as np
+from kivy.clock import Clock
+from PIL import Image as PILImage
 import io
-import tempfile
 import os
+import threading
 from datetime import datetime
-from collections import deque
+
+from document import ImageDocument
+from export import (ENCODER_DEFAULTS, FORMAT_EXTENSIONS, JPEG_SUBSAMPLING, TIFF_COMPRESSION,
+                    export_image, format_for_path)
+from filter_stack import FilterStack
+from geometry import Geometry
+from history import History
+from lazy import LazyModule
+from loader import ProgressiveLoader
+from memory import accounting, format_bytes, image_nbytes
+from preview import PreviewProxy, PreviewScheduler, center_crop
+from selection import Selection
+from tracing import span, tracer, traced
+
+# 图像操作（以及它用到的OpenCV和NumPy）在第一次编辑时才导入
+image_ops = LazyModule('image_ops')
+
+STARTUP_IMPORTED = time.perf_counter()
+
+# PIL图像模式（或图像文档的通道顺序）对应的Kivy纹理颜色格式
+TEXTURE_COLORFMTS = {
+    'L': 'luminance',
+    'LA': 'luminance_alpha',
+    'RGB': 'rgb',
+    'RGBA': 'rgba',
+    'BGR': 'bgr',
+    'BGRA': 'bgra',
+}
+
+# 降噪预览使用的原分辨率局部的最大尺寸（降噪很慢，局部不宜太大）
+DENOISE_PREVIEW_SIZE = (480, 360)
+
+# 主视图上选区的绘制方式
+SELECTION_MODES = ('No Selection', 'Rectangle', 'Freehand')
 
 class ImageEditor(BoxLayout):
     def __init__(self, **kwargs):
@@ -43,10 +82,10 @@ class ImageEditor(BoxLayout):
         self.button_row2 = BoxLayout(size_hint_y=None, height=50)
         self.filter_button = Button(text='Filters', on_press=self.show_filter_dialog)
         self.effects_button = Button(text='Effects', on_press=self.show_effects_dialog)
-        self.cartoon_button = Button(text='Cartoon', on_press=self.apply_cartoon)
+        self.cartoon_button = Button(text='Cartoon', on_press=self.show_cartoon_dialog)
         self.sketch_button = Button(text='Sketch', on_press=self.apply_sketch)
         self.edge_button = Button(text='Edge', on_press=self.apply_edge)
-        self.denoise_button = Button(text='Denoise', on_press=self.apply_denoise)
+        self.denoise_button = Button(text='Denoise', on_press=self.show_denoise_dialog)
         
         # 第三行按钮 - 颜色和调整
         self.button_row3 = BoxLayout(size_hint_y=None, height=50)
@@ -55,15 +94,19 @@ class ImageEditor(BoxLayout):
         self.sharpness_button = Button(text='Sharpness', on_press=self.show_sharpness_dialog)
         self.blur_button = Button(text='Blur', on_press=self.show_blur_dialog)
         self.noise_button = Button(text='Noise', on_press=self.show_noise_dialog)
-        self.vignette_button = Button(text='Vignette', on_press=self.apply_vignette)
+        self.vignette_button = Button(text='Vignette', on_press=self.show_vignette_dialog)
         
         # 第四行按钮 - 调整和保存
         self.button_row4 = BoxLayout(size_hint_y=None, height=50)
         self.crop_button = Button(text='Crop', on_press=self.show_crop_dialog)
+        self.select_spinner = Spinner(text=SELECTION_MODES[0], values=SELECTION_MODES)
+        self.select_spinner.bind(text=self.on_selection_mode)
         self.resize_button = Button(text='Resize', on_press=self.show_resize_dialog)
         self.undo_button = Button(text='Undo', on_press=self.undo)
         self.redo_button = Button(text='Redo', on_press=self.redo)
         self.save_button = Button(text='Save Image', on_press=self.show_save_dialog)
+        self.hud_button = ToggleButton(text='HUD', on_press=self.toggle_hud)
+        self.memory_button = ToggleButton(text='Memory', on_press=self.toggle_memory_readout)
         
         # 添加按钮到第一行
         for button in [self.load_button, self.rotate_button, self.flip_h_button, 
@@ -82,8 +125,8 @@ class ImageEditor(BoxLayout):
             self.button_row3.add_widget(button)
         
         # 添加按钮到第四行
-        for button in [self.crop_button, self.resize_button, self.undo_button,
-                      self.redo_button, self.save_button]:
+        for button in [self.crop_button, self.select_spinner, self.resize_button, self.undo_button,
+                      self.redo_button, self.save_button, self.hud_button, self.memory_button]:
             self.button_row4.add_widget(button)
         
         # 将四行按钮添加到按钮布局
@@ -92,77 +135,271 @@ class ImageEditor(BoxLayout):
         self.button_layout.add_widget(self.button_row3)
         self.button_layout.add_widget(self.button_row4)
         
-        # 创建图片显示区域
+        # 创建图片显示区域（选区模式下在上面拖动绘制选区）
         self.image_widget = Image()
+        with self.image_widget.canvas.after:
+            Color(1, 0.85, 0, 1)
+            self.selection_line = Line(points=[], width=1.2, close=True)
+        self.image_widget.bind(on_touch_down=self.on_image_touch_down,
+                               on_touch_move=self.on_image_touch_move,
+                               on_touch_up=self.on_image_touch_up,
+                               pos=lambda *args: self.draw_selection(),
+                               size=lambda *args: self.draw_selection(),
+                               norm_image_size=lambda *args: self.draw_selection())
+        
+        # 状态栏（后台保存的进度等，右侧是可选的内存统计）
+        self.status_bar = BoxLayout(size_hint_y=None, height=30)
+        self.status_label = Label(text='')
+        self.memory_label = Label(text='', size_hint_x=0)
+        self.status_bar.add_widget(self.status_label)
+        self.status_bar.add_widget(self.memory_label)
         
         # 添加组件到主布局
         self.add_widget(self.button_layout)
         self.add_widget(self.image_widget)
+        self.add_widget(self.status_bar)
         
         self.current_image = None
-        self.pil_image = None
-        self.temp_file = None
-        self.preview_temp_file = None
+        self._document = None  # 当前图像（NumPy像素缓冲区为准），见 document 属性
+        self.geometry = None  # 当前图像上尚未执行的几何变换
         self.original_image = None  # 保存原始图片用于重置
-        
-        # 初始化撤销/重做栈
-        self.undo_stack = deque(maxlen=10)  # 最多保存10步操作
-        self.redo_stack = deque(maxlen=10)
+        self.preview_scheduler = PreviewScheduler()  # 所有对话框共用的预览渲染调度器
+        self.image_loader = ProgressiveLoader()
+        self.catalog = None  # 文件浏览器的缩略图缓存（第一次打开文件浏览器时创建）
+        self.catalog_indexer = None
+        self.dialogs = {}  # 对话框名称 -> (弹窗, 每次打开前调用的函数)
+        self.startup_times = None  # 启动各阶段的耗时（第一帧显示后由App填入）
+        self.loading = False  # 正在解码全分辨率图像，期间禁止编辑
+        self.hud_label = None  # 性能叠加层
+        self.hud_event = None
+        self.memory_event = None
+        self.selection = None  # 当前选区，None 表示整幅图像
+        self.selection_mode = None  # 'Rectangle'、'Freehand' 或 None（不绘制选区）
+        
+        # 初始化撤销/重做历史（引用不可变的文档，按内存预算而不是步数限制）
+        self.history = History()
         self.update_undo_redo_buttons()
+        
+        # 内存统计的各个类别（对话框中的预览和中间结果在创建时登记）
+        accounting.register('image', lambda: image_nbytes(self._document))
+        accounting.register('original', lambda: image_nbytes(self.original_image))
+        accounting.register('history', lambda: self.history.nbytes)
+        if os.environ.get('IMAGE_EDITOR_TRACEMALLOC'):
+            accounting.start_peak_tracking()
+
+    @property
+    def document(self):
+        """当前图像；有累积的几何变换时在第一次需要像素时一次完成"""
+        if self.geometry is not None:
+            geometry, self.geometry = self.geometry, None
+            with span('geometry'):
+                self._document = geometry.render(self._document)
+        return self._document
+
+    @document.setter
+    def document(self, document):
+        self.geometry = None
+        self._document = document
+
+    @property
+    def has_image(self):
+        return self._document is not None
+
+    @property
+    def image_size(self):
+        """当前图像的尺寸（不需要执行累积的几何变换）"""
+        if self.geometry is not None:
+            return self.geometry.size
+        return self._document.size if self._document is not None else None
+
+    def transform(self, change):
+        """把几何变换 change(geometry) 累积到待执行的仿射变换上
+
+        旋转、翻转、裁剪和调整大小不立即生成新的图像，连续的几何操作合成为
+        一个变换，在需要像素时一次完成（90度倍数的旋转和翻转不经过重采样）；
+        显示时只渲染窗口大小的结果。裁剪和调整大小之前要保存完整的快照，
+        之前累积的变换会先完成。
+        """
+        if self.geometry is None:
+            self.geometry = Geometry(self._document.size)
+        change(self.geometry)
+        if self.geometry.is_identity():
+            self.geometry = None
+        self.update_image_display()
+
+    def current_view(self):
+        """用于显示的当前图像：有累积的几何变换时只渲染窗口大小的结果"""
+        if self.geometry is not None:
+            with span('geometry_view'):
+                return self.geometry.render(self._document, max_size=(Window.width, Window.height))
+        return self._document
+
+    @property
+    def pil_image(self):
+        """当前图像的PIL视图，只在需要Pillow的地方使用"""
+        return self.document.to_pil() if self.document is not None else None
+
+    @pil_image.setter
+    def pil_image(self, image):
+        self.document = ImageDocument.wrap(image) if image is not None else None
+
+    def toggle_hud(self, instance):
+        """显示/隐藏性能叠加层：最近一次操作各阶段的耗时、预览帧率、对话框打开和启动耗时"""
+        if instance.state == 'down':
+            self.hud_label = Label(size_hint=(None, None), halign='left', valign='top',
+                                   font_size='13sp')
+            with self.hud_label.canvas.before:
+                Color(0, 0, 0, 0.6)
+                background = Rectangle()
+            self.hud_label.bind(pos=lambda label, pos: setattr(background, 'pos', pos),
+                                size=lambda label, size: setattr(background, 'size', size))
+            Window.add_widget(self.hud_label)
+            self.update_hud(0)
+            self.hud_event = Clock.schedule_interval(self.update_hud, 0.5)
+        elif self.hud_label is not None:
+            self.hud_event.cancel()
+            Window.remove_widget(self.hud_label)
+            self.hud_label = None
+
+    def update_hud(self, dt):
+        lines = []
+        breakdown = tracer.last_breakdown()
+        if breakdown is not None:
+            operation, phases = breakdown
+            lines.append(f"{operation['name']}: {operation['duration'] * 1000:.1f} ms")
+            lines.extend(f"  {phase['name']}: {phase['duration'] * 1000:.1f} ms" for phase in phases)
+        else:
+            lines.append('No operation yet')
+        lines.append(f"Preview: {tracer.rate('preview.display'):.1f} fps, "
+                     f"render {tracer.mean_duration('preview.render') * 1000:.1f} ms")
+        dialog = tracer.last('dialog.open')
+        if dialog is not None:
+            created = ' (created)' if dialog['args']['first'] else ''
+            lines.append(f"Dialog {dialog['args']['dialog']}: {dialog['duration'] * 1000:.1f} ms{created}")
+        if self.startup_times is not None:
+            lines.append(f"Startup: {self.startup_times['first_frame'] * 1000:.0f} ms "
+                         f"(imports {self.startup_times['imports'] * 1000:.0f} ms)")
+        label = self.hud_label
+        label.text = '\n'.join(lines)
+        # 先按自然宽度排版，再固定宽度使各行左对齐
+        label.text_size = (None, None)
+        label.texture_update()
+        label.text_size = (label.texture_size[0], None)
+        label.texture_update()
+        label.size = (label.texture_size[0] + 20, label.texture_size[1] + 20)
+        label.pos = (10, Window.height - label.height - 10)
+
+    def toggle_memory_readout(self, instance):
+        """在状态栏显示/隐藏各类别的内存占用"""
+        if instance.state == 'down':
+            self.memory_label.size_hint_x = 1
+            self.update_memory_readout(0)
+            self.memory_event = Clock.schedule_interval(self.update_memory_readout, 1.0)
+        elif self.memory_event is not None:
+            self.memory_event.cancel()
+            self.memory_event = None
+            self.memory_label.size_hint_x = 0
+            self.memory_label.text = ''
+
+    def update_memory_readout(self, dt):
+        totals = accounting.totals()
+        parts = [f'{category} {format_bytes(nbytes)}' for category, nbytes in totals.items()]
+        parts.append(f'total {format_bytes(sum(totals.values()))}')
+        breakdown = tracer.last_breakdown()
+        if breakdown is not None and breakdown[0]['name'] in accounting.peaks:
+            name = breakdown[0]['name']
+            parts.append(f'peak {name} {format_bytes(accounting.peaks[name])}')
+        self.memory_label.text = '  '.join(parts)
 
     def update_undo_redo_buttons(self):
         """更新撤销/重做按钮状态"""
-        self.undo_button.disabled = len(self.undo_stack) == 0
-        self.redo_button.disabled = len(self.redo_stack) == 0
-
-    def save_state(self):
-        """保存当前状态到撤销栈"""
-        if self.pil_image:
-            self.undo_stack.append(self.pil_image.copy())
-            self.redo_stack.clear()  # 清空重做栈
+        self.undo_button.disabled = self.loading or not self.history.can_undo()
+        self.redo_button.disabled = self.loading or not self.history.can_redo()
+
+    def set_editing_enabled(self, enabled):
+        """加载图片期间禁用除Load Image以外的所有按钮"""
+        self.loading = not enabled
+        for row in (self.button_row1, self.button_row2, self.button_row3, self.button_row4):
+            for button in row.children:
+                if button not in (self.load_button, self.hud_button, self.memory_button):
+                    button.disabled = not enabled
+        self.update_undo_redo_buttons()
+
+    @traced('save_state', 'phase')
+    def save_state(self, box=None):
+        """保存当前状态到撤销栈，给出 box 时只保存这个矩形区域"""
+        if self.has_image:
+            # 同时清空重做栈
+            if box is not None:
+                self.history.record_region(self.document, box)
+            else:
+                self.history.record(self.document)
             self.update_undo_redo_buttons()
 
+    @traced('undo')
     def undo(self, instance):
         """撤销上一步操作"""
-        if self.undo_stack:
-            if self.pil_image:
-                self.redo_stack.append(self.pil_image.copy())
-            self.pil_image = self.undo_stack.pop()
+        if self.history.can_undo():
+            try:
+                self.document = self.history.undo(self.document)
+            except Exception as e:
+                print(f"Error undoing: {e}")
             self.update_image_display()
             self.update_undo_redo_buttons()
 
+    @traced('redo')
     def redo(self, instance):
         """重做上一步操作"""
-        if self.redo_stack:
-            if self.pil_image:
-                self.undo_stack.append(self.pil_image.copy())
-            self.pil_image = self.redo_stack.pop()
+        if self.history.can_redo():
+            try:
+                self.document = self.history.redo(self.document)
+            except Exception as e:
+                print(f"Error redoing: {e}")
             self.update_image_display()
             self.update_undo_redo_buttons()
 
+    @traced('transpose')
+    def transpose_image(self, method):
+        """执行无损几何变换，历史中只记录操作，撤销时执行逆变换"""
+        if self.has_image:
+            self.history.record_transpose(method)
+            self.update_undo_redo_buttons()
+            self.set_selection(None)
+            self.transform(lambda geometry: geometry.transpose(method))
+
     def flip_horizontal(self, instance):
         """水平翻转图像"""
-        if self.pil_image:
-            self.save_state()
-            self.pil_image = self.pil_image.transpose(PILImage.FLIP_LEFT_RIGHT)
-            self.update_image_display()
+        self.transpose_image(PILImage.Transpose.FLIP_LEFT_RIGHT)
 
     def flip_vertical(self, instance):
         """垂直翻转图像"""
-        if self.pil_image:
-            self.save_state()
-            self.pil_image = self.pil_image.transpose(PILImage.FLIP_TOP_BOTTOM)
-            self.update_image_display()
+        self.transpose_image(PILImage.Transpose.FLIP_TOP_BOTTOM)
+
+    def open_dialog(self, name, build):
+        """打开对话框：第一次打开时创建，之后复用同一个弹窗
+
+        build() 创建控件并返回 (弹窗, on_open)，on_open() 在每次打开前调用，
+        把控件恢复到初始状态并显示当前图像。打开的耗时记为 'dialog.open' span。
+        """
+        first = name not in self.dialogs
+        with span('dialog.open', 'dialog', dialog=name, first=first):
+            if first:
+                self.dialogs[name] = build()
+            popup, on_open = self.dialogs[name]
+            on_open()
+            popup.open()
 
     def show_filter_dialog(self, instance):
         """显示滤镜对话框"""
-        if not self.pil_image:
+        if not self.has_image:
             return
-            
+        self.open_dialog('filter', self.build_filter_dialog)
+
+    def build_filter_dialog(self):
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
         # 预览区域
-        preview = Image(source=self.temp_file)
+        preview = Image()
         content.add_widget(preview)
         
         # 滤镜按钮区域
@@ -188,67 +425,45 @@ class ImageEditor(BoxLayout):
         apply_button = Button(text='Apply')
         reset_button = Button(text='Reset')
         clear_filters_button = Button(text='Clear Filters')
+        remove_filter_button = Button(text='Remove Last')
         
         buttons.add_widget(cancel_button)
         buttons.add_widget(clear_filters_button)
+        buttons.add_widget(remove_filter_button)
         buttons.add_widget(reset_button)
         buttons.add_widget(apply_button)
         content.add_widget(buttons)
         
         popup = Popup(title='Apply Filter', content=content, size_hint=(0.8, 0.8))
         
-        # 保存当前滤镜状态
-        applied_filters = []
+        # 保存当前滤镜状态（缓存每一步的中间结果）
+        filter_stack = None
         filtered_image = None
         
         def update_filter_label():
             """更新已应用滤镜的标签"""
-            if applied_filters:
-                applied_filters_label.text = 'Applied Filters: ' + ', '.join(applied_filters)
+            if filter_stack and filter_stack.filters:
+                applied_filters_label.text = 'Applied Filters: ' + ', '.join(filter_stack.filters)
             else:
                 applied_filters_label.text = 'Applied Filters: None'
         
         def apply_filter(filter_type):
-            nonlocal filtered_image
+            nonlocal filter_stack, filtered_image
             if not self.original_image:
                 self.original_image = self.pil_image.copy()
             
-            # 确保图像是RGB模式
-            temp_img = self.ensure_rgb_mode(self.original_image.copy())
-            
             try:
-                # 应用所有已保存的滤镜
-                for f in applied_filters:
-                    if f == 'blur':
-                        temp_img = temp_img.filter(ImageFilter.BLUR)
-                    elif f == 'sharpen':
-                        temp_img = temp_img.filter(ImageFilter.SHARPEN)
-                    elif f == 'edge':
-                        temp_img = temp_img.filter(ImageFilter.FIND_EDGES)
-                    elif f == 'emboss':
-                        temp_img = temp_img.filter(ImageFilter.EMBOSS)
-                
-                # 应用新滤镜
-                if filter_type == 'blur':
-                    temp_img = temp_img.filter(ImageFilter.BLUR)
-                elif filter_type == 'sharpen':
-                    temp_img = temp_img.filter(ImageFilter.SHARPEN)
-                elif filter_type == 'edge':
-                    temp_img = temp_img.filter(ImageFilter.FIND_EDGES)
-                elif filter_type == 'emboss':
-                    temp_img = temp_img.filter(ImageFilter.EMBOSS)
+                if filter_stack is None:
+                    # 确保图像是RGB模式
+                    filter_stack = FilterStack(image_ops.ensure_rgb_mode(self.original_image))
+                    accounting.track('previews', filter_stack,
+                                     lambda stack: sum(image_nbytes(r) for r in stack.results[1:]))
                 
-                # 保存新滤镜
-                applied_filters.append(filter_type)
-                filtered_image = temp_img
+                # 只在上一步的结果上应用新滤镜
+                filtered_image = filter_stack.push(filter_type)
                 
                 # 更新预览
-                fd, temp_path = tempfile.mkstemp(suffix='.png')
-                os.close(fd)
-                filtered_image.save(temp_path, format='PNG')
-                preview.source = temp_path
-                preview.reload()
-                os.unlink(temp_path)
+                self.display_image(preview, filtered_image)
                 
                 # 更新滤镜标签
                 update_filter_label()
@@ -256,18 +471,33 @@ class ImageEditor(BoxLayout):
             except Exception as e:
                 print(f"Error applying filter: {e}")
         
+        def remove_last_filter(instance):
+            nonlocal filtered_image
+            if not filter_stack or not filter_stack.filters:
+                return
+            # 直接回到缓存的前一步结果
+            filter_stack.pop()
+            filtered_image = filter_stack.result if filter_stack.filters else None
+            update_filter_label()
+            self.display_image(preview, filtered_image or self.pil_image)
+        
         def clear_filters(instance):
-            nonlocal filtered_image, applied_filters
-            applied_filters.clear()
+            nonlocal filtered_image
+            if filter_stack:
+                filter_stack.clear()
             filtered_image = None
             update_filter_label()
             # 重置预览
-            preview.source = self.temp_file
-            preview.reload()
+            self.display_image(preview, self.document)
         
+        @traced('filters')
         def apply_changes(instance):
             nonlocal filtered_image
-            if filtered_image:
+            if filtered_image and self.selection is not None:
+                # 有选区时只在选区内重新计算滤镜
+                self.apply_operation('filters', source=self.original_image,
+                                     names=list(filter_stack.filters))
+            elif filtered_image:
                 self.save_state()
                 self.pil_image = filtered_image
                 self.update_image_display()
@@ -278,8 +508,7 @@ class ImageEditor(BoxLayout):
                 self.pil_image = self.original_image.copy()
                 self.update_image_display()
                 # 重置预览
-                preview.source = self.temp_file
-                preview.reload()
+                self.display_image(preview, self.document)
         
         # 绑定滤镜按钮事件
         blur_button.bind(on_press=lambda x: apply_filter('blur'))
@@ -290,24 +519,39 @@ class ImageEditor(BoxLayout):
         apply_button.bind(on_press=apply_changes)
         reset_button.bind(on_press=reset_changes)
         clear_filters_button.bind(on_press=clear_filters)
+        remove_filter_button.bind(on_press=remove_last_filter)
         cancel_button.bind(on_press=popup.dismiss)
-        popup.open()
-
-    def ensure_rgb_mode(self, image):
-        """确保图片是RGB模式"""
-        if image.mode not in ('RGB', 'RGBA'):
-            return image.convert('RGB')
-        return image
+        
+        def on_open():
+            nonlocal filter_stack, filtered_image
+            # 每次打开都从当前图像重新开始
+            filter_stack = None
+            filtered_image = None
+            update_filter_label()
+            self.display_image(preview, self.document)
+        
+        return popup, on_open
 
     def show_file_chooser(self, instance):
+        self.open_dialog('file_chooser', self.build_file_chooser)
+
+    def build_file_chooser(self):
         content = BoxLayout(orientation='vertical')
         
         # 创建水平布局来放置文件选择器和预览
         main_layout = BoxLayout(orientation='horizontal', spacing=10)
         
+        # 文件浏览器和缩略图目录只在第一次打开时导入和创建
+        from browser import FileBrowser
+        from catalog import CatalogIndexer, ThumbnailCatalog
+        self.catalog = ThumbnailCatalog()
+        self.catalog_indexer = CatalogIndexer(self.catalog)
+        
         # 文件选择器
-        file_chooser = FileChooserListView(path='.')
+        file_chooser = FileBrowser(path='.')
         file_chooser.bind(selection=self.on_file_selected)
+        # 在后台为当前文件夹预先生成缩略图，进入其他文件夹时重新开始
+        file_chooser.bind(path=lambda instance, path: self.catalog_indexer.index(path))
         
         # 预览区域
         preview_layout = BoxLayout(orientation='vertical', size_hint_x=0.4)
@@ -338,20 +582,30 @@ class ImageEditor(BoxLayout):
         
         select_button.bind(on_press=select_file)
         cancel_button.bind(on_press=popup.dismiss)
-        popup.open()
+        popup.bind(on_dismiss=lambda x: (self.catalog_indexer.cancel(), file_chooser.cancel()))
+        
+        def on_open():
+            # 关闭时读取已停止，重新读取上次所在的文件夹
+            self.preview_image.texture = None
+            file_chooser.rescan()
+            self.catalog_indexer.index(file_chooser.path)
+        
+        return popup, on_open
 
     def show_save_dialog(self, instance):
-        if not self.pil_image:
+        if not self.has_image:
             return
-            
+        self.open_dialog('save', self.build_save_dialog)
+
+    def build_save_dialog(self):
         content = BoxLayout(orientation='vertical')
         
         # 创建水平布局来放置文件选择器和预览
         main_layout = BoxLayout(orientation='horizontal', spacing=10)
         
         # 文件选择器
-        file_chooser = FileChooserListView(path='.')
-        file_chooser.path = os.path.expanduser('~')  # 默认打开用户主目录
+        from browser import FileBrowser
+        file_chooser = FileBrowser(path=os.path.expanduser('~'))  # 默认打开用户主目录
         
         # 预览区域
         preview_layout = BoxLayout(orientation='vertical', size_hint_x=0.4)
@@ -360,11 +614,6 @@ class ImageEditor(BoxLayout):
         preview_layout.add_widget(preview_label)
         preview_layout.add_widget(save_preview)
         
-        # 显示当前编辑后的图片预览
-        if self.temp_file:
-            save_preview.source = self.temp_file
-            save_preview.reload()
-        
         main_layout.add_widget(file_chooser)
         main_layout.add_widget(preview_layout)
         content.add_widget(main_layout)
@@ -372,12 +621,69 @@ class ImageEditor(BoxLayout):
         # 文件名输入区域
         filename_layout = BoxLayout(size_hint_y=None, height=50)
         filename_label = Button(text='Filename:', size_hint_x=0.3)
-        filename_input = Button(text=f'edited_image_{datetime.now().strftime("%Y%m%d_%H%M%S")}.png', 
-                              size_hint_x=0.7)
+        filename_input = TextInput(multiline=False, size_hint_x=0.7)
         filename_layout.add_widget(filename_label)
         filename_layout.add_widget(filename_input)
         content.add_widget(filename_layout)
         
+        # 格式和编码参数
+        format_layout = BoxLayout(size_hint_y=None, height=50)
+        format_layout.add_widget(Label(text='Format:', size_hint_x=0.3))
+        format_spinner = Spinner(text='PNG', values=list(FORMAT_EXTENSIONS), size_hint_x=0.7)
+        format_layout.add_widget(format_spinner)
+        content.add_widget(format_layout)
+        
+        options_layout = BoxLayout(size_hint_y=None, height=50)
+        content.add_widget(options_layout)
+        encoder_settings = {}  # 参数名 -> 读取控件当前值的函数
+        
+        def add_slider(name, text, min_value, max_value, value):
+            label = Label(text=f'{text}: {value}', size_hint_x=0.2)
+            slider = Slider(min=min_value, max=max_value, value=value, step=1)
+            slider.bind(value=lambda instance, v: setattr(label, 'text', f'{text}: {int(v)}'))
+            options_layout.add_widget(label)
+            options_layout.add_widget(slider)
+            encoder_settings[name] = lambda: int(slider.value)
+        
+        def add_choice(name, values, value):
+            spinner = Spinner(text=value, values=values)
+            options_layout.add_widget(spinner)
+            encoder_settings[name] = lambda: spinner.text
+        
+        def add_toggle(name, text, value):
+            toggle = ToggleButton(text=text, state='down' if value else 'normal', size_hint_x=0.3)
+            options_layout.add_widget(toggle)
+            encoder_settings[name] = lambda: toggle.state == 'down'
+        
+        def build_options(fmt):
+            options_layout.clear_widgets()
+            encoder_settings.clear()
+            defaults = ENCODER_DEFAULTS[fmt]
+            if fmt == 'PNG':
+                add_slider('compress_level', 'Compression', 0, 9, defaults['compress_level'])
+            elif fmt == 'JPEG':
+                add_slider('quality', 'Quality', 1, 95, defaults['quality'])
+                add_choice('subsampling', JPEG_SUBSAMPLING, defaults['subsampling'])
+                add_toggle('progressive', 'Progressive', defaults['progressive'])
+                add_toggle('optimize', 'Optimize', defaults['optimize'])
+            elif fmt == 'WEBP':
+                add_slider('quality', 'Quality', 1, 100, defaults['quality'])
+                add_slider('method', 'Method', 0, 6, defaults['method'])
+            elif fmt == 'TIFF':
+                add_choice('compression', TIFF_COMPRESSION, defaults['compression'])
+            else:
+                options_layout.add_widget(Label(text='No encoder options'))
+        
+        def on_format(instance, fmt):
+            # 文件名的扩展名跟随所选格式
+            name = os.path.splitext(filename_input.text)[0]
+            if format_for_path(filename_input.text) != fmt:
+                filename_input.text = name + FORMAT_EXTENSIONS[fmt]
+            build_options(fmt)
+        
+        format_spinner.bind(text=on_format)
+        build_options(format_spinner.text)
+        
         # 按钮区域
         buttons = BoxLayout(size_hint_y=None, height=50)
         cancel_button = Button(text='Cancel')
@@ -391,88 +697,265 @@ class ImageEditor(BoxLayout):
         
         def save_file(instance):
             save_path = os.path.join(file_chooser.path, filename_input.text)
+            options = {name: read() for name, read in encoder_settings.items()}
+            # 文档不会被修改，直接作为快照交给后台线程，编辑可以继续进行
+            self.save_in_background(self.document, save_path, format_spinner.text, options)
+            popup.dismiss()
+        
+        save_button.bind(on_press=save_file)
+        cancel_button.bind(on_press=popup.dismiss)
+        popup.bind(on_dismiss=lambda x: file_chooser.cancel())
+        
+        def on_open():
+            # 每次打开生成新的文件名，格式和编码参数保留上次的选择
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename_input.text = f'edited_image_{timestamp}{FORMAT_EXTENSIONS[format_spinner.text]}'
+            # 显示当前编辑后的图片预览
+            self.display_image(save_preview, self.document)
+            file_chooser.rescan()
+        
+        return popup, on_open
+
+    def save_in_background(self, document, path, fmt, options):
+        """在后台线程中编码并保存图像，进度显示在状态栏"""
+        name = os.path.basename(path)
+        last_update = [0.0]
+        
+        def progress(stage, written):
+            # 分块写入时回调很频繁，状态栏最多每0.1秒更新一次
+            now = time.monotonic()
+            if stage == 'encoding' and now - last_update[0] < 0.1:
+                return
+            last_update[0] = now
+            message = f'Saving {name}: {stage} ({written / (1024 * 1024):.1f} MB)'
+            Clock.schedule_once(lambda dt: setattr(self.status_label, 'text', message))
+        
+        def run():
             try:
-                self.pil_image.save(save_path)
-                popup.dismiss()
+                export_image(document, path, fmt, options, progress)
+                message = f'Saved {name}'
             except Exception as e:
                 print(f"Error saving image: {e}")
+                message = f'Error saving {name}: {e}'
+            Clock.schedule_once(lambda dt: setattr(self.status_label, 'text', message))
         
-        save_button.bind(on_press=save_file)
-        cancel_button.bind(on_press=popup.dismiss)
-        popup.open()
+        threading.Thread(target=run, daemon=True).start()
 
     def on_file_selected(self, instance, value):
         if value:
-            try:
-                # 清理旧的预览文件
-                if self.preview_temp_file and os.path.exists(self.preview_temp_file):
-                    os.unlink(self.preview_temp_file)
-                
-                # 创建新的预览
-                preview_img = PILImage.open(value[0])
-                # 调整预览图片大小
-                max_size = (200, 200)
-                preview_img.thumbnail(max_size, PILImage.Resampling.LANCZOS)
-                
-                # 保存预览图片
-                fd, self.preview_temp_file = tempfile.mkstemp(suffix='.png')
-                os.close(fd)
-                preview_img.save(self.preview_temp_file, format='PNG')
-                
-                # 显示预览
-                self.preview_image.source = self.preview_temp_file
-                self.preview_image.reload()
-            except Exception as e:
-                print(f"Error creating preview: {e}")
+            path = value[0]
+            
+            def render():
+                # 缩略图目录中有效的记录直接读取，没有时缩小解码并保存
+                return self.catalog.thumbnail(path)
+            
+            # 在后台读取，快速切换选择时只显示最后一个文件
+            self.schedule_preview(self.preview_image, render)
 
     def load_image(self, filename):
-        try:
-            self.pil_image = PILImage.open(filename)
+        """先显示缩小解码的图像，全分辨率图像在后台解码完成后替换，期间禁止编辑"""
+        def on_preview(image):
+            self.display_image(self.image_widget, image)
+        
+        def on_full(document):
+            self.set_selection(None)
+            self.document = document
             self.current_image = filename
+            self.set_editing_enabled(True)
             self.update_image_display()
-        except Exception as e:
+        
+        def on_error(e):
             print(f"Error loading image: {e}")
+            self.set_editing_enabled(True)
+            self.update_image_display()
+        
+        self.set_editing_enabled(False)
+        self.image_loader.load(filename, (Window.width, Window.height),
+                               on_preview, on_full, on_error)
+
+    def on_selection_mode(self, instance, text):
+        """切换选区的绘制方式，选择 No Selection 时清除选区"""
+        self.selection_mode = None if text == SELECTION_MODES[0] else text
+        if self.selection_mode is None:
+            self.set_selection(None)
+
+    def set_selection(self, selection):
+        self.selection = selection
+        self.draw_selection()
+        if selection is not None:
+            left, top, right, bottom = selection.bbox
+            self.status_label.text = f'Selection: {right - left} x {bottom - top} at ({left}, {top})'
+        elif self.status_label.text.startswith('Selection:'):
+            self.status_label.text = ''
+
+    def widget_to_image(self, pos):
+        """主视图中的坐标 -> 图像的像素坐标（可能在图像范围外）"""
+        widget = self.image_widget
+        display_width, display_height = widget.norm_image_size
+        width, height = self.image_size
+        left = widget.center_x - display_width / 2
+        top = widget.center_y + display_height / 2
+        return ((pos[0] - left) * width / max(display_width, 1),
+                (top - pos[1]) * height / max(display_height, 1))
+
+    def image_to_widget(self, point):
+        """图像的像素坐标 -> 主视图中的坐标"""
+        widget = self.image_widget
+        display_width, display_height = widget.norm_image_size
+        width, height = self.image_size
+        left = widget.center_x - display_width / 2
+        top = widget.center_y + display_height / 2
+        return (left + point[0] * display_width / width, top - point[1] * display_height / height)
+
+    def draw_selection(self, points=None, rectangle=False):
+        """在主视图上画出选区，或正在绘制的轮廓（图像坐标，rectangle 时为两个角点）"""
+        if points is None and self.selection is not None:
+            points = self.selection.outline
+        if not points or not self.has_image:
+            self.selection_line.points = []
+            return
+        if rectangle:
+            (x0, y0), (x1, y1) = points[0], points[-1]
+            points = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+        self.selection_line.points = [value for point in points
+                                      for value in self.image_to_widget(point)]
+
+    def on_image_touch_down(self, widget, touch):
+        """选区模式下在主视图上按下开始绘制新的选区"""
+        if (self.selection_mode is None or not self.has_image or self.loading
+                or not widget.collide_point(*touch.pos)):
+            return False
+        touch.grab(widget)
+        touch.ud['selection'] = [self.widget_to_image(touch.pos)]
+        return True
+
+    def on_image_touch_move(self, widget, touch):
+        if touch.grab_current is not widget or 'selection' not in touch.ud:
+            return False
+        points = touch.ud['selection']
+        point = self.widget_to_image(touch.pos)
+        if self.selection_mode == 'Rectangle':
+            # 矩形只需要起点和当前点
+            points[1:] = [point]
+        else:
+            points.append(point)
+        self.draw_selection(points, rectangle=self.selection_mode == 'Rectangle')
+        return True
+
+    def on_image_touch_up(self, widget, touch):
+        if touch.grab_current is not widget or 'selection' not in touch.ud:
+            return False
+        touch.ungrab(widget)
+        points = touch.ud.pop('selection')
+        try:
+            if self.selection_mode == 'Rectangle':
+                selection = Selection.rectangle(self.image_size, *points[0], *points[-1])
+            else:
+                selection = Selection.freehand(self.image_size, points)
+        except ValueError:
+            # 单击（没有拖动）清除选区
+            selection = None
+        self.set_selection(selection)
+        return True
+
+    def apply_operation(self, name, source=None, record=True, **params):
+        """执行 image_ops 中名为 name 的操作并替换当前图像，成功时返回True
+
+        source 默认为当前图像。有选区时只在选区外接矩形外扩核半径的范围内
+        计算，再按选区合成到 source 上；撤销记录也只保存这个矩形（source 不是
+        当前图像时选区外的像素也会改变，仍保存整幅图像）。
+        """
+        try:
+            func = image_ops.OPERATIONS[name]
+            if self.selection is None:
+                if record:
+                    self.save_state()
+                self.pil_image = func(self.document if source is None else source, **params)
+            else:
+                halo = image_ops.region_halo(name, **params)
+                result = self.selection.apply(self.document if source is None else source,
+                                              lambda region: func(region, **params), halo)
+                if record:
+                    self.save_state(self.selection.bbox if source is None else None)
+                self.document = result
+        except Exception as e:
+            print(f"Error applying {name}: {e}")
+            return False
+        self.update_image_display()
+        return True
 
     def update_image_display(self):
-        if self.pil_image:
-            # 将PIL图像转换为临时文件
-            if self.temp_file:
-                try:
-                    os.unlink(self.temp_file)
-                except:
-                    pass
-            
-            # 创建临时文件
-            fd, self.temp_file = tempfile.mkstemp(suffix='.png')
-            os.close(fd)
-            
-            # 保存图像到临时文件
-            self.pil_image.save(self.temp_file, format='PNG')
-            
+        if self.has_image:
+            # 撤销到不同尺寸的图像时选区不再有效
+            if self.selection is not None and self.selection.image_size != self.image_size:
+                self.set_selection(None)
             # 更新图像显示
-            self.image_widget.source = self.temp_file
-            self.image_widget.reload()
+            self.display_image(self.image_widget, self.current_view())
+
+    @traced('display', 'phase')
+    def display_image(self, widget, image):
+        """将图像的像素直接上传到控件的纹理（不经过临时文件和PNG编码）
+
+        image 可以是图像文档（直接上传像素数组，BGR顺序也不需要转换）或PIL图像。
+        """
+        if isinstance(image, ImageDocument):
+            size = image.size
+            colorfmt = TEXTURE_COLORFMTS[image.order]
+            buffer = image.pixels.tobytes()
+        else:
+            if image.mode not in TEXTURE_COLORFMTS:
+                has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+                image = image.convert('RGBA' if has_alpha else 'RGB')
+            size = image.size
+            colorfmt = TEXTURE_COLORFMTS[image.mode]
+            buffer = image.tobytes()
+        
+        # 尺寸和格式不变时复用控件已有的纹理
+        texture = widget.texture
+        if (texture is None or tuple(texture.size) != size
+                or texture.colorfmt != colorfmt):
+            texture = Texture.create(size=size, colorfmt=colorfmt)
+            # 像素的行顺序是自上而下，纹理是自下而上
+            texture.flip_vertical()
+        texture.blit_buffer(buffer, colorfmt=colorfmt, bufferfmt='ubyte')
+        
+        if widget.texture is texture:
+            widget.canvas.ask_update()
+        else:
+            widget.texture = texture
+
+    def schedule_preview(self, preview, render):
+        """在后台线程中渲染预览，只显示最新一次请求的结果"""
+        self.preview_scheduler.submit(render, lambda image: self.display_image(preview, image))
+
+    def create_preview_proxy(self, source=None):
+        """为滑块对话框创建预览代理图像（尺寸与弹窗中的预览区域相当）"""
+        if source is None:
+            source = self.original_image if self.original_image else self.pil_image
+        proxy = PreviewProxy(source, (Window.width * 0.8, Window.height * 0.8))
+        if proxy.image is not source:
+            accounting.track('previews', proxy.image)
+        return proxy
 
     def rotate_image(self, instance):
-        if self.pil_image:
-            self.save_state()
-            self.pil_image = self.pil_image.rotate(90, expand=True)
-            self.update_image_display()
+        # 逆时针旋转90度，与 rotate(90, expand=True) 结果相同但不经过重采样
+        self.transpose_image(PILImage.Transpose.ROTATE_90)
 
+    @traced('grayscale')
     def grayscale_image(self, instance):
-        if self.pil_image:
-            self.save_state()
-            self.pil_image = self.pil_image.convert('L')
-            self.update_image_display()
+        if self.has_image:
+            self.apply_operation('grayscale')
 
     def show_brightness_dialog(self, instance):
-        if not self.pil_image:
+        if not self.has_image:
             return
-            
+        self.open_dialog('brightness', self.build_brightness_dialog)
+
+    def build_brightness_dialog(self):
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
         # 预览区域
-        preview = Image(source=self.temp_file)
+        preview = Image()
         content.add_widget(preview)
         
         # 亮度滑块
@@ -496,31 +979,30 @@ class ImageEditor(BoxLayout):
         
         popup = Popup(title='Adjust Brightness', content=content, size_hint=(0.8, 0.8))
         
+        # 预览在缩小的代理图像上计算，Apply时才处理全分辨率原图
+        proxy = None  # 每次打开时按当前图像创建
+        popup.bind(on_dismiss=lambda x: self.preview_scheduler.cancel())
+        
         def update_preview(instance, value):
+            if proxy is None:
+                # 打开前恢复默认值时不渲染预览
+                return
             if not self.original_image:
                 self.original_image = self.pil_image.copy()
-            # 确保图片是RGB模式
-            rgb_image = self.ensure_rgb_mode(self.original_image)
-            enhancer = ImageEnhance.Brightness(rgb_image)
-            temp_img = enhancer.enhance(value)
             
-            # 更新预览
-            fd, temp_path = tempfile.mkstemp(suffix='.png')
-            os.close(fd)
-            temp_img.save(temp_path, format='PNG')
-            preview.source = temp_path
-            preview.reload()
-            os.unlink(temp_path)
+            def render():
+                return image_ops.brightness(proxy.image, value)
+            
+            # 在后台线程渲染并更新预览
+            self.schedule_preview(preview, render)
         
+        @traced('brightness')
         def apply_changes(instance):
             if not self.original_image:
                 self.original_image = self.pil_image.copy()
-            # 确保图片是RGB模式
-            rgb_image = self.ensure_rgb_mode(self.original_image)
-            enhancer = ImageEnhance.Brightness(rgb_image)
-            self.pil_image = enhancer.enhance(brightness_slider.value)
-            self.update_image_display()
-            popup.dismiss()
+            if self.apply_operation('brightness', source=self.original_image, record=False,
+                                              factor=brightness_slider.value):
+                popup.dismiss()
         
         def reset_changes(instance):
             if self.original_image:
@@ -532,16 +1014,26 @@ class ImageEditor(BoxLayout):
         apply_button.bind(on_press=apply_changes)
         reset_button.bind(on_press=reset_changes)
         cancel_button.bind(on_press=popup.dismiss)
-        popup.open()
+        
+        def on_open():
+            nonlocal proxy
+            proxy = None
+            brightness_slider.value = 1.0
+            proxy = self.create_preview_proxy()
+            self.display_image(preview, self.document)
+        
+        return popup, on_open
 
     def show_contrast_dialog(self, instance):
-        if not self.pil_image:
+        if not self.has_image:
             return
-            
+        self.open_dialog('contrast', self.build_contrast_dialog)
+
+    def build_contrast_dialog(self):
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
         # 预览区域
-        preview = Image(source=self.temp_file)
+        preview = Image()
         content.add_widget(preview)
         
         # 对比度滑块
@@ -565,31 +1057,30 @@ class ImageEditor(BoxLayout):
         
         popup = Popup(title='Adjust Contrast', content=content, size_hint=(0.8, 0.8))
         
+        # 预览在缩小的代理图像上计算，Apply时才处理全分辨率原图
+        proxy = None  # 每次打开时按当前图像创建
+        popup.bind(on_dismiss=lambda x: self.preview_scheduler.cancel())
+        
         def update_preview(instance, value):
+            if proxy is None:
+                # 打开前恢复默认值时不渲染预览
+                return
             if not self.original_image:
                 self.original_image = self.pil_image.copy()
-            # 确保图片是RGB模式
-            rgb_image = self.ensure_rgb_mode(self.original_image)
-            enhancer = ImageEnhance.Contrast(rgb_image)
-            temp_img = enhancer.enhance(value)
             
-            # 更新预览
-            fd, temp_path = tempfile.mkstemp(suffix='.png')
-            os.close(fd)
-            temp_img.save(temp_path, format='PNG')
-            preview.source = temp_path
-            preview.reload()
-            os.unlink(temp_path)
+            def render():
+                return image_ops.contrast(proxy.image, value)
+            
+            # 在后台线程渲染并更新预览
+            self.schedule_preview(preview, render)
         
+        @traced('contrast')
         def apply_changes(instance):
             if not self.original_image:
                 self.original_image = self.pil_image.copy()
-            # 确保图片是RGB模式
-            rgb_image = self.ensure_rgb_mode(self.original_image)
-            enhancer = ImageEnhance.Contrast(rgb_image)
-            self.pil_image = enhancer.enhance(contrast_slider.value)
-            self.update_image_display()
-            popup.dismiss()
+            if self.apply_operation('contrast', source=self.original_image, record=False,
+                                            factor=contrast_slider.value):
+                popup.dismiss()
         
         def reset_changes(instance):
             if self.original_image:
@@ -601,16 +1092,26 @@ class ImageEditor(BoxLayout):
         apply_button.bind(on_press=apply_changes)
         reset_button.bind(on_press=reset_changes)
         cancel_button.bind(on_press=popup.dismiss)
-        popup.open()
+        
+        def on_open():
+            nonlocal proxy
+            proxy = None
+            contrast_slider.value = 1.0
+            proxy = self.create_preview_proxy()
+            self.display_image(preview, self.document)
+        
+        return popup, on_open
 
     def show_crop_dialog(self, instance):
-        if not self.pil_image:
+        if not self.has_image:
             return
-            
+        self.open_dialog('crop', self.build_crop_dialog)
+
+    def build_crop_dialog(self):
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
         # 预览区域
-        preview = Image(source=self.temp_file)
+        preview = Image()
         content.add_widget(preview)
         
         # 裁剪尺寸输入区域
@@ -619,9 +1120,9 @@ class ImageEditor(BoxLayout):
         # 起始点
         start_layout = BoxLayout(size_hint_x=0.5)
         start_x_label = Label(text='Start X:', size_hint_x=0.3)
-        start_x_input = TextInput(text='0', multiline=False, size_hint_x=0.7)
+        start_x_input = TextInput(multiline=False, size_hint_x=0.7)
         start_y_label = Label(text='Start Y:', size_hint_x=0.3)
-        start_y_input = TextInput(text='0', multiline=False, size_hint_x=0.7)
+        start_y_input = TextInput(multiline=False, size_hint_x=0.7)
         start_layout.add_widget(start_x_label)
         start_layout.add_widget(start_x_input)
         start_layout.add_widget(start_y_label)
@@ -630,9 +1131,9 @@ class ImageEditor(BoxLayout):
         # 结束点
         end_layout = BoxLayout(size_hint_x=0.5)
         end_x_label = Label(text='End X:', size_hint_x=0.3)
-        end_x_input = TextInput(text=str(self.pil_image.width), multiline=False, size_hint_x=0.7)
+        end_x_input = TextInput(multiline=False, size_hint_x=0.7)
         end_y_label = Label(text='End Y:', size_hint_x=0.3)
-        end_y_input = TextInput(text=str(self.pil_image.height), multiline=False, size_hint_x=0.7)
+        end_y_input = TextInput(multiline=False, size_hint_x=0.7)
         end_layout.add_widget(end_x_label)
         end_layout.add_widget(end_x_input)
         end_layout.add_widget(end_y_label)
@@ -653,50 +1154,65 @@ class ImageEditor(BoxLayout):
         
         popup = Popup(title='Crop Image', content=content, size_hint=(0.8, 0.8))
         
+        @traced('crop')
         def apply_crop(instance):
             try:
+                width, height = self.image_size
                 start_x = int(start_x_input.text)
                 start_y = int(start_y_input.text)
                 end_x = int(end_x_input.text)
                 end_y = int(end_y_input.text)
                 
                 # 确保坐标在有效范围内
-                start_x = max(0, min(start_x, self.pil_image.width))
-                start_y = max(0, min(start_y, self.pil_image.height))
-                end_x = max(0, min(end_x, self.pil_image.width))
-                end_y = max(0, min(end_y, self.pil_image.height))
+                start_x = max(0, min(start_x, width))
+                start_y = max(0, min(start_y, height))
+                end_x = max(0, min(end_x, width))
+                end_y = max(0, min(end_y, height))
                 
                 # 确保结束坐标大于开始坐标
                 if end_x <= start_x or end_y <= start_y:
                     print("Invalid crop coordinates")
                     return
                 
-                self.pil_image = self.pil_image.crop((start_x, start_y, end_x, end_y))
-                self.update_image_display()
+                # 尺寸改变后选区记录无法贴回，保存完整的快照
+                self.save_state()
+                self.set_selection(None)
+                self.transform(lambda geometry: geometry.crop(start_x, start_y, end_x, end_y))
                 popup.dismiss()
             except ValueError:
                 print("Invalid coordinates")
         
         apply_button.bind(on_press=apply_crop)
         cancel_button.bind(on_press=popup.dismiss)
-        popup.open()
+        
+        def on_open():
+            # 默认裁剪范围是当前的整幅图像
+            start_x_input.text = '0'
+            start_y_input.text = '0'
+            end_x_input.text = str(self.image_size[0])
+            end_y_input.text = str(self.image_size[1])
+            self.display_image(preview, self.current_view())
+        
+        return popup, on_open
 
     def show_resize_dialog(self, instance):
-        if not self.pil_image:
+        if not self.has_image:
             return
-            
+        self.open_dialog('resize', self.build_resize_dialog)
+
+    def build_resize_dialog(self):
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
         # 预览区域
-        preview = Image(source=self.temp_file)
+        preview = Image()
         content.add_widget(preview)
         
         # 尺寸输入区域
         size_layout = BoxLayout(size_hint_y=None, height=50)
         width_label = Label(text='Width:', size_hint_x=0.2)
-        width_input = TextInput(text=str(self.pil_image.width), multiline=False, size_hint_x=0.3)
+        width_input = TextInput(multiline=False, size_hint_x=0.3)
         height_label = Label(text='Height:', size_hint_x=0.2)
-        height_input = TextInput(text=str(self.pil_image.height), multiline=False, size_hint_x=0.3)
+        height_input = TextInput(multiline=False, size_hint_x=0.3)
         
         size_layout.add_widget(width_label)
         size_layout.add_widget(width_input)
@@ -722,27 +1238,29 @@ class ImageEditor(BoxLayout):
         content.add_widget(buttons)
         
         popup = Popup(title='Resize Image', content=content, size_hint=(0.8, 0.8))
+        filling = False  # 打开时填入当前尺寸，此时不按比例联动
         
         def update_height(instance, value):
-            if ratio_button.text == 'Yes':
+            if ratio_button.text == 'Yes' and not filling:
                 try:
                     width = int(value)
-                    ratio = self.pil_image.width / self.pil_image.height
+                    ratio = self.image_size[0] / self.image_size[1]
                     height = int(width / ratio)
                     height_input.text = str(height)
                 except ValueError:
                     pass
         
         def update_width(instance, value):
-            if ratio_button.text == 'Yes':
+            if ratio_button.text == 'Yes' and not filling:
                 try:
                     height = int(value)
-                    ratio = self.pil_image.width / self.pil_image.height
+                    ratio = self.image_size[0] / self.image_size[1]
                     width = int(height * ratio)
                     width_input.text = str(width)
                 except ValueError:
                     pass
         
+        @traced('resize')
         def apply_resize(instance):
             try:
                 width = int(width_input.text)
@@ -751,8 +1269,9 @@ class ImageEditor(BoxLayout):
                     print("Invalid dimensions")
                     return
                 
-                self.pil_image = self.pil_image.resize((width, height), PILImage.Resampling.LANCZOS)
-                self.update_image_display()
+                self.save_state()
+                self.set_selection(None)
+                self.transform(lambda geometry: geometry.resize(width, height))
                 popup.dismiss()
             except ValueError:
                 print("Invalid dimensions")
@@ -765,90 +1284,311 @@ class ImageEditor(BoxLayout):
         ratio_button.bind(on_press=toggle_ratio)
         apply_button.bind(on_press=apply_resize)
         cancel_button.bind(on_press=popup.dismiss)
-        popup.open()
+        
+        def on_open():
+            nonlocal filling
+            filling = True
+            width_input.text = str(self.image_size[0])
+            height_input.text = str(self.image_size[1])
+            filling = False
+            self.display_image(preview, self.current_view())
+        
+        return popup, on_open
 
-    def apply_cartoon(self, instance):
-        """应用卡通效果"""
-        if not self.pil_image:
+    def show_cartoon_dialog(self, instance):
+        """显示卡通效果对话框"""
+        if not self.has_image:
             return
+        self.open_dialog('cartoon', self.build_cartoon_dialog)
+
+    def build_cartoon_dialog(self):
+        content = BoxLayout(orientation='vertical', padding=10, spacing=10)
+        
+        # 预览区域
+        preview = Image()
+        content.add_widget(preview)
+        
+        # 模式选择：Quality 在全分辨率上计算，Fast 在缩小的图像金字塔上计算
+        mode_layout = BoxLayout(size_hint_y=None, height=50)
+        mode_label = Label(text='Mode:', size_hint_x=0.3)
+        mode_spinner = Spinner(text='Quality', values=('Quality', 'Fast'), size_hint_x=0.7)
+        mode_layout.add_widget(mode_label)
+        mode_layout.add_widget(mode_spinner)
+        content.add_widget(mode_layout)
+        
+        # 卡通效果参数滑块
+        sliders_layout = BoxLayout(orientation='vertical', size_hint_y=None, height=150)
+        sliders = {}
+        defaults = {}
+        for name, text, low, high, default in [
+                ('edge_thickness', 'Edge Thickness', 1, 5, image_ops.CARTOON_EDGE_THICKNESS),
+                ('color_levels', 'Color Levels', 0, 16, image_ops.CARTOON_COLOR_LEVELS),
+                ('smoothing', 'Smoothing', 1, 20, image_ops.CARTOON_SMOOTHING)]:
+            slider_layout = BoxLayout(size_hint_y=None, height=50)
+            label = Label(text=f'{text}: {default}', size_hint_x=0.3)
+            sliders[name] = Slider(min=low, max=high, value=default, step=1, size_hint_x=0.7)
+            sliders[name].bind(value=lambda instance, v, label=label, text=text:
+                               setattr(label, 'text', f'{text}: {int(v)}'))
+            defaults[name] = default
+            slider_layout.add_widget(label)
+            slider_layout.add_widget(sliders[name])
+            sliders_layout.add_widget(slider_layout)
+        content.add_widget(sliders_layout)
+        
+        # 按钮区域
+        buttons = BoxLayout(size_hint_y=None, height=50)
+        cancel_button = Button(text='Cancel')
+        apply_button = Button(text='Apply')
+        reset_button = Button(text='Reset')
+        
+        buttons.add_widget(cancel_button)
+        buttons.add_widget(reset_button)
+        buttons.add_widget(apply_button)
+        content.add_widget(buttons)
+        
+        popup = Popup(title='Cartoon', content=content, size_hint=(0.8, 0.8))
+        
+        # 预览在缩小的代理图像上计算，Apply时才处理全分辨率图像
+        proxy = None  # 每次打开时按当前图像创建
+        popup.bind(on_dismiss=lambda x: self.preview_scheduler.cancel())
+        
+        def current_params():
+            params = {name: int(slider.value) for name, slider in sliders.items()}
+            params['mode'] = mode_spinner.text.lower()
+            return params
+        
+        def update_preview(instance, value):
+            if proxy is None:
+                # 打开前恢复默认值时不渲染预览
+                return
+            params = current_params()
+            # 边缘粗细按代理图像的缩放比例换算，使预览与最终效果一致
+            params['edge_thickness'] = max(1, round(proxy.scale_length(params['edge_thickness'])))
             
-        self.save_state()
-        # 转换为OpenCV格式
-        img = self.pil_to_cv2(self.pil_image)
-        
-        # 应用卡通效果
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        gray = cv2.medianBlur(gray, 5)
-        edges = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
-                                    cv2.THRESH_BINARY, 9, 9)
-        color = cv2.bilateralFilter(img, 9, 300, 300)
-        cartoon = cv2.bitwise_and(color, color, mask=edges)
-        
-        # 转回PIL格式
-        self.pil_image = self.cv2_to_pil(cartoon)
-        self.update_image_display()
+            def render():
+                return image_ops.cartoon(proxy.image, **params)
+            
+            # 在后台线程渲染并更新预览
+            self.schedule_preview(preview, render)
+        
+        @traced('cartoon')
+        def apply_changes(instance):
+            if self.apply_operation('cartoon', **current_params()):
+                popup.dismiss()
+        
+        def reset_changes(instance):
+            mode_spinner.text = 'Quality'
+            for name, slider in sliders.items():
+                slider.value = defaults[name]
+        
+        mode_spinner.bind(text=update_preview)
+        for slider in sliders.values():
+            slider.bind(value=update_preview)
+        apply_button.bind(on_press=apply_changes)
+        reset_button.bind(on_press=reset_changes)
+        cancel_button.bind(on_press=popup.dismiss)
+        
+        def on_open():
+            nonlocal proxy
+            proxy = None
+            reset_changes(None)
+            proxy = self.create_preview_proxy(self.pil_image)
+            self.display_image(preview, self.document)
+            # 打开时按默认参数显示一次预览
+            update_preview(None, None)
+        
+        return popup, on_open
 
+    @traced('sketch')
     def apply_sketch(self, instance):
         """应用素描效果"""
-        if not self.pil_image:
+        if not self.has_image:
             return
             
-        self.save_state()
-        # 转换为OpenCV格式
-        img = self.pil_to_cv2(self.pil_image)
-        
-        # 应用素描效果
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        inv = 255 - gray
-        blur = cv2.GaussianBlur(inv, (21, 21), 0)
-        sketch = cv2.divide(gray, 255 - blur, scale=256)
-        
-        # 转回PIL格式
-        self.pil_image = self.cv2_to_pil(cv2.cvtColor(sketch, cv2.COLOR_GRAY2BGR))
-        self.update_image_display()
+        self.apply_operation('sketch')
 
+    @traced('edge')
     def apply_edge(self, instance):
         """应用边缘检测"""
-        if not self.pil_image:
+        if not self.has_image:
             return
             
-        self.save_state()
-        # 转换为OpenCV格式
-        img = self.pil_to_cv2(self.pil_image)
-        
-        # 应用边缘检测
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        edges = cv2.Canny(gray, 100, 200)
-        
-        # 转回PIL格式
-        self.pil_image = self.cv2_to_pil(cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR))
-        self.update_image_display()
+        self.apply_operation('edge')
 
-    def apply_denoise(self, instance):
-        """应用降噪"""
-        if not self.pil_image:
+    def show_denoise_dialog(self, instance):
+        """显示降噪对话框"""
+        if not self.has_image:
             return
+        self.open_dialog('denoise', self.build_denoise_dialog)
+
+    def build_denoise_dialog(self):
+        content = BoxLayout(orientation='vertical', padding=10, spacing=10)
+        
+        # 预览区域（原分辨率的中心局部，降噪效果在缩小的图像上看不准）
+        preview = Image()
+        content.add_widget(preview)
+        
+        # 降噪参数滑块
+        sliders_layout = BoxLayout(orientation='vertical', size_hint_y=None, height=150)
+        sliders = {}
+        defaults = {}
+        for name, text, low, high, step, default in [
+                ('strength', 'Strength', 1, 30, 1, image_ops.DENOISE_STRENGTH),
+                ('patch_size', 'Patch Size', 3, 11, 2, image_ops.DENOISE_PATCH_SIZE),
+                ('search_window', 'Search Window', 7, 35, 2, image_ops.DENOISE_SEARCH_WINDOW)]:
+            slider_layout = BoxLayout(size_hint_y=None, height=50)
+            label = Label(text=f'{text}: {default}', size_hint_x=0.3)
+            sliders[name] = Slider(min=low, max=high, value=default, step=step, size_hint_x=0.7)
+            sliders[name].bind(value=lambda instance, v, label=label, text=text:
+                               setattr(label, 'text', f'{text}: {int(v)}'))
+            defaults[name] = default
+            slider_layout.add_widget(label)
+            slider_layout.add_widget(sliders[name])
+            sliders_layout.add_widget(slider_layout)
+        content.add_widget(sliders_layout)
+        
+        # 全分辨率处理的进度
+        progress_layout = BoxLayout(size_hint_y=None, height=30)
+        progress_bar = ProgressBar(max=1.0, value=0, size_hint_x=0.7)
+        progress_label = Label(text='', size_hint_x=0.3)
+        progress_layout.add_widget(progress_bar)
+        progress_layout.add_widget(progress_label)
+        content.add_widget(progress_layout)
+        
+        # 按钮区域
+        buttons = BoxLayout(size_hint_y=None, height=50)
+        cancel_button = Button(text='Cancel')
+        apply_button = Button(text='Apply')
+        reset_button = Button(text='Reset')
+        
+        buttons.add_widget(cancel_button)
+        buttons.add_widget(reset_button)
+        buttons.add_widget(apply_button)
+        content.add_widget(buttons)
+        
+        popup = Popup(title='Denoise', content=content, size_hint=(0.8, 0.8))
+        
+        preview_crop = None  # 每次打开时从当前图像裁剪
+        job = None  # 正在进行的全分辨率处理的取消标志
+        
+        def current_params():
+            return {name: int(slider.value) for name, slider in sliders.items()}
+        
+        def set_running(running):
+            apply_button.disabled = running
+            reset_button.disabled = running
+            for slider in sliders.values():
+                slider.disabled = running
+        
+        def update_preview(instance, value):
+            if preview_crop is None:
+                # 打开前恢复默认值时不渲染预览
+                return
+            params = current_params()
+            
+            def render():
+                return image_ops.denoise(preview_crop, **params)
             
-        self.save_state()
-        # 转换为OpenCV格式
-        img = self.pil_to_cv2(self.pil_image)
+            # 在后台线程渲染并更新预览
+            self.schedule_preview(preview, render)
+        
+        def show_progress(done, total):
+            progress_bar.value = done / total
+            progress_label.text = f'Tile {done} / {total}'
+        
+        def finish(cancel, result, selection):
+            nonlocal job
+            if cancel.is_set():
+                # 已经取消（对话框已关闭）
+                return
+            job = None
+            set_running(False)
+            if result is None:
+                return
+            self.save_state(selection.bbox if selection is not None else None)
+            self.document = result
+            self.update_image_display()
+            popup.dismiss()
         
-        # 应用降噪
-        denoised = cv2.fastNlMeansDenoisingColored(img, None, 10, 10, 7, 21)
+        def apply_changes(instance):
+            nonlocal job
+            if job is not None:
+                return
+            cancel = job = threading.Event()
+            params = current_params()
+            document = self.document
+            selection = self.selection
+            set_running(True)
+            show_progress(0, 1)
+            
+            def progress(done, total):
+                Clock.schedule_once(lambda dt: show_progress(done, total))
+            
+            @traced('denoise')
+            def denoise():
+                # 按块在所有核心上并行处理，对话框关闭时停止；有选区时只处理选区
+                def run_denoise(image):
+                    return image_ops.denoise(image, progress=progress, cancelled=cancel.is_set,
+                                             **params)
+                
+                if selection is None:
+                    return run_denoise(document)
+                return selection.apply(document, run_denoise,
+                                       image_ops.region_halo('denoise', **params))
+            
+            def run():
+                try:
+                    result = denoise()
+                except Exception as e:
+                    print(f"Error applying denoise: {e}")
+                    result = None
+                Clock.schedule_once(lambda dt: finish(cancel, result, selection))
+            
+            # 在后台线程中处理，界面保持响应
+            threading.Thread(target=run, daemon=True).start()
         
-        # 转回PIL格式
-        self.pil_image = self.cv2_to_pil(denoised)
-        self.update_image_display()
+        def cancel_job():
+            nonlocal job
+            if job is not None:
+                job.set()
+                job = None
+                set_running(False)
+        
+        def reset_changes(instance):
+            for name, slider in sliders.items():
+                slider.value = defaults[name]
+        
+        for slider in sliders.values():
+            slider.bind(value=update_preview)
+        apply_button.bind(on_press=apply_changes)
+        reset_button.bind(on_press=reset_changes)
+        cancel_button.bind(on_press=popup.dismiss)
+        popup.bind(on_dismiss=lambda x: (self.preview_scheduler.cancel(), cancel_job()))
+        
+        def on_open():
+            nonlocal preview_crop
+            preview_crop = None
+            reset_changes(None)
+            progress_bar.value = 0
+            progress_label.text = ''
+            preview_crop = center_crop(self.pil_image, DENOISE_PREVIEW_SIZE)
+            accounting.track('previews', preview_crop)
+            self.display_image(preview, preview_crop)
+            update_preview(None, None)
+        
+        return popup, on_open
 
     def show_effects_dialog(self, instance):
         """显示特效对话框"""
-        if not self.pil_image:
+        if not self.has_image:
             return
-            
+        self.open_dialog('effects', self.build_effects_dialog)
+
+    def build_effects_dialog(self):
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
         # 预览区域
-        preview = Image(source=self.temp_file)
+        preview = Image()
         content.add_widget(preview)
         
         # 特效按钮区域
@@ -886,40 +1626,40 @@ class ImageEditor(BoxLayout):
             if not self.original_image:
                 self.original_image = self.pil_image.copy()
             
-            temp_img = self.original_image.copy()
+            # 每种效果都会生成新图像，不需要先复制原图
+            temp_img = self.original_image
             
             try:
                 if effect_type == 'sepia':
                     # 应用棕褐色效果
-                    temp_img = ImageOps.colorize(temp_img.convert('L'), '#704214', '#C0A080')
+                    temp_img = image_ops.sepia(temp_img)
                 elif effect_type == 'invert':
                     # 应用反色效果
-                    temp_img = ImageOps.invert(temp_img)
+                    temp_img = image_ops.invert(temp_img)
                 elif effect_type == 'emboss':
                     # 应用浮雕效果
-                    temp_img = temp_img.filter(ImageFilter.EMBOSS)
+                    temp_img = image_ops.emboss(temp_img)
                 elif effect_type == 'contour':
                     # 应用轮廓效果
-                    temp_img = temp_img.filter(ImageFilter.CONTOUR)
+                    temp_img = image_ops.contour(temp_img)
                 
                 # 保存当前效果
                 current_effect = effect_type
-                current_effect_image = temp_img
+                current_effect_image = accounting.track('previews', temp_img)
                 
                 # 更新预览
-                fd, temp_path = tempfile.mkstemp(suffix='.png')
-                os.close(fd)
-                temp_img.save(temp_path, format='PNG')
-                preview.source = temp_path
-                preview.reload()
-                os.unlink(temp_path)
+                self.display_image(preview, temp_img)
                 
             except Exception as e:
                 print(f"Error applying effect: {e}")
         
+        @traced('effects')
         def apply_changes(instance):
             nonlocal current_effect_image
-            if current_effect_image:
+            if current_effect_image and self.selection is not None:
+                # 有选区时只在选区内重新计算特效
+                self.apply_operation(current_effect, source=self.original_image)
+            elif current_effect_image:
                 self.save_state()
                 self.pil_image = current_effect_image
                 self.update_image_display()
@@ -930,8 +1670,7 @@ class ImageEditor(BoxLayout):
                 self.pil_image = self.original_image.copy()
                 self.update_image_display()
                 # 重置预览
-                preview.source = self.temp_file
-                preview.reload()
+                self.display_image(preview, self.document)
         
         # 绑定特效按钮事件
         sepia_button.bind(on_press=lambda x: apply_effect('sepia'))
@@ -942,25 +1681,26 @@ class ImageEditor(BoxLayout):
         apply_button.bind(on_press=apply_changes)
         reset_button.bind(on_press=reset_changes)
         cancel_button.bind(on_press=popup.dismiss)
-        popup.open()
-
-    def pil_to_cv2(self, pil_image):
-        """将PIL图像转换为OpenCV格式"""
-        return cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-
-    def cv2_to_pil(self, cv2_image):
-        """将OpenCV图像转换为PIL格式"""
-        return PILImage.fromarray(cv2.cvtColor(cv2_image, cv2.COLOR_BGR2RGB))
+        
+        def on_open():
+            nonlocal current_effect, current_effect_image
+            current_effect = None
+            current_effect_image = None
+            self.display_image(preview, self.document)
+        
+        return popup, on_open
 
     def show_color_dialog(self, instance):
         """显示颜色调整对话框"""
-        if not self.pil_image:
+        if not self.has_image:
             return
-            
+        self.open_dialog('color', self.build_color_dialog)
+
+    def build_color_dialog(self):
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
         # 预览区域
-        preview = Image(source=self.temp_file)
+        preview = Image()
         content.add_widget(preview)
         
         # 颜色调整滑块
@@ -1005,51 +1745,36 @@ class ImageEditor(BoxLayout):
         
         popup = Popup(title='Adjust Colors', content=content, size_hint=(0.8, 0.8))
         
+        # 预览在缩小的代理图像上计算，Apply时才处理全分辨率原图
+        proxy = None  # 每次打开时按当前图像创建
+        popup.bind(on_dismiss=lambda x: self.preview_scheduler.cancel())
+        
         def update_preview(instance, value):
+            if proxy is None:
+                # 打开前恢复默认值时不渲染预览
+                return
             if not self.original_image:
                 self.original_image = self.pil_image.copy()
             
-            # 确保图片是RGB模式
-            rgb_image = self.ensure_rgb_mode(self.original_image)
+            red, green, blue = red_slider.value, green_slider.value, blue_slider.value
             
-            # 分离通道
-            r, g, b = rgb_image.split()
+            def render():
+                # 三个通道的调整合成为一张查找表，一次完成
+                return image_ops.color(proxy.image, red, green, blue)
             
-            # 调整各个通道
-            r = ImageEnhance.Brightness(r).enhance(red_slider.value)
-            g = ImageEnhance.Brightness(g).enhance(green_slider.value)
-            b = ImageEnhance.Brightness(b).enhance(blue_slider.value)
-            
-            # 合并通道
-            temp_img = PILImage.merge('RGB', (r, g, b))
-            
-            # 更新预览
-            fd, temp_path = tempfile.mkstemp(suffix='.png')
-            os.close(fd)
-            temp_img.save(temp_path, format='PNG')
-            preview.source = temp_path
-            preview.reload()
-            os.unlink(temp_path)
+            # 在后台线程渲染并更新预览
+            self.schedule_preview(preview, render)
         
+        @traced('color')
         def apply_changes(instance):
             if not self.original_image:
                 self.original_image = self.pil_image.copy()
             
-            # 确保图片是RGB模式
-            rgb_image = self.ensure_rgb_mode(self.original_image)
-            
-            # 分离通道
-            r, g, b = rgb_image.split()
-            
-            # 调整各个通道
-            r = ImageEnhance.Brightness(r).enhance(red_slider.value)
-            g = ImageEnhance.Brightness(g).enhance(green_slider.value)
-            b = ImageEnhance.Brightness(b).enhance(blue_slider.value)
-            
-            # 合并通道
-            self.pil_image = PILImage.merge('RGB', (r, g, b))
-            self.update_image_display()
-            popup.dismiss()
+            # 三个通道的调整合成为一张查找表，一次完成
+            if self.apply_operation('color', source=self.original_image, record=False,
+                                    red=red_slider.value, green=green_slider.value,
+                                    blue=blue_slider.value):
+                popup.dismiss()
         
         def reset_changes(instance):
             if self.original_image:
@@ -1065,17 +1790,29 @@ class ImageEditor(BoxLayout):
         apply_button.bind(on_press=apply_changes)
         reset_button.bind(on_press=reset_changes)
         cancel_button.bind(on_press=popup.dismiss)
-        popup.open()
+        
+        def on_open():
+            nonlocal proxy
+            proxy = None
+            red_slider.value = 1.0
+            green_slider.value = 1.0
+            blue_slider.value = 1.0
+            proxy = self.create_preview_proxy()
+            self.display_image(preview, self.document)
+        
+        return popup, on_open
 
     def show_saturation_dialog(self, instance):
         """显示饱和度调整对话框"""
-        if not self.pil_image:
+        if not self.has_image:
             return
-            
+        self.open_dialog('saturation', self.build_saturation_dialog)
+
+    def build_saturation_dialog(self):
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
         # 预览区域
-        preview = Image(source=self.temp_file)
+        preview = Image()
         content.add_widget(preview)
         
         # 饱和度滑块
@@ -1099,33 +1836,31 @@ class ImageEditor(BoxLayout):
         
         popup = Popup(title='Adjust Saturation', content=content, size_hint=(0.8, 0.8))
         
+        # 预览在缩小的代理图像上计算，Apply时才处理全分辨率原图
+        proxy = None  # 每次打开时按当前图像创建
+        popup.bind(on_dismiss=lambda x: self.preview_scheduler.cancel())
+        
         def update_preview(instance, value):
+            if proxy is None:
+                # 打开前恢复默认值时不渲染预览
+                return
             if not self.original_image:
                 self.original_image = self.pil_image.copy()
             
-            # 确保图片是RGB模式
-            rgb_image = self.ensure_rgb_mode(self.original_image)
-            enhancer = ImageEnhance.Color(rgb_image)
-            temp_img = enhancer.enhance(value)
+            def render():
+                return image_ops.saturation(proxy.image, value)
             
-            # 更新预览
-            fd, temp_path = tempfile.mkstemp(suffix='.png')
-            os.close(fd)
-            temp_img.save(temp_path, format='PNG')
-            preview.source = temp_path
-            preview.reload()
-            os.unlink(temp_path)
+            # 在后台线程渲染并更新预览
+            self.schedule_preview(preview, render)
         
+        @traced('saturation')
         def apply_changes(instance):
             if not self.original_image:
                 self.original_image = self.pil_image.copy()
             
-            # 确保图片是RGB模式
-            rgb_image = self.ensure_rgb_mode(self.original_image)
-            enhancer = ImageEnhance.Color(rgb_image)
-            self.pil_image = enhancer.enhance(saturation_slider.value)
-            self.update_image_display()
-            popup.dismiss()
+            if self.apply_operation('saturation', source=self.original_image, record=False,
+                                              factor=saturation_slider.value):
+                popup.dismiss()
         
         def reset_changes(instance):
             if self.original_image:
@@ -1137,17 +1872,27 @@ class ImageEditor(BoxLayout):
         apply_button.bind(on_press=apply_changes)
         reset_button.bind(on_press=reset_changes)
         cancel_button.bind(on_press=popup.dismiss)
-        popup.open()
+        
+        def on_open():
+            nonlocal proxy
+            proxy = None
+            saturation_slider.value = 1.0
+            proxy = self.create_preview_proxy()
+            self.display_image(preview, self.document)
+        
+        return popup, on_open
 
     def show_sharpness_dialog(self, instance):
         """显示锐化调整对话框"""
-        if not self.pil_image:
+        if not self.has_image:
             return
-            
+        self.open_dialog('sharpness', self.build_sharpness_dialog)
+
+    def build_sharpness_dialog(self):
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
         # 预览区域
-        preview = Image(source=self.temp_file)
+        preview = Image()
         content.add_widget(preview)
         
         # 锐化滑块
@@ -1171,33 +1916,31 @@ class ImageEditor(BoxLayout):
         
         popup = Popup(title='Adjust Sharpness', content=content, size_hint=(0.8, 0.8))
         
+        # 预览在缩小的代理图像上计算，Apply时才处理全分辨率原图
+        proxy = None  # 每次打开时按当前图像创建
+        popup.bind(on_dismiss=lambda x: self.preview_scheduler.cancel())
+        
         def update_preview(instance, value):
+            if proxy is None:
+                # 打开前恢复默认值时不渲染预览
+                return
             if not self.original_image:
                 self.original_image = self.pil_image.copy()
             
-            # 确保图片是RGB模式
-            rgb_image = self.ensure_rgb_mode(self.original_image)
-            enhancer = ImageEnhance.Sharpness(rgb_image)
-            temp_img = enhancer.enhance(value)
+            def render():
+                return image_ops.sharpness(proxy.image, value)
             
-            # 更新预览
-            fd, temp_path = tempfile.mkstemp(suffix='.png')
-            os.close(fd)
-            temp_img.save(temp_path, format='PNG')
-            preview.source = temp_path
-            preview.reload()
-            os.unlink(temp_path)
+            # 在后台线程渲染并更新预览
+            self.schedule_preview(preview, render)
         
+        @traced('sharpness')
         def apply_changes(instance):
             if not self.original_image:
                 self.original_image = self.pil_image.copy()
             
-            # 确保图片是RGB模式
-            rgb_image = self.ensure_rgb_mode(self.original_image)
-            enhancer = ImageEnhance.Sharpness(rgb_image)
-            self.pil_image = enhancer.enhance(sharpness_slider.value)
-            self.update_image_display()
-            popup.dismiss()
+            if self.apply_operation('sharpness', source=self.original_image, record=False,
+                                             factor=sharpness_slider.value):
+                popup.dismiss()
         
         def reset_changes(instance):
             if self.original_image:
@@ -1209,17 +1952,27 @@ class ImageEditor(BoxLayout):
         apply_button.bind(on_press=apply_changes)
         reset_button.bind(on_press=reset_changes)
         cancel_button.bind(on_press=popup.dismiss)
-        popup.open()
+        
+        def on_open():
+            nonlocal proxy
+            proxy = None
+            sharpness_slider.value = 1.0
+            proxy = self.create_preview_proxy()
+            self.display_image(preview, self.document)
+        
+        return popup, on_open
 
     def show_blur_dialog(self, instance):
         """显示模糊调整对话框"""
-        if not self.pil_image:
+        if not self.has_image:
             return
-            
+        self.open_dialog('blur', self.build_blur_dialog)
+
+    def build_blur_dialog(self):
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
         # 预览区域
-        preview = Image(source=self.temp_file)
+        preview = Image()
         content.add_widget(preview)
         
         # 模糊类型选择
@@ -1255,65 +2008,36 @@ class ImageEditor(BoxLayout):
         
         popup = Popup(title='Apply Blur', content=content, size_hint=(0.8, 0.8))
         
+        # 预览在缩小的代理图像上计算，Apply时才处理全分辨率原图
+        proxy = None  # 每次打开时按当前图像创建
+        popup.bind(on_dismiss=lambda x: self.preview_scheduler.cancel())
+        
         def update_preview(instance, value):
+            if proxy is None:
+                # 打开前恢复默认值时不渲染预览
+                return
             if not self.original_image:
                 self.original_image = self.pil_image.copy()
             
-            # 转换为OpenCV格式
-            img = self.pil_to_cv2(self.original_image)
+            blur_type = blur_type_spinner.text
+            # 模糊半径按代理图像的缩放比例换算，使预览与最终效果一致
+            radius = proxy.scale_length(blur_slider.value)
             
-            try:
-                # 应用模糊
-                if blur_type_spinner.text == 'Gaussian':
-                    blurred = cv2.GaussianBlur(img, (0, 0), blur_slider.value)
-                elif blur_type_spinner.text == 'Box':
-                    ksize = int(blur_slider.value * 2 + 1)
-                    blurred = cv2.boxFilter(img, -1, (ksize, ksize))
-                else:  # Median
-                    ksize = int(blur_slider.value * 2 + 1)
-                    # 确保ksize是奇数
-                    ksize = max(3, ksize if ksize % 2 == 1 else ksize + 1)
-                    blurred = cv2.medianBlur(img, ksize)
-                
-                # 转回PIL格式
-                temp_img = self.cv2_to_pil(blurred)
-                
-                # 更新预览
-                fd, temp_path = tempfile.mkstemp(suffix='.png')
-                os.close(fd)
-                temp_img.save(temp_path, format='PNG')
-                preview.source = temp_path
-                preview.reload()
-                os.unlink(temp_path)
-            except Exception as e:
-                print(f"Error applying blur: {e}")
+            def render():
+                return image_ops.blur(proxy.image, blur_type, radius)
+            
+            # 在后台线程渲染并更新预览
+            self.schedule_preview(preview, render)
         
+        @traced('blur')
         def apply_changes(instance):
             if not self.original_image:
                 self.original_image = self.pil_image.copy()
             
-            # 转换为OpenCV格式
-            img = self.pil_to_cv2(self.original_image)
-            
-            try:
-                # 应用模糊
-                if blur_type_spinner.text == 'Gaussian':
-                    blurred = cv2.GaussianBlur(img, (0, 0), blur_slider.value)
-                elif blur_type_spinner.text == 'Box':
-                    ksize = int(blur_slider.value * 2 + 1)
-                    blurred = cv2.boxFilter(img, -1, (ksize, ksize))
-                else:  # Median
-                    ksize = int(blur_slider.value * 2 + 1)
-                    # 确保ksize是奇数
-                    ksize = max(3, ksize if ksize % 2 == 1 else ksize + 1)
-                    blurred = cv2.medianBlur(img, ksize)
-                
-                # 转回PIL格式
-                self.pil_image = self.cv2_to_pil(blurred)
-                self.update_image_display()
+            # 应用模糊
+            if self.apply_operation('blur', source=self.original_image, record=False,
+                                    kind=blur_type_spinner.text, radius=blur_slider.value):
                 popup.dismiss()
-            except Exception as e:
-                print(f"Error applying blur: {e}")
         
         def reset_changes(instance):
             if self.original_image:
@@ -1326,17 +2050,30 @@ class ImageEditor(BoxLayout):
         apply_button.bind(on_press=apply_changes)
         reset_button.bind(on_press=reset_changes)
         cancel_button.bind(on_press=popup.dismiss)
-        popup.open()
+        
+        def on_open():
+            nonlocal proxy
+            proxy = None
+            blur_type_spinner.text = 'Gaussian'
+            blur_slider.value = 1
+            proxy = self.create_preview_proxy()
+            self.display_image(preview, self.document)
+        
+        return popup, on_open
 
     def show_noise_dialog(self, instance):
         """显示噪点调整对话框"""
-        if not self.pil_image:
+        if not self.has_image:
             return
-            
+        self.open_dialog('noise', self.build_noise_dialog)
+
+    def build_noise_dialog(self):
+        from noise import NoiseField, new_seed
+        
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
         # 预览区域
-        preview = Image(source=self.temp_file)
+        preview = Image()
         content.add_widget(preview)
         
         # 噪点类型选择
@@ -1372,73 +2109,41 @@ class ImageEditor(BoxLayout):
         
         popup = Popup(title='Add Noise', content=content, size_hint=(0.8, 0.8))
         
+        # 预览在缩小的代理图像上计算，Apply时才处理全分辨率原图
+        proxy = None  # 每次打开时按当前图像创建
+        popup.bind(on_dismiss=lambda x: self.preview_scheduler.cancel())
+        
+        # 每次打开（一个对话框会话）使用固定的种子，预览不闪烁，Apply与预览一致
+        noise_seed = None
+        preview_noise = None
+        
         def update_preview(instance, value):
+            if proxy is None:
+                # 打开前恢复默认值时不渲染预览
+                return
             if not self.original_image:
                 self.original_image = self.pil_image.copy()
             
-            # 转换为OpenCV格式
-            img = self.pil_to_cv2(self.original_image)
+            noise_type = noise_type_spinner.text
+            intensity = noise_slider.value
             
-            try:
-                # 添加噪点
-                if noise_type_spinner.text == 'Gaussian':
-                    noise = np.random.normal(0, noise_slider.value * 25, img.shape).astype(np.uint8)
-                    noisy = cv2.add(img, noise)
-                elif noise_type_spinner.text == 'Salt & Pepper':
-                    noisy = img.copy()
-                    # 盐噪点
-                    salt = np.random.random(img.shape[:2]) < noise_slider.value / 2
-                    noisy[salt] = 255
-                    # 椒噪点
-                    pepper = np.random.random(img.shape[:2]) < noise_slider.value / 2
-                    noisy[pepper] = 0
-                else:  # Speckle
-                    noise = np.random.normal(0, noise_slider.value, img.shape).astype(np.uint8)
-                    noisy = cv2.add(img, img * noise / 255)
-                
-                # 转回PIL格式
-                temp_img = self.cv2_to_pil(noisy)
-                
-                # 更新预览
-                fd, temp_path = tempfile.mkstemp(suffix='.png')
-                os.close(fd)
-                temp_img.save(temp_path, format='PNG')
-                preview.source = temp_path
-                preview.reload()
-                os.unlink(temp_path)
-            except Exception as e:
-                print(f"Error adding noise: {e}")
+            def render():
+                # 单位噪点场只生成一次，之后只按强度缩放叠加
+                return preview_noise.apply(proxy.image, noise_type, intensity)
+            
+            # 在后台线程渲染并更新预览
+            self.schedule_preview(preview, render)
         
+        @traced('noise')
         def apply_changes(instance):
             if not self.original_image:
                 self.original_image = self.pil_image.copy()
             
-            # 转换为OpenCV格式
-            img = self.pil_to_cv2(self.original_image)
-            
-            try:
-                # 添加噪点
-                if noise_type_spinner.text == 'Gaussian':
-                    noise = np.random.normal(0, noise_slider.value * 25, img.shape).astype(np.uint8)
-                    noisy = cv2.add(img, noise)
-                elif noise_type_spinner.text == 'Salt & Pepper':
-                    noisy = img.copy()
-                    # 盐噪点
-                    salt = np.random.random(img.shape[:2]) < noise_slider.value / 2
-                    noisy[salt] = 255
-                    # 椒噪点
-                    pepper = np.random.random(img.shape[:2]) < noise_slider.value / 2
-                    noisy[pepper] = 0
-                else:  # Speckle
-                    noise = np.random.normal(0, noise_slider.value, img.shape).astype(np.uint8)
-                    noisy = cv2.add(img, img * noise / 255)
-                
-                # 转回PIL格式
-                self.pil_image = self.cv2_to_pil(noisy)
-                self.update_image_display()
+            # 添加噪点（使用与预览相同的种子）
+            if self.apply_operation('noise', source=self.original_image, record=False,
+                                    kind=noise_type_spinner.text, intensity=noise_slider.value,
+                                    seed=noise_seed):
                 popup.dismiss()
-            except Exception as e:
-                print(f"Error adding noise: {e}")
         
         def reset_changes(instance):
             if self.original_image:
@@ -1451,45 +2156,136 @@ class ImageEditor(BoxLayout):
         apply_button.bind(on_press=apply_changes)
         reset_button.bind(on_press=reset_changes)
         cancel_button.bind(on_press=popup.dismiss)
-        popup.open()
+        
+        def on_open():
+            nonlocal proxy, noise_seed, preview_noise
+            proxy = None
+            noise_type_spinner.text = 'Gaussian'
+            noise_slider.value = 0.1
+            proxy = self.create_preview_proxy()
+            noise_seed = new_seed()
+            preview_noise = NoiseField(proxy.image.size, noise_seed)
+            self.display_image(preview, self.document)
+        
+        return popup, on_open
 
-    def apply_vignette(self, instance):
-        """应用晕影效果"""
-        if not self.pil_image:
+    def show_vignette_dialog(self, instance):
+        """显示晕影调整对话框"""
+        if not self.has_image:
             return
-            
-        self.save_state()
-        # 转换为OpenCV格式
-        img = self.pil_to_cv2(self.pil_image)
-        
-        # 创建晕影遮罩
-        rows, cols = img.shape[:2]
-        kernel_x = cv2.getGaussianKernel(cols, cols/4)
-        kernel_y = cv2.getGaussianKernel(rows, rows/4)
-        kernel = kernel_y * kernel_x.T
-        mask = kernel / kernel.max()
-        
-        # 应用晕影效果
-        vignette = img.copy()
-        for i in range(3):
-            vignette[:,:,i] = vignette[:,:,i] * mask
-        
-        # 转回PIL格式
-        self.pil_image = self.cv2_to_pil(vignette)
-        self.update_image_display()
+        self.open_dialog('vignette', self.build_vignette_dialog)
 
-    def __del__(self):
-        # 清理临时文件
-        for temp_file in [self.temp_file, self.preview_temp_file]:
-            if temp_file and os.path.exists(temp_file):
-                try:
-                    os.unlink(temp_file)
-                except:
-                    pass
+    def build_vignette_dialog(self):
+        content = BoxLayout(orientation='vertical', padding=10, spacing=10)
+        
+        # 预览区域
+        preview = Image()
+        content.add_widget(preview)
+        
+        # 晕影参数滑块
+        sliders_layout = BoxLayout(orientation='vertical', size_hint_y=None, height=200)
+        sliders = {}
+        for name, label, low, high, default in [('strength', 'Strength:', 0.0, 1.0, 1.0),
+                                                ('radius', 'Radius:', 0.25, 2.0, 1.0),
+                                                ('center_x', 'Center X:', 0.0, 1.0, 0.5),
+                                                ('center_y', 'Center Y:', 0.0, 1.0, 0.5)]:
+            slider_layout = BoxLayout(size_hint_y=None, height=50)
+            slider_layout.add_widget(Label(text=label, size_hint_x=0.3))
+            sliders[name] = Slider(min=low, max=high, value=default, size_hint_x=0.7)
+            slider_layout.add_widget(sliders[name])
+            sliders_layout.add_widget(slider_layout)
+        content.add_widget(sliders_layout)
+        
+        # 按钮区域
+        buttons = BoxLayout(size_hint_y=None, height=50)
+        cancel_button = Button(text='Cancel')
+        apply_button = Button(text='Apply')
+        reset_button = Button(text='Reset')
+        
+        buttons.add_widget(cancel_button)
+        buttons.add_widget(reset_button)
+        buttons.add_widget(apply_button)
+        content.add_widget(buttons)
+        
+        popup = Popup(title='Apply Vignette', content=content, size_hint=(0.8, 0.8))
+        
+        # 晕影作用在当前图像上；预览在缩小的代理图像上计算
+        proxy = None  # 每次打开时按当前图像创建
+        popup.bind(on_dismiss=lambda x: self.preview_scheduler.cancel())
+        
+        def current_params():
+            return {name: slider.value for name, slider in sliders.items()}
+        
+        def update_preview(instance, value):
+            if proxy is None:
+                # 打开前恢复默认值时不渲染预览
+                return
+            params = current_params()
+            
+            def render():
+                # 遮罩按代理尺寸和参数缓存，拖动滑块时只需一次乘法
+                return image_ops.vignette(proxy.image, **params)
+            
+            # 在后台线程渲染并更新预览
+            self.schedule_preview(preview, render)
+        
+        @traced('vignette')
+        def apply_changes(instance):
+            if self.apply_operation('vignette', **current_params()):
+                popup.dismiss()
+        
+        def reset_changes(instance):
+            sliders['strength'].value = 1.0
+            sliders['radius'].value = 1.0
+            sliders['center_x'].value = 0.5
+            sliders['center_y'].value = 0.5
+        
+        for slider in sliders.values():
+            slider.bind(value=update_preview)
+        apply_button.bind(on_press=apply_changes)
+        reset_button.bind(on_press=reset_changes)
+        cancel_button.bind(on_press=popup.dismiss)
+        
+        def on_open():
+            nonlocal proxy
+            proxy = None
+            reset_changes(None)
+            proxy = self.create_preview_proxy(self.pil_image)
+            self.display_image(preview, self.document)
+            # 打开时按默认参数显示一次预览
+            update_preview(None, None)
+        
+        return popup, on_open
 
 class ImageEditorApp(App):
     def build(self):
-        return ImageEditor()
+        self.build_begin = time.perf_counter()
+        editor = ImageEditor()
+        self.build_end = time.perf_counter()
+        return editor
+
+    def on_start(self):
+        # 窗口第一次显示画面时记录启动耗时
+        Window.bind(on_flip=self.on_first_frame)
+
+    def on_first_frame(self, window):
+        window.unbind(on_flip=self.on_first_frame)
+        self.root.startup_times = {
+            'imports': STARTUP_IMPORTED - STARTUP_BEGIN,
+            'build': self.build_end - self.build_begin,
+            'first_frame': time.perf_counter() - STARTUP_BEGIN,
+        }
+        print('Startup: ' + ', '.join(f'{name} {seconds * 1000:.0f} ms'
+                                      for name, seconds in self.root.startup_times.items()))
+
+    def on_stop(self):
+        # 设置了 IMAGE_EDITOR_TRACE 时退出前导出追踪数据（.jsonl 或 Chrome trace）
+        trace_path = os.environ.get('IMAGE_EDITOR_TRACE')
+        if trace_path:
+            try:
+                tracer.export(trace_path)
+            except Exception as e:
+                print(f"Error exporting trace: {e}")
 
 if __name__ == '__main__':
     ImageEditorApp().run() 
\ No newline at end of file
@@ -0,0 +1,32 @@
+"""图片文件的扩展名和快速缩小解码（只依赖Pillow）
+
+文件浏览器、缩略图目录、渐进加载和批处理都要用到，放在这里可以让它们
+不必为此导入 batch（会导入 image_ops）或 loader（会导入Kivy）。
+"""
+from PIL import Image as PILImage
+
+# 可以解码的图片扩展名
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+
+
+def open_reduced(path, max_size):
+    """快速解码出接近 max_size 的图像，返回 (图像, 原图尺寸)
+
+    JPEG由 draft() 让解码器直接按1/2、1/4、1/8输出，其他格式用 reduce()
+    做整数倍缩小。结果不小于 max_size（最多大一倍左右），显示时再由纹理缩放。
+    """
+    image = PILImage.open(path)
+    full_size = image.size
+    max_width = max(1, int(max_size[0]))
+    max_height = max(1, int(max_size[1]))
+    # 只对JPEG有效：在解码时缩小，不解码全分辨率的像素
+    image.draft(image.mode, (max_width, max_height))
+    factor = min(image.width // max_width, image.height // max_height)
+    if factor >= 2:
+        if image.mode in ('P', '1'):
+            # reduce() 不支持调色板和二值图像
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        image = image.reduce(factor)
+    else:
+        image.load()
+    return image, full_size
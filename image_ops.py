@@ -0,0 +1,596 @@
+"""图像处理操作
+
+编辑器按钮和对话框背后的所有图像操作，不依赖Kivy，可以在命令行批处理等
+无界面的场景中直接使用。每个操作都接收一幅PIL图像或图像文档（ImageDocument）
+和参数，返回同类型的新图像。
+
+OpenCV/NumPy操作直接处理文档的像素数组，并声明需要的通道顺序（ANY表示与
+顺序无关），只在顺序确实不同时才交换RGB/BGR；只能用Pillow完成的操作通过
+文档的PIL视图执行。
+"""
+import functools
+
+from PIL import Image as PILImage, ImageEnhance, ImageFilter
+
+from document import ANY, ImageDocument, convert
+from filter_stack import FILTERS
+from lazy import LazyModule
+from tracing import span
+
+# OpenCV、NumPy 以及依赖它们的模块在第一次用到时才导入，
+# 只用Pillow完成的操作和 batch.py --help 不需要等待它们
+cv2 = LazyModule('cv2')
+np = LazyModule('numpy')
+blur_ops = LazyModule('blur_ops')
+point_ops = LazyModule('point_ops')
+tiles = LazyModule('tiles')
+
+# 超过这个像素数的图像按块处理邻域运算，避免一次性分配多份整幅数组
+TILED_MIN_PIXELS = 64 * 1024 * 1024
+
+# 卡通效果的默认参数（quality 模式下与原来的固定参数相同）
+CARTOON_MODES = ('quality', 'fast')
+CARTOON_EDGE_THICKNESS = 1
+CARTOON_COLOR_LEVELS = 0  # 0 表示不做色阶分层
+CARTOON_SMOOTHING = 10  # 双边滤波的 sigma 为 smoothing * 30
+
+# 快速模式下短边不小于这个像素数的图像缩小两级（否则一级）
+CARTOON_FAST_TWO_LEVELS = 2000
+
+# 降噪的默认参数
+DENOISE_STRENGTH = 10
+DENOISE_PATCH_SIZE = 7
+DENOISE_SEARCH_WINDOW = 21
+
+# 降噪总是分块处理：每个像素的计算量很大，多读取的边缘只占很小的开销，
+# 分块后可以并行、报告进度和中途取消
+DENOISE_TILE_SIZE = 512
+
+
+def ensure_rgb_mode(image):
+    """确保图片是RGB模式"""
+    if image.mode not in ('RGB', 'RGBA'):
+        return image.convert('RGB')
+    return image
+
+
+def _like(image, document):
+    """输入是文档时返回文档，否则返回PIL图像"""
+    if isinstance(image, ImageDocument):
+        return document
+    with span('to_pil'):
+        return document.to_pil()
+
+
+def _pillow(func):
+    """只能用Pillow完成的操作：文档先取PIL视图，结果再包装成文档"""
+    @functools.wraps(func)
+    def wrapper(image, *args, **kwargs):
+        if isinstance(image, ImageDocument):
+            with span('to_pil'):
+                pil_image = image.to_pil()
+            with span('compute'):
+                return ImageDocument.from_pil(func(pil_image, *args, **kwargs))
+        with span('compute'):
+            return func(image, *args, **kwargs)
+    return wrapper
+
+
+def run_cv2(image, func, halo, order=ANY, tile_size=None, progress=None, cancelled=None):
+    """对图像执行OpenCV邻域运算
+
+    func(pixels, order) 处理按 order 排列的三通道数组，返回同样顺序的数组；
+    order 为 ANY 时直接使用文档现有的顺序。超大图像（不少于 TILED_MIN_PIXELS）
+    按块处理，halo 是运算的核半径：通道顺序的转换在块上进行，结果写入临时
+    文件支持的数组。给出 tile_size 时总是按这个大小分块并行处理，
+    progress(done, total) 报告完成的块数，cancelled() 返回True时停止并返回 None。
+    """
+    document = ImageDocument.wrap(image)
+    order = document.resolve(order)
+    spill = document.width * document.height >= TILED_MIN_PIXELS
+    if tile_size is not None or spill:
+        source_order = document.order
+        with span('compute'):
+            result = tiles.process_array(
+                document.pixels,
+                lambda tile: func(convert(tile, source_order, order), order), halo,
+                tile_size or tiles.DEFAULT_TILE_SIZE, progress=progress, cancelled=cancelled,
+                shape=(document.height, document.width, len(order)), spill=spill)
+        if result is None:
+            return None
+    else:
+        with span('convert'):
+            pixels = document.pixels_in(order)
+        with span('compute'):
+            result = func(pixels, order)
+    return _like(image, ImageDocument(result, order))
+
+
+# 三通道顺序 -> 转灰度的转换码的名称
+_GRAY_CODES = {'RGB': 'COLOR_RGB2GRAY', 'BGR': 'COLOR_BGR2GRAY'}
+
+
+# ---- 几何变换 ----
+
+@_pillow
+def rotate(image, angle=90):
+    """逆时针旋转，90度的倍数使用无损转置"""
+    transposes = {
+        90: PILImage.Transpose.ROTATE_90,
+        180: PILImage.Transpose.ROTATE_180,
+        270: PILImage.Transpose.ROTATE_270,
+    }
+    angle = angle % 360
+    if angle == 0:
+        return image.copy()
+    if angle in transposes:
+        return image.transpose(transposes[angle])
+    return image.rotate(angle, resample=PILImage.Resampling.BICUBIC, expand=True)
+
+
+@_pillow
+def flip_horizontal(image):
+    """水平翻转图像"""
+    return image.transpose(PILImage.Transpose.FLIP_LEFT_RIGHT)
+
+
+@_pillow
+def flip_vertical(image):
+    """垂直翻转图像"""
+    return image.transpose(PILImage.Transpose.FLIP_TOP_BOTTOM)
+
+
+@_pillow
+def crop(image, left=0, top=0, right=None, bottom=None):
+    """裁剪图像，坐标会被限制在图像范围内"""
+    right = image.width if right is None else right
+    bottom = image.height if bottom is None else bottom
+    left = max(0, min(left, image.width))
+    top = max(0, min(top, image.height))
+    right = max(0, min(right, image.width))
+    bottom = max(0, min(bottom, image.height))
+    if right <= left or bottom <= top:
+        raise ValueError('Invalid crop coordinates')
+    return image.crop((left, top, right, bottom))
+
+
+@_pillow
+def resize(image, width=None, height=None):
+    """调整大小，只给出宽或高时保持宽高比"""
+    if width is None and height is None:
+        raise ValueError('Invalid dimensions')
+    ratio = image.width / image.height
+    if width is None:
+        width = int(height * ratio)
+    elif height is None:
+        height = int(width / ratio)
+    if width <= 0 or height <= 0:
+        raise ValueError('Invalid dimensions')
+    return image.resize((width, height), PILImage.Resampling.LANCZOS)
+
+
+# ---- 颜色调整 ----
+
+@_pillow
+def grayscale(image):
+    """转换为灰度图"""
+    return image.convert('L')
+
+
+@_pillow
+def brightness(image, factor=1.0):
+    """调整亮度"""
+    return point_ops.PointOps().brightness(factor).apply(ensure_rgb_mode(image))
+
+
+@_pillow
+def contrast(image, factor=1.0):
+    """调整对比度"""
+    rgb_image = ensure_rgb_mode(image)
+    return point_ops.PointOps().contrast(factor, point_ops.gray_mean(rgb_image)).apply(rgb_image)
+
+
+@_pillow
+def color(image, red=1.0, green=1.0, blue=1.0):
+    """分别调整R、G、B通道"""
+    return point_ops.PointOps().channel_gains(red, green, blue).apply(ensure_rgb_mode(image))
+
+
+@_pillow
+def saturation(image, factor=1.0):
+    """调整饱和度"""
+    return ImageEnhance.Color(ensure_rgb_mode(image)).enhance(factor)
+
+
+@_pillow
+def sharpness(image, factor=1.0):
+    """调整锐度"""
+    return ImageEnhance.Sharpness(ensure_rgb_mode(image)).enhance(factor)
+
+
+# ---- 滤镜和特效 ----
+
+@_pillow
+def apply_filters(image, names):
+    """依次应用滤镜（blur、sharpen、edge、emboss）"""
+    image = ensure_rgb_mode(image)
+    if isinstance(names, str):
+        names = [names]
+    for name in names:
+        image = image.filter(FILTERS[name])
+    return image
+
+
+@_pillow
+def sepia(image):
+    """棕褐色效果"""
+    return point_ops.PointOps().sepia('#704214', '#C0A080').apply(image)
+
+
+@_pillow
+def invert(image):
+    """反色效果"""
+    return point_ops.PointOps().invert().apply(image)
+
+
+@_pillow
+def emboss(image):
+    """浮雕效果"""
+    return image.filter(ImageFilter.EMBOSS)
+
+
+@_pillow
+def contour(image):
+    """轮廓效果"""
+    return image.filter(ImageFilter.CONTOUR)
+
+
+@functools.lru_cache(maxsize=8)
+def _levels_table(levels):
+    """把0-255分成 levels 个等间隔的色阶的查找表"""
+    values = np.arange(256, dtype=np.float32)
+    return (np.floor(values * levels / 256) * (255 / (levels - 1))).round().astype(np.uint8)
+
+
+def _cartoon_finish(color_img, edges, edge_thickness, color_levels):
+    """色阶分层，加粗边缘（边缘在遮罩中为0），再用遮罩把边缘涂黑"""
+    if color_levels >= 2:
+        color_img = cv2.LUT(color_img, _levels_table(color_levels))
+    if edge_thickness > 1:
+        size = 2 * edge_thickness - 1
+        edges = cv2.erode(edges, np.ones((size, size), np.uint8))
+    return cv2.bitwise_and(color_img, color_img, mask=edges)
+
+
+def _cartoon_quality(img, order, edge_thickness, color_levels, smoothing):
+    # 全分辨率：中值滤波后的自适应阈值作为边缘，一次大核双边滤波平滑颜色
+    gray = cv2.cvtColor(img, getattr(cv2, _GRAY_CODES[order]))
+    gray = cv2.medianBlur(gray, 5)
+    edges = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                  cv2.THRESH_BINARY, 9, 9)
+    sigma = smoothing * 30
+    color_img = cv2.bilateralFilter(img, 9, sigma, sigma)
+    return _cartoon_finish(color_img, edges, edge_thickness, color_levels)
+
+
+def _cartoon_fast(img, order, edge_thickness, color_levels, smoothing, levels):
+    # 在缩小 levels 次（每次1/2）的图像上计算边缘和平滑，再放大回原尺寸
+    sizes = []
+    small = img
+    for _ in range(levels):
+        sizes.append((small.shape[1], small.shape[0]))
+        small = cv2.pyrDown(small)
+    # 边缘：缩小图像的中值滤波和自适应阈值，按比例缩小核
+    gray = cv2.cvtColor(small, getattr(cv2, _GRAY_CODES[order]))
+    gray = cv2.medianBlur(gray, 3)
+    edges = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                  cv2.THRESH_BINARY, 5, 9)
+    # 颜色：多次小核双边滤波代替一次大核
+    sigma = smoothing * 30
+    for _ in range(_cartoon_passes(smoothing)):
+        small = cv2.bilateralFilter(small, 5, sigma, sigma)
+    for size in reversed(sizes):
+        small = cv2.pyrUp(small, dstsize=size)
+    height, width = img.shape[:2]
+    edges = cv2.resize(edges, (width, height), interpolation=cv2.INTER_LINEAR)
+    _, edges = cv2.threshold(edges, 127, 255, cv2.THRESH_BINARY)
+    return _cartoon_finish(small, edges, edge_thickness, color_levels)
+
+
+def _cartoon_passes(smoothing):
+    """快速模式的双边滤波次数"""
+    return 1 + int(smoothing) // 4
+
+
+def cartoon(image, mode='quality', edge_thickness=CARTOON_EDGE_THICKNESS,
+            color_levels=CARTOON_COLOR_LEVELS, smoothing=CARTOON_SMOOTHING):
+    """卡通效果
+
+    mode 为 'quality' 时在全分辨率上计算（默认参数与原来的效果相同）；为 'fast'
+    时先用图像金字塔缩小，在小图上做多次小核双边滤波并在中值滤波后的小图上
+    计算边缘，再放大回原尺寸。edge_thickness 是边缘线的粗细（像素），
+    color_levels 是每个通道的色阶数（0表示不分层），smoothing 是颜色平滑的强度。
+    """
+    edge_thickness = max(1, int(edge_thickness))
+    color_levels = int(color_levels)
+    if mode == 'fast':
+        document = ImageDocument.wrap(image)
+        # 大图多缩小一级；级数按整幅图像决定，分块处理时各块一致
+        levels = 2 if min(document.width, document.height) >= CARTOON_FAST_TWO_LEVELS else 1
+        scale = 2 ** levels
+        # 金字塔、边缘和每次双边滤波的半径（小图上）换算到原图，取 scale 的整数倍
+        # 使各块的金字塔采样位置与整幅处理相同
+        halo = scale * (5 + 2 * _cartoon_passes(smoothing)) + edge_thickness
+        halo = -(-halo // scale) * scale
+        return run_cv2(image, lambda img, order: _cartoon_fast(
+            img, order, edge_thickness, color_levels, smoothing, levels), halo=halo)
+    if mode != 'quality':
+        raise ValueError(f'Unknown cartoon mode: {mode}')
+    return run_cv2(image, lambda img, order: _cartoon_quality(
+        img, order, edge_thickness, color_levels, smoothing), halo=_cartoon_quality_halo(edge_thickness))
+
+
+def _cartoon_quality_halo(edge_thickness):
+    # 中值5x5接自适应阈值9x9，半径 2 + 4，再加上加粗边缘的半径
+    return 6 + max(1, int(edge_thickness)) - 1
+
+
+def _sketch_pixels(img, order):
+    gray = cv2.cvtColor(img, getattr(cv2, _GRAY_CODES[order]))
+    inv = 255 - gray
+    blur_img = cv2.GaussianBlur(inv, (21, 21), 0)
+    result = cv2.divide(gray, 255 - blur_img, scale=256)
+    # 灰度扩展成三通道时与通道顺序无关
+    return cv2.cvtColor(result, cv2.COLOR_GRAY2RGB)
+
+
+# 素描效果中 21x21 高斯模糊的半径
+_SKETCH_HALO = 10
+
+
+def sketch(image):
+    """素描效果"""
+    return run_cv2(image, _sketch_pixels, halo=_SKETCH_HALO)
+
+
+def edge(image):
+    """边缘检测（Canny的滞后阈值会跨块传播，所以不分块）"""
+    with span('convert'):
+        gray = ImageDocument.wrap(image).pixels_in('L')
+    with span('compute'):
+        edges = cv2.Canny(gray, 100, 200)
+    return _like(image, ImageDocument(cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB), 'RGB'))
+
+
+def denoise(image, strength=DENOISE_STRENGTH, patch_size=DENOISE_PATCH_SIZE,
+            search_window=DENOISE_SEARCH_WINDOW, progress=None, cancelled=None):
+    """非局部均值降噪
+
+    strength 越大去除的噪点越多，细节也损失越多；patch_size 是比较的图块大小，
+    search_window 是搜索相似图块的窗口大小（都取奇数）。图像按重叠的块在所有
+    CPU核心上并行处理，每块多读取的边缘覆盖搜索窗口和图块的半径，结果与整幅
+    处理逐像素相同。progress 和 cancelled 见 run_cv2，取消时返回 None。
+    """
+    patch_size = int(patch_size) // 2 * 2 + 1
+    search_window = int(search_window) // 2 * 2 + 1
+
+    def func(img, order):
+        # fastNlMeansDenoisingColored 假定输入是BGR
+        return cv2.fastNlMeansDenoisingColored(img, None, strength, strength,
+                                               patch_size, search_window)
+
+    return run_cv2(image, func, halo=_denoise_halo(patch_size, search_window), order='BGR',
+                   tile_size=DENOISE_TILE_SIZE, progress=progress, cancelled=cancelled)
+
+
+def _denoise_halo(patch_size, search_window):
+    # 搜索窗口和图块的半径（都取奇数后）
+    return (int(search_window) // 2 * 2 + 1) // 2 + (int(patch_size) // 2 * 2 + 1) // 2
+
+
+# 晕影每次按这么多行生成遮罩并相乘，整幅的 float32 遮罩不会同时存在
+_VIGNETTE_STRIP_ROWS = 256
+
+
+@functools.lru_cache(maxsize=16)
+def vignette_profiles(width, height, center_x=0.5, center_y=0.5, radius=1.0):
+    """晕影遮罩的两个一维高斯轮廓 (mask_y, mask_x)（float32，按尺寸和参数缓存）
+
+    遮罩是以 (center_x, center_y)（相对位置）为中心的高斯函数，标准差为
+    radius 乘以图像宽高的1/4，最大值为1。高斯函数可分离，二维遮罩是两者的外积。
+    """
+    xs = np.arange(width, dtype=np.float32) - np.float32(center_x * (width - 1))
+    ys = np.arange(height, dtype=np.float32) - np.float32(center_y * (height - 1))
+    sigma_x = max(radius * width / 4, 1e-3)
+    sigma_y = max(radius * height / 4, 1e-3)
+    mask_x = np.exp(-xs * xs / np.float32(2 * sigma_x * sigma_x))
+    mask_y = np.exp(-ys * ys / np.float32(2 * sigma_y * sigma_y))
+    mask_x.flags.writeable = False
+    mask_y.flags.writeable = False
+    return mask_y, mask_x
+
+
+def vignette_mask(width, height, strength=1.0, center_x=0.5, center_y=0.5, radius=1.0,
+                  top=0, bottom=None):
+    """晕影遮罩第 top 到 bottom 行（float32）；strength 控制暗角的程度"""
+    mask_y, mask_x = vignette_profiles(width, height, center_x, center_y, radius)
+    mask = np.outer(mask_y[top:bottom], mask_x)
+    if strength != 1.0:
+        mask *= np.float32(strength)
+        mask += np.float32(1.0 - strength)
+    return mask
+
+
+def vignette(image, strength=1.0, center_x=0.5, center_y=0.5, radius=1.0):
+    """晕影效果"""
+    document = ImageDocument.wrap(image)
+    pixels = document.pixels.copy()
+    for top in range(0, document.height, _VIGNETTE_STRIP_ROWS):
+        bottom = min(top + _VIGNETTE_STRIP_ROWS, document.height)
+        mask = vignette_mask(document.width, document.height, strength, center_x, center_y,
+                             radius, top, bottom)
+        # 广播的原地乘法（与通道顺序无关，Alpha通道不变）
+        if pixels.ndim == 2:
+            np.multiply(pixels[top:bottom], mask, out=pixels[top:bottom], casting='unsafe')
+        else:
+            color_pixels = pixels[top:bottom, :, :3]
+            np.multiply(color_pixels, mask[:, :, None], out=color_pixels, casting='unsafe')
+    return _like(image, ImageDocument(pixels, document.order))
+
+
+def blur(image, kind='Gaussian', radius=1):
+    """模糊（Gaussian、Box、Median），radius 为对话框中的强度
+
+    具体的实现由 blur_ops 按半径选择，大半径的高斯模糊用多次盒式模糊近似。
+    """
+    plan = blur_ops.plan(kind, radius)
+    with span('blur_engine', method=plan.method):
+        return run_cv2(image, lambda img, order: plan.func(img), halo=plan.halo)
+
+
+def noise(image, kind='Gaussian', intensity=0.1, seed=None):
+    """添加噪点（Gaussian、Salt & Pepper、Speckle），相同的种子得到相同的噪点"""
+    from noise import NoiseField, new_seed
+    if seed is None:
+        seed = new_seed()
+    document = ImageDocument.wrap(image)
+    # 噪点场按RGB顺序生成，保证与预览（PIL图像）得到相同的结果
+    pixels = NoiseField(document.size, seed).apply_pixels(document.pixels_in('RGB'), kind, intensity)
+    return _like(image, ImageDocument(pixels, 'RGB'))
+
+
+# 操作名称 -> 函数，用于按配方（recipe）执行
+OPERATIONS = {
+    'rotate': rotate,
+    'flip_horizontal': flip_horizontal,
+    'flip_vertical': flip_vertical,
+    'crop': crop,
+    'resize': resize,
+    'grayscale': grayscale,
+    'brightness': brightness,
+    'contrast': contrast,
+    'color': color,
+    'saturation': saturation,
+    'sharpness': sharpness,
+    'filters': apply_filters,
+    'sepia': sepia,
+    'invert': invert,
+    'emboss': emboss,
+    'contour': contour,
+    'cartoon': cartoon,
+    'sketch': sketch,
+    'edge': edge,
+    'denoise': denoise,
+    'vignette': vignette,
+    'blur': blur,
+    'noise': noise,
+}
+
+
+# 逐像素的操作，只处理选区时不需要多取边缘
+_POINTWISE = {'grayscale', 'brightness', 'color', 'saturation', 'sepia', 'invert'}
+
+
+def region_halo(name, **params):
+    """只处理选区时需要在选区外接矩形外多取的边缘宽度
+
+    在外接矩形外扩这么宽的范围内计算，矩形内的结果与对整幅图像计算相同。
+    返回 None 表示操作依赖整幅图像（对比度的平均灰度、晕影和噪点场的位置、
+    Canny的滞后阈值、快速卡通效果按整幅尺寸选择的金字塔级数、几何变换），
+    只能对整幅图像计算后再按选区合成。
+    """
+    if name in _POINTWISE:
+        return 0
+    if name in ('sharpness', 'emboss', 'contour'):
+        # Pillow的3x3卷积（锐度用的是 SMOOTH）
+        return 2
+    if name == 'filters':
+        names = params.get('names', [])
+        if isinstance(names, str):
+            names = [names]
+        return sum(FILTERS[n].filterargs[0][0] // 2 for n in names) + 1
+    if name == 'blur':
+        return blur_ops.plan(params.get('kind', 'Gaussian'), params.get('radius', 1)).halo
+    if name == 'sketch':
+        return _SKETCH_HALO + 1
+    if name == 'cartoon' and params.get('mode', 'quality') == 'quality':
+        return _cartoon_quality_halo(params.get('edge_thickness', CARTOON_EDGE_THICKNESS)) + 1
+    if name == 'denoise':
+        return _denoise_halo(params.get('patch_size', DENOISE_PATCH_SIZE),
+                             params.get('search_window', DENOISE_SEARCH_WINDOW)) + 1
+    return None
+
+
+def run_step(image, step):
+    """执行配方中的一步，step 形如 {"op": "blur", "kind": "Box", "radius": 3}"""
+    params = dict(step)
+    name = params.pop('op')
+    if name not in OPERATIONS:
+        raise ValueError(f'Unknown operation: {name}')
+    return OPERATIONS[name](image, **params)
+
+
+# 可以合成为一张查找表的点运算；其中前三个的输入先转成RGB（与单独执行时相同）
+_POINT_STEPS = ('brightness', 'contrast', 'color', 'invert', 'sepia')
+_RGB_POINT_STEPS = ('brightness', 'contrast', 'color')
+
+
+def group_steps(steps):
+    """把配方的步骤分组：连续的点运算为一组（合成为一张查找表），其他步骤各为一组
+
+    棕褐色以灰度为输入，只能是一组的第一步。
+    """
+    groups = []
+    for step in steps:
+        point = step.get('op') in _POINT_STEPS
+        if (point and groups and groups[-1][0].get('op') in _POINT_STEPS
+                and step.get('op') != 'sepia'):
+            groups[-1].append(step)
+        else:
+            groups.append([step])
+    return groups
+
+
+@_pillow
+def _point_steps(image, steps):
+    """把连续的点运算合成为一张查找表，一次遍历像素，结果与逐步执行完全相同
+
+    对比度的中心点是前面各步执行之后的平均灰度，由已经合成的表直接算出。
+    """
+    if image.mode not in ('L', 'RGB', 'RGBA'):
+        # 其他模式逐步执行时各步的模式转换不同，不合成
+        for step in steps:
+            image = run_step(image, step)
+        return image
+    if steps[0]['op'] != 'sepia' and any(step['op'] in _RGB_POINT_STEPS for step in steps):
+        image = ensure_rgb_mode(image)
+    ops = point_ops.PointOps()
+    for step in steps:
+        params = dict(step)
+        name = params.pop('op')
+        if name == 'brightness':
+            ops.brightness(params.get('factor', 1.0))
+        elif name == 'contrast':
+            ops.contrast(params.get('factor', 1.0), ops.gray_mean(image))
+        elif name == 'color':
+            ops.channel_gains(params.get('red', 1.0), params.get('green', 1.0),
+                              params.get('blue', 1.0))
+        elif name == 'invert':
+            ops.invert()
+        else:
+            ops.sepia('#704214', '#C0A080')
+    return ops.apply(image)
+
+
+def run_group(image, group):
+    """执行 group_steps() 分出的一组步骤"""
+    if len(group) == 1:
+        return run_step(image, group[0])
+    return _point_steps(image, group)
+
+
+def run_steps(image, steps):
+    """依次执行配方中的所有步骤，连续的点运算只遍历一次像素"""
+    for group in group_steps(steps):
+        image = run_group(image, group)
+    return image
@@ -0,0 +1,49 @@
+"""延迟导入：第一次访问属性时才真正导入模块，不依赖Kivy
+
+cv2、NumPy 等模块导入一次要几十到上百毫秒，而程序启动时（以及批处理
+--help 这类命令）并不需要它们。在模块顶层写
+
+    cv2 = LazyModule('cv2')
+
+之后的用法与 import cv2 相同，真正的导入推迟到第一次用到 cv2.xxx 时。
+"""
+import importlib
+import threading
+
+
+class LazyModule:
+    """模块的代理对象，第一次访问属性时导入模块"""
+
+    def __init__(self, name):
+        self.__dict__['_lazy_name'] = name
+        self.__dict__['_lazy_lock'] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__.get('_lazy_module')
+        if module is not None:
+            return module
+        with self._lazy_lock:
+            module = self.__dict__.get('_lazy_module')
+            if module is None:
+                module = importlib.import_module(self._lazy_name)
+                self.__dict__['_lazy_module'] = module
+            return module
+
+    @property
+    def loaded(self):
+        return '_lazy_module' in self.__dict__
+
+    def __getattr__(self, name):
+        # 每次都从模块读取（不复制模块的属性），模块中之后重新赋值的全局
+        # 变量也能通过代理看到
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self.loaded else 'not loaded'
+        return f'<lazy module {self._lazy_name!r} ({state})>'
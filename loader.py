@@ -0,0 +1,78 @@
+"""渐进式图片加载
+
+先用缩小解码得到屏幕大小的图像立即显示：JPEG由 draft() 让解码器直接按
+1/2、1/4、1/8 输出，其他格式用 reduce() 做整数倍缩小。全分辨率图像随后在
+后台线程中解码，完成后再替换显示的图像。
+"""
+import threading
+
+from kivy.clock import Clock
+from PIL import Image as PILImage
+
+from document import ImageDocument
+from image_files import open_reduced
+
+
+class ProgressiveLoader:
+    """在后台线程中渐进加载图片
+
+    每次 load() 先通过 on_preview 送出缩小的图像，再通过 on_full 送出全分辨率
+    的图像文档；回调都在主线程中执行。新的 load() 会让之前尚未完成的加载
+    作废，它们的结果直接丢弃。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def load(self, path, preview_size, on_preview, on_full, on_error):
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        threading.Thread(target=self._run, daemon=True,
+                         args=(generation, path, preview_size, on_preview, on_full, on_error)).start()
+
+    def cancel(self):
+        """放弃正在进行的加载"""
+        with self._lock:
+            self._generation += 1
+
+    def _is_current(self, generation):
+        with self._lock:
+            return generation == self._generation
+
+    def _run(self, generation, path, preview_size, on_preview, on_full, on_error):
+        try:
+            preview, full_size = open_reduced(path, preview_size)
+            if preview.size == full_size:
+                # 图片本身不大，缩小解码得到的就是全分辨率图像
+                document = ImageDocument.from_pil(preview)
+                del preview
+            else:
+                self._deliver(generation, on_preview, preview)
+                if not self._is_current(generation):
+                    return
+                document = self._open_document(path)
+            # 在后台线程中生成像素数组，主线程拿到后可以直接显示。此时只有文档
+            # 还引用解码得到的PIL图像，生成数组后文档也释放它（见
+            # ImageDocument.pixels），之后只保留数组这一份
+            document.pixels
+            self._deliver(generation, on_full, document)
+        except Exception as e:
+            self._deliver(generation, on_error, e)
+
+    @staticmethod
+    def _open_document(path):
+        """解码全分辨率图像；返回的文档是解码结果唯一的引用者"""
+        with PILImage.open(path) as image:
+            image.load()
+            document = ImageDocument.from_pil(image)
+        del image
+        return document
+
+    def _deliver(self, generation, callback, result):
+        def deliver(dt):
+            # 结果回到主线程时可能已经过期
+            if self._is_current(generation):
+                callback(result)
+        Clock.schedule_once(deliver)
@@ -0,0 +1,124 @@
+"""内存统计：按类别统计图像、原图、历史和预览占用的字节数，不依赖Kivy
+
+各类别通过 register() 注册一个返回字节数的函数，或者用 track() 登记单个
+对象（只保存弱引用，对象被释放后自动不再计入）。totals() 返回各类别当前
+的字节数。
+
+开启 tracemalloc 后，每个操作（tracing 中的 'op' span）结束时记录执行期间
+相对开始时的内存峰值增量，用来找出哪个操作产生了额外的整幅副本。
+tracemalloc 只能看到经过Python分配器的内存（NumPy数组包括在内，Pillow
+内部的图像缓冲区不在其中），所以峰值报告与 totals() 互为补充。
+"""
+import contextlib
+import threading
+import tracemalloc
+import weakref
+
+from document import ImageDocument
+from tracing import tracer
+
+# Pillow内部每个像素占用的字节数（RGB按4字节存放）
+_PIL_PIXEL_BYTES = {'1': 1, 'L': 1, 'P': 1, 'I;16': 2, 'I;16B': 2, 'I;16L': 2}
+
+
+def pil_nbytes(image):
+    """PIL图像像素缓冲区的大致字节数"""
+    return image.width * image.height * _PIL_PIXEL_BYTES.get(image.mode, 4)
+
+
+def image_nbytes(image):
+    """PIL图像、图像文档或NumPy数组占用的字节数（None为0）"""
+    if image is None:
+        return 0
+    if isinstance(image, ImageDocument):
+        return image.memory_usage()
+    if hasattr(image, 'nbytes'):
+        return image.nbytes
+    return pil_nbytes(image)
+
+
+def format_bytes(nbytes):
+    return f'{nbytes / (1024 * 1024):.1f} MB'
+
+
+class MemoryAccounting:
+    """按类别统计内存"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources = {}  # 类别 -> [返回字节数的函数]
+        self._tracked = {}  # 类别 -> {id: (弱引用, sizeof)}
+        self.peaks = {}  # 操作名称 -> 最近一次执行的 tracemalloc 峰值增量
+
+    def register(self, category, func):
+        """登记一个类别的字节数来源，func() 返回当前字节数"""
+        with self._lock:
+            self._sources.setdefault(category, []).append(func)
+
+    def track(self, category, obj, sizeof=image_nbytes):
+        """登记单个对象，对象被释放后自动移除"""
+        key = id(obj)
+
+        def forget(ref, category=category, key=key):
+            with self._lock:
+                self._tracked.get(category, {}).pop(key, None)
+
+        with self._lock:
+            self._tracked.setdefault(category, {})[key] = (weakref.ref(obj, forget), sizeof)
+        return obj
+
+    def totals(self):
+        """各类别当前的字节数"""
+        with self._lock:
+            sources = {category: list(funcs) for category, funcs in self._sources.items()}
+            tracked = {category: list(objects.values()) for category, objects in self._tracked.items()}
+        totals = {}
+        for category, funcs in sources.items():
+            totals[category] = sum(func() for func in funcs)
+        for category, objects in tracked.items():
+            alive = ((ref(), sizeof) for ref, sizeof in objects)
+            totals[category] = totals.get(category, 0) + sum(
+                sizeof(obj) for obj, sizeof in alive if obj is not None)
+        return totals
+
+    def total(self):
+        return sum(self.totals().values())
+
+    # ---- tracemalloc 峰值 ----
+
+    def start_peak_tracking(self, frames=1):
+        """开启 tracemalloc，并在每个操作结束时记录峰值"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        if self.measure_peak not in tracer.op_hooks:
+            tracer.op_hooks.append(self.measure_peak)
+
+    def stop_peak_tracking(self):
+        if self.measure_peak in tracer.op_hooks:
+            tracer.op_hooks.remove(self.measure_peak)
+        tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def measure_peak(self, name):
+        """记录代码块执行期间相对开始时的内存峰值增量"""
+        if not tracemalloc.is_tracing():
+            yield
+            return
+        start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            self.peaks[name] = max(0, peak - start)
+
+    def report(self):
+        """各类别字节数和各操作峰值的文本报告"""
+        lines = [f'{category}: {format_bytes(nbytes)}' for category, nbytes in self.totals().items()]
+        lines.append(f'total: {format_bytes(self.total())}')
+        lines.extend(f'peak {name}: {format_bytes(nbytes)}' for name, nbytes in sorted(self.peaks.items()))
+        return '\n'.join(lines)
+
+
+# 整个程序共用的统计
+accounting = MemoryAccounting()
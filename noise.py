@@ -0,0 +1,83 @@
+"""可复现的噪点引擎
+
+每个噪点对话框会话使用一个固定的种子。单位噪点场（float32）只生成一次，
+拖动强度滑块时只需缩放并叠加到图像上，结果写入预先分配的缓冲区；
+用同一个种子点击Apply得到的噪点与预览相同。
+"""
+import numpy as np
+from PIL import Image as PILImage
+
+NOISE_KINDS = ('Gaussian', 'Salt & Pepper', 'Speckle')
+
+# 高斯噪点的标准差：强度为1时等于25个灰度级
+GAUSSIAN_SCALE = 25.0
+
+
+def new_seed():
+    """为新的对话框会话生成种子"""
+    return int(np.random.SeedSequence().entropy)
+
+
+class NoiseField:
+    """固定尺寸和种子的噪点场"""
+
+    def __init__(self, size, seed):
+        self.size = size
+        self.seed = seed
+        width, height = size
+        self.shape = (height, width, 3)
+        self._normal = None  # 标准正态分布的单位噪点（Gaussian、Speckle）
+        self._uniform = None  # [0, 1) 均匀分布的单位噪点（Salt & Pepper）
+        self._work = None  # 计算用的 float32 缓冲区
+        self._result = None  # 输出用的 uint8 缓冲区
+
+    def _generator(self, stream):
+        # 不同类型的噪点使用各自独立的子序列，生成顺序不影响结果
+        return np.random.Generator(np.random.PCG64(np.random.SeedSequence(self.seed, spawn_key=(stream,))))
+
+    def normal(self):
+        if self._normal is None:
+            self._normal = self._generator(0).standard_normal(self.shape, dtype=np.float32)
+        return self._normal
+
+    def uniform(self):
+        if self._uniform is None:
+            self._uniform = self._generator(1).random(self.shape[:2], dtype=np.float32)
+        return self._uniform
+
+    def apply(self, image, kind='Gaussian', intensity=0.1):
+        """把噪点按强度叠加到与噪点场同尺寸的图像上，返回新的RGB图像"""
+        pixels = np.asarray(image.convert('RGB') if image.mode != 'RGB' else image)
+        if self._result is None:
+            self._result = np.empty(self.shape, dtype=np.uint8)
+        result = self.apply_pixels(pixels, kind, intensity, out=self._result)
+        # fromarray 对RGB数据会复制，缓冲区可以安全地在下一次调用中复用
+        return PILImage.fromarray(result, 'RGB')
+
+    def apply_pixels(self, pixels, kind='Gaussian', intensity=0.1, out=None):
+        """对RGB顺序的像素数组叠加噪点，结果写入 out（默认新建数组）"""
+        if pixels.shape != self.shape:
+            raise ValueError('image size does not match the noise field')
+        result = np.empty(self.shape, dtype=np.uint8) if out is None else out
+
+        if kind == 'Salt & Pepper':
+            uniform = self.uniform()
+            np.copyto(result, pixels)
+            # 同一个均匀噪点场：小于 p/2 为盐，大于 1 - p/2 为椒
+            result[uniform < intensity / 2] = 255
+            result[uniform >= 1 - intensity / 2] = 0
+        else:
+            if self._work is None:
+                self._work = np.empty(self.shape, dtype=np.float32)
+            work = self._work
+            if kind == 'Gaussian':
+                # pixels + sigma * n
+                np.multiply(self.normal(), np.float32(intensity * GAUSSIAN_SCALE), out=work)
+                work += pixels
+            else:  # Speckle: pixels * (1 + intensity * n)
+                np.multiply(self.normal(), np.float32(intensity), out=work)
+                work += 1
+                work *= pixels
+            np.clip(work, 0, 255, out=work)
+            np.copyto(result, work, casting='unsafe')
+        return result
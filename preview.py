@@ -0,0 +1,122 @@
+"""对话框实时预览引擎"""
+import threading
+
+from kivy.clock import Clock
+from PIL import Image as PILImage
+
+from tracing import span
+
+
+class PreviewProxy:
+    """预览代理图像
+
+    打开对话框时按预览控件的大小把原图缩小一次，之后滑块的每次更新都在
+    这张小图上计算；只有点击Apply时才在全分辨率原图上渲染。
+    """
+
+    def __init__(self, image, max_size):
+        self.source = image
+        width, height = image.size
+        max_width = max(1, int(max_size[0]))
+        max_height = max(1, int(max_size[1]))
+        # 缩放比例（代理尺寸 / 原图尺寸），原图已经足够小时不缩放
+        self.scale = min(1.0, max_width / width, max_height / height)
+        if self.scale < 1.0:
+            size = (max(1, round(width * self.scale)), max(1, round(height * self.scale)))
+            # reducing_gap 先用整数倍缩小再重采样，大图上比直接重采样快得多
+            self.image = image.resize(size, PILImage.Resampling.BILINEAR, reducing_gap=2.0)
+        else:
+            self.image = image
+
+    def scale_length(self, value):
+        """把全分辨率下的像素长度（如模糊半径）换算到代理图像上"""
+        return value * self.scale
+
+
+def center_crop(image, max_size):
+    """从图像中心裁剪出不超过 max_size 的区域（不缩放）
+
+    降噪等与像素尺度有关的效果在缩小的代理图像上看不准，用原分辨率的局部预览。
+    """
+    width, height = image.size
+    crop_width = max(1, min(width, int(max_size[0])))
+    crop_height = max(1, min(height, int(max_size[1])))
+    left = (width - crop_width) // 2
+    top = (height - crop_height) // 2
+    return image.crop((left, top, left + crop_width, top + crop_height))
+
+
+class PreviewScheduler:
+    """后台预览渲染调度器
+
+    渲染在工作线程中进行，主线程不会被拖动滑块产生的大量渲染阻塞。
+    新的参数到来时，尚未开始的渲染直接被替换，正在进行的渲染的结果
+    会被丢弃，只有最新一次的结果通过 Clock.schedule_once 回到主线程。
+    所有滑块对话框共用同一个调度器。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = None  # 等待渲染的任务 (render, on_done, generation)
+        self._generation = 0  # 每次提交递增，用于判断结果是否已过期
+        self._worker = None
+        self.rendered = 0  # 显示到预览上的渲染次数
+        self.coalesced = 0  # 被更新的请求合并或丢弃的渲染次数
+
+    def submit(self, render, on_done):
+        """提交渲染任务：render() 在工作线程中执行，on_done(result) 在主线程中调用"""
+        with self._lock:
+            self._generation += 1
+            if self._pending is not None:
+                self.coalesced += 1
+            self._pending = (render, on_done, self._generation)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+
+    def cancel(self):
+        """取消尚未显示的渲染（对话框关闭时调用）"""
+        with self._lock:
+            self._generation += 1
+            if self._pending is not None:
+                self.coalesced += 1
+                self._pending = None
+
+    def _is_current(self, generation):
+        with self._lock:
+            return generation == self._generation
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._pending is None:
+                    self._worker = None
+                    return
+                render, on_done, generation = self._pending
+                self._pending = None
+
+            try:
+                with span('preview.render', 'preview'):
+                    result = render()
+            except Exception as e:
+                print(f"Error rendering preview: {e}")
+                continue
+
+            # 渲染期间已有更新的请求，结果直接丢弃
+            if not self._is_current(generation):
+                with self._lock:
+                    self.coalesced += 1
+                continue
+
+            Clock.schedule_once(
+                lambda dt, g=generation, f=on_done, r=result: self._deliver(g, f, r))
+
+    def _deliver(self, generation, on_done, result):
+        # 结果回到主线程时可能已经过期
+        if not self._is_current(generation):
+            with self._lock:
+                self.coalesced += 1
+            return
+        self.rendered += 1
+        with span('preview.display', 'preview'):
+            on_done(result)
@@ -0,0 +1,118 @@
+"""选区：只在图像的一部分上计算和合成操作的结果，不依赖Kivy
+
+选区是一个矩形或手绘的多边形，记录外接矩形 bbox（图像坐标
+(left, top, right, bottom)）和与 bbox 同尺寸的蒙版（矩形选区不需要蒙版）。
+apply() 只在 bbox 外扩操作的核半径（halo）的范围内执行操作，再把结果中
+bbox 的部分按蒙版合成回原图，选区外的像素保持不变。
+"""
+import math
+
+from PIL import Image as PILImage, ImageDraw
+
+from document import ANY, ImageDocument
+from lazy import LazyModule
+
+np = LazyModule('numpy')
+
+
+def _clamp(value, low, high):
+    return max(low, min(value, high))
+
+
+class Selection:
+    """图像上的一个选区（不可变）"""
+
+    def __init__(self, image_size, outline, bbox, mask=None):
+        self.image_size = tuple(image_size)
+        self.outline = outline  # 图像坐标的轮廓点，用于在界面上显示
+        self.bbox = bbox
+        self.mask = mask  # bbox 大小的 bool 数组，None 表示整个矩形
+
+    @classmethod
+    def rectangle(cls, image_size, x0, y0, x1, y1):
+        """两个角点（图像坐标，可以超出图像范围）确定的矩形选区"""
+        width, height = image_size
+        left = _clamp(int(math.floor(min(x0, x1))), 0, width)
+        top = _clamp(int(math.floor(min(y0, y1))), 0, height)
+        right = _clamp(int(math.ceil(max(x0, x1))), 0, width)
+        bottom = _clamp(int(math.ceil(max(y0, y1))), 0, height)
+        if right <= left or bottom <= top:
+            raise ValueError('Empty selection')
+        outline = [(left, top), (right, top), (right, bottom), (left, bottom)]
+        return cls(image_size, outline, (left, top, right, bottom))
+
+    @classmethod
+    def freehand(cls, image_size, points):
+        """手绘轮廓（图像坐标的点列，首尾自动闭合）围成的选区"""
+        if len(points) < 3:
+            raise ValueError('Empty selection')
+        xs = [x for x, y in points]
+        ys = [y for x, y in points]
+        width, height = image_size
+        left = _clamp(int(math.floor(min(xs))), 0, width)
+        top = _clamp(int(math.floor(min(ys))), 0, height)
+        right = _clamp(int(math.ceil(max(xs))) + 1, 0, width)
+        bottom = _clamp(int(math.ceil(max(ys))) + 1, 0, height)
+        if right <= left or bottom <= top:
+            raise ValueError('Empty selection')
+        # 只在外接矩形大小的蒙版上绘制多边形
+        mask = PILImage.new('L', (right - left, bottom - top), 0)
+        ImageDraw.Draw(mask).polygon([(x - left, y - top) for x, y in points], fill=255)
+        mask = np.array(mask) > 0
+        if not mask.any():
+            raise ValueError('Empty selection')
+        return cls(image_size, list(points), (left, top, right, bottom), mask)
+
+    def padded_box(self, halo):
+        """外接矩形向外扩 halo 像素（限制在图像范围内）"""
+        width, height = self.image_size
+        left, top, right, bottom = self.bbox
+        return (max(0, left - halo), max(0, top - halo),
+                min(width, right + halo), min(height, bottom + halo))
+
+    def apply(self, image, func, halo):
+        """对选区执行 func(document) 并合成回原图，返回新的图像文档
+
+        halo 为 None 时对整幅图像执行 func。func 返回 None（例如被取消）时
+        返回 None。
+        """
+        document = ImageDocument.wrap(image)
+        if document.size != self.image_size:
+            raise ValueError('Selection does not match the image size')
+        left, top, right, bottom = self.bbox
+        if halo is None:
+            box = (0, 0) + self.image_size
+            region = document
+        else:
+            box = self.padded_box(halo)
+            region = ImageDocument(document.pixels[box[1]:box[3], box[0]:box[2]], document.order)
+        result = func(region)
+        if result is None:
+            return None
+        result = ImageDocument.wrap(result)
+        base, source, order, channels = _composite_inputs(document, result)
+        pixels = base.copy() if base is document.pixels else base
+        target = pixels[top:bottom, left:right, channels] if pixels.ndim == 3 else \
+            pixels[top:bottom, left:right]
+        source = source[top - box[1]:bottom - box[1], left - box[0]:right - box[0]]
+        if self.mask is None:
+            target[...] = source
+        else:
+            mask = self.mask[:, :, None] if target.ndim == 3 else self.mask
+            np.copyto(target, source, where=mask)
+        return ImageDocument(pixels, order)
+
+
+def _composite_inputs(document, result):
+    """合成用的 (底图像素, 结果像素, 合成后的通道顺序, 写入的通道)
+
+    灰度图上的操作产生彩色结果（如棕褐色）时底图先转成彩色；带Alpha的图像
+    在结果没有Alpha时只合成颜色通道，Alpha保持不变。
+    """
+    order = document.order
+    if order == 'L' and result.order != 'L':
+        order = result.resolve(ANY)
+        return document.pixels_in(order), result.pixels_in(order), order, slice(None)
+    if order in ('RGBA', 'BGRA') and result.order not in ('RGBA', 'BGRA'):
+        return document.pixels, result.pixels_in(order[:3]), order, slice(0, 3)
+    return document.pixels, result.pixels_in(order), order, slice(None)
@@ -0,0 +1,129 @@
+"""分块（tile）处理超大图像
+
+邻域运算（模糊、双边滤波、降噪等）按块处理，每块向外多读取等于核半径的
+边缘（halo），因此结果与整幅处理完全一致。源图直接按块读取（通道顺序的
+转换也在块上进行，不生成整幅的转换副本）；超大图像的结果写入 np.memmap
+临时文件，除了已经在内存中的源图以外，计算时只需要几个块的内存，与图像
+尺寸无关。各块可以在多个线程中并行处理（OpenCV在计算时会释放GIL）。
+"""
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# 默认的块大小（像素）
+DEFAULT_TILE_SIZE = 1024
+
+# scratch_array() 共用的临时目录（第一次用到时创建）
+_scratch = None
+_scratch_lock = threading.Lock()
+
+
+class ScratchSpace:
+    """存放 memmap 临时文件的目录，退出时删除"""
+
+    def __init__(self, directory=None):
+        self.path = tempfile.mkdtemp(prefix='image_editor_tiles_', dir=directory)
+        self._count = 0
+
+    def array(self, shape, dtype=np.uint8, temporary=False):
+        """创建一个由临时文件支持的数组
+
+        temporary 为True时数组（以及引用它的视图）都不再被引用后删除临时文件。
+        """
+        self._count += 1
+        filename = os.path.join(self.path, f'{self._count}.dat')
+        array = np.memmap(filename, dtype=dtype, mode='w+', shape=shape)
+        if temporary:
+            # 映射在 mmap 对象释放时解除，之后才能删除文件
+            weakref.finalize(array._mmap, _remove, filename)
+        return array
+
+    def close(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _remove(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+def tile_boxes(height, width, tile_size=DEFAULT_TILE_SIZE):
+    """把图像划分成块，返回 (top, left, bottom, right) 列表"""
+    return [(top, left, min(top + tile_size, height), min(left + tile_size, width))
+            for top in range(0, height, tile_size)
+            for left in range(0, width, tile_size)]
+
+
+def map_tiles(src, dst, func, halo, tile_size=DEFAULT_TILE_SIZE, workers=None,
+              progress=None, cancelled=None):
+    """对 src 分块执行 func，结果写入 dst
+
+    func 接收带 halo 边缘的块并返回同样大小的结果。在图像边界处不向外扩展，
+    由 func 自己的边界处理（与整幅处理时相同）负责。
+    progress(done, total) 在每块完成后调用；cancelled() 返回True时停止处理
+    剩余的块并返回False。
+    """
+    height, width = src.shape[:2]
+    boxes = tile_boxes(height, width, tile_size)
+
+    def run(box):
+        if cancelled is not None and cancelled():
+            return False
+        top, left, bottom, right = box
+        y0, x0 = max(0, top - halo), max(0, left - halo)
+        y1, x1 = min(height, bottom + halo), min(width, right + halo)
+        result = func(np.ascontiguousarray(src[y0:y1, x0:x1]))
+        dst[top:bottom, left:right] = result[top - y0:bottom - y0, left - x0:right - x0]
+        return True
+
+    workers = workers or os.cpu_count() or 1
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for finished in pool.map(run, boxes):
+            if not finished:
+                return False
+            done += 1
+            if progress is not None:
+                progress(done, len(boxes))
+    return True
+
+
+def scratch_array(shape, dtype=np.uint8):
+    """由临时文件支持的数组（np.memmap），不再被引用时删除临时文件
+
+    所有这样的数组共用一个临时目录，程序退出时删除。
+    """
+    global _scratch
+    with _scratch_lock:
+        if _scratch is None:
+            _scratch = ScratchSpace()
+            atexit.register(_scratch.close)
+        return _scratch.array(shape, dtype, temporary=True)
+
+
+def process_array(src, func, halo, tile_size=DEFAULT_TILE_SIZE, workers=None,
+                  progress=None, cancelled=None, shape=None, spill=False):
+    """对像素数组分块执行 func，返回新的数组；被取消时返回 None
+
+    shape 为结果的形状（默认与 src 相同）。spill 为True时结果写入
+    scratch_array() 的临时文件，由操作系统按需换入换出，不占用整幅的内存。
+    """
+    shape = src.shape if shape is None else shape
+    dst = scratch_array(shape) if spill else np.empty(shape, dtype=src.dtype)
+    if not map_tiles(src, dst, func, halo, tile_size, workers, progress, cancelled):
+        return None
+    return dst
@@ -0,0 +1,159 @@
+"""轻量的耗时追踪（span），不依赖Kivy
+
+每个操作用一个顶层 span 包住，内部的各个阶段（转换、计算、保存历史、
+显示等）是它的子 span。span 保存在固定容量的环形缓冲区中，可以导出为
+JSON lines 或 Chrome trace 格式（在 chrome://tracing 或 Perfetto 中打开）。
+"""
+import contextlib
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# 环形缓冲区保存的 span 数
+DEFAULT_CAPACITY = 4096
+
+
+class Tracer:
+    """收集 span 的环形缓冲区，可以在多个线程中使用"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.enabled = True
+        self._spans = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._local = threading.local()  # 每个线程当前打开的 span id 栈
+        self._origin = time.perf_counter()
+        # 每个操作（'op' 类别的 traced 函数）外层额外进入的上下文管理器工厂，
+        # 以操作名称调用，例如内存峰值统计
+        self.op_hooks = []
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def span(self, name, category='phase', **args):
+        """记录一段代码的耗时：with tracer.span('compute'): ..."""
+        return _Span(self, name, category, args)
+
+    def traced(self, name, category='op'):
+        """把整个函数记为一个 span 的装饰器"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with contextlib.ExitStack() as stack:
+                    if category == 'op':
+                        for hook in list(self.op_hooks):
+                            stack.enter_context(hook(name))
+                    with self.span(name, category):
+                        return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _record(self, record):
+        with self._lock:
+            self._spans.append(record)
+
+    def spans(self):
+        """缓冲区中所有 span 的副本（按结束时间排序）"""
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+    def last_breakdown(self, category='op'):
+        """最近完成的一个顶层操作及其各阶段：(span, [子span])，没有时返回 None"""
+        spans = self.spans()
+        for record in reversed(spans):
+            if record['cat'] == category and record['parent'] is None:
+                children = [s for s in spans if s['parent'] == record['id']]
+                return record, sorted(children, key=lambda s: s['start'])
+        return None
+
+    def last(self, name):
+        """最近完成的一个名为 name 的 span，没有时返回 None"""
+        for record in reversed(self.spans()):
+            if record['name'] == name:
+                return record
+        return None
+
+    def rate(self, name, window=1.0):
+        """最近 window 秒内名为 name 的 span 每秒完成的次数"""
+        now = time.perf_counter() - self._origin
+        count = sum(1 for s in self.spans()
+                    if s['name'] == name and s['start'] + s['duration'] >= now - window)
+        return count / window
+
+    def mean_duration(self, name, count=10):
+        """最近 count 个名为 name 的 span 的平均耗时（秒）"""
+        durations = [s['duration'] for s in self.spans() if s['name'] == name][-count:]
+        return sum(durations) / len(durations) if durations else 0.0
+
+    def export_jsonl(self, path):
+        """每行一个 span 的JSON"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for record in self.spans():
+                f.write(json.dumps(record) + '\n')
+
+    def export_chrome(self, path):
+        """Chrome trace 格式（完整事件 ph='X'，时间单位为微秒）"""
+        pid = os.getpid()
+        events = [{'name': s['name'], 'cat': s['cat'], 'ph': 'X',
+                   'ts': s['start'] * 1e6, 'dur': s['duration'] * 1e6,
+                   'pid': pid, 'tid': s['thread'], 'args': s['args']}
+                  for s in self.spans()]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def export(self, path):
+        """按扩展名导出：.jsonl 为 JSON lines，其他为 Chrome trace"""
+        if path.endswith('.jsonl'):
+            self.export_jsonl(path)
+        else:
+            self.export_chrome(path)
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'category', 'args', 'id', 'parent', 'start')
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        if not self.tracer.enabled:
+            self.id = None
+            return self
+        stack = self.tracer._stack()
+        self.id = next(self.tracer._ids)
+        self.parent = stack[-1] if stack else None
+        stack.append(self.id)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.id is None:
+            return False
+        end = time.perf_counter()
+        self.tracer._stack().pop()
+        self.tracer._record({
+            'id': self.id, 'parent': self.parent, 'name': self.name, 'cat': self.category,
+            'start': self.start - self.tracer._origin, 'duration': end - self.start,
+            'thread': threading.get_ident(), 'args': self.args,
+        })
+        return False
+
+
+# 整个程序共用的追踪器
+tracer = Tracer()
+span = tracer.span
+traced = tracer.traced